@@ -19,7 +19,9 @@
 # pyright: reportAttributeAccessIssue=false
 
 import bpy
+import bonsai.tool as tool
 from . import ui, prop, operator
+from .data import ProfileStore
 
 
 classes = (
@@ -135,6 +137,8 @@ classes = (
     operator.AddSnapshotCamera,
     operator.AlignSnapshotCameraToView,
     operator.SnapshotWithProfilesFixed,
+    operator.ScrubSnapshotDate,
+    operator.ExportSnapshotSeries,
 
     operator.VisualiseWorkScheduleDateRange,
     operator.Align4DCameraToView,
@@ -302,26 +306,21 @@ def register():
     bpy.types.TextCurve.BIMDateTextProperties = bpy.props.PointerProperty(type=prop.BIMDateTextProperties)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    tool.Sequence.register_attribute_animation_load_handler()
+    ProfileStore.register_handlers()
 
 # --- Seed DEFAULT Appearance Profile group if none exists, and select it ---
 try:
-    import json
     scn = bpy.context.scene
-    key = "BIM_AppearanceProfileSets"
-    raw = scn.get(key, "{}")
-    data = {}
-    try:
-        data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-    except Exception:
-        data = {}
-    if not isinstance(data, dict) or not data:
+    data = ProfileStore.load(scn)
+    if not data:
         default_names = [
             "ATTENDANCE", "CONSTRUCTION", "DEMOLITION", "DISMANTLE",
             "DISPOSAL", "INSTALLATION", "LOGISTIC", "MAINTENANCE",
             "MOVE", "OPERATION", "REMOVAL", "RENOVATION",
         ]
         data = {"DEFAULT": {"profiles": [{"name": n} for n in default_names]}}
-        scn[key] = json.dumps(data)
+        ProfileStore.write(data, scn)
     # try to select DEFAULT in the UI
     try:
         scn.BIMAnimationProperties.profile_groups = "DEFAULT"
@@ -378,3 +377,5 @@ def unregister():
         del bpy.types.TextCurve.BIMDateTextProperties
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    tool.Sequence.unregister_attribute_animation_handlers()
+    ProfileStore.unregister_handlers()
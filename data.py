@@ -16,14 +16,25 @@
 # You should have received a copy of the GNU General Public License
 # along with Bonsai.  If not, see <http://www.gnu.org/licenses/>.
 
+from __future__ import annotations
+
 import bpy
 import bonsai.tool as tool
+from bpy.app.handlers import persistent
 import ifcopenshell
 import ifcopenshell.util.attribute
 import ifcopenshell.util.date
+import ifcopenshell.util.sequence
 from ifcopenshell.util.doc import get_predefined_type_doc
+from bonsai.bim.module.sequence import frames as _seq_frames
+from bonsai.bim.module.sequence.helper import parse_datetime
 import json
-from typing import Any
+import re
+import numpy as np
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime
+from typing import Any, Iterator, NamedTuple, Optional
 
 
 def refresh():
@@ -32,6 +43,13 @@ def refresh():
     TaskICOMData.is_loaded = False
     WorkScheduleData.is_loaded = False
     AnimationColorSchemeData.is_loaded = False
+    DerivedDateIndex.invalidate()
+    TaskFrameIndex.invalidate()
+    ScheduleGraphIndex.invalidate()
+    ScheduleStateIndex.invalidate()
+    TaskSortKeyIndex.invalidate()
+    TaskCalendarIndex.invalidate()
+    ProfileStore.sync()
 
 
 class SequenceData:
@@ -243,6 +261,8 @@ class SequenceData:
             for rel in task.Nests or []:
                 data["NestingIndex"] = rel.RelatedObjects.index(task)
             cls.data["tasks"][task.id()] = data
+        TaskSearchIndex.update(cls.data["tasks"])
+
     @classmethod
     def schedule_predefined_types_enum(cls) -> list[tuple[str, str, str]]:
         results: list[tuple[str, str, str]] = []
@@ -482,6 +502,1265 @@ class AnimationColorSchemeData:
         return results
 
 
+class DerivedDateIndex:
+    """Fechas derivadas (inicio más temprano / fin más tardío) de todas las tareas.
+
+    Equivale a llamar ``ifcopenshell.util.sequence.derive_date`` con
+    ``ScheduleStart``/``is_earliest`` y ``ScheduleFinish``/``is_latest`` por tarea,
+    pero se calcula en un único recorrido post-orden del cronograma: cada tarea
+    usa su propio TaskTime y, si falta, el extremo de las fechas propias de sus
+    descendientes, ya acumulado al procesar las subtareas.
+    Se cachea por cronograma y se invalida al editar tiempos de tarea (y en cada
+    ``refresh()`` de los datos del módulo).
+    """
+
+    data: dict[int, dict[int, tuple[Any, Any]]] = {}
+    task_schedule: dict[int, int] = {}
+    ifc_file = None
+
+    @classmethod
+    def invalidate(cls, work_schedule_id: Optional[int] = None) -> None:
+        if work_schedule_id is None:
+            cls.data = {}
+            cls.task_schedule = {}
+            return
+        cls.data.pop(work_schedule_id, None)
+        cls.task_schedule = {t: ws for t, ws in cls.task_schedule.items() if ws != work_schedule_id}
+
+    @classmethod
+    def load(cls, work_schedule: ifcopenshell.entity_instance) -> dict[int, tuple[Any, Any]]:
+        ifc_file = tool.Ifc.get()
+        if ifc_file is not cls.ifc_file:
+            cls.invalidate()
+            cls.ifc_file = ifc_file
+        ws_id = work_schedule.id()
+        dates = cls.data.get(ws_id)
+        if dates is None:
+            dates = cls.derive_dates(ifcopenshell.util.sequence.get_root_tasks(work_schedule))
+            cls.data[ws_id] = dates
+            for task_id in dates:
+                cls.task_schedule[task_id] = ws_id
+        return dates
+
+    @classmethod
+    def get(cls, task: ifcopenshell.entity_instance) -> tuple[Any, Any]:
+        """Devuelve (derived_start, derived_finish) de la tarea; None si no hay fecha."""
+        if tool.Ifc.get() is not cls.ifc_file:
+            cls.invalidate()
+        task_id = task.id()
+        ws_id = cls.task_schedule.get(task_id)
+        if ws_id is not None and ws_id in cls.data:
+            return cls.data[ws_id][task_id]
+        work_schedule = ifcopenshell.util.sequence.get_task_work_schedule(task)
+        if work_schedule:
+            dates = cls.load(work_schedule)
+            if task_id in dates:
+                return dates[task_id]
+        # Tarea fuera de cualquier cronograma indexado: solo su subárbol
+        return cls.derive_dates([task])[task_id]
+
+    @staticmethod
+    def derive_dates(root_tasks) -> dict[int, tuple[Any, Any]]:
+        """Recorrido post-orden iterativo; evita recursión en WBS profundas."""
+        dates: dict[int, tuple[Any, Any]] = {}
+        # Mín./máx. de las fechas propias del subárbol (incluida la tarea); solo para propagar al padre
+        subtree: dict[int, tuple[Any, Any]] = {}
+        stack = [(task, None) for task in reversed(list(root_tasks))]
+        while stack:
+            task, subtasks = stack.pop()
+            task_id = task.id()
+            if subtasks is None:
+                if task_id in dates:
+                    continue
+                subtasks = ifcopenshell.util.sequence.get_nested_tasks(task)
+                stack.append((task, subtasks))
+                stack.extend((subtask, None) for subtask in reversed(subtasks) if subtask.id() not in dates)
+                continue
+            own_start = own_finish = None
+            task_time = task.TaskTime
+            if task_time:
+                if task_time.ScheduleStart:
+                    own_start = ifcopenshell.util.date.ifc2datetime(task_time.ScheduleStart)
+                if task_time.ScheduleFinish:
+                    own_finish = ifcopenshell.util.date.ifc2datetime(task_time.ScheduleFinish)
+            start = finish = None
+            for subtask in subtasks:
+                sub_start, sub_finish = subtree.get(subtask.id(), (None, None))
+                if sub_start and (not start or sub_start < start):
+                    start = sub_start
+                if sub_finish and (not finish or sub_finish > finish):
+                    finish = sub_finish
+            dates[task_id] = (own_start or start, own_finish or finish)
+            subtree[task_id] = (
+                min(own_start, start) if own_start and start else own_start or start,
+                max(own_finish, finish) if own_finish and finish else own_finish or finish,
+            )
+        return dates
+
+
+class TaskCalendarIndex:
+    """Calendarios de tarea resueltos una vez y días laborables memoizados.
+
+    ``derive_calendar`` sube por la jerarquía hasta la primera tarea con
+    calendario propio; aquí cada cadena de ancestros se resuelve una sola vez y
+    el resultado se reutiliza para todos sus descendientes. ``count_working_days``
+    se memoiza por (inicio, fin, calendario). Se descarta en ``refresh()`` o al
+    cambiar de archivo IFC.
+    """
+
+    own: dict[int, Optional[ifcopenshell.entity_instance]] = {}
+    derived: dict[int, Optional[ifcopenshell.entity_instance]] = {}
+    working_days: dict[tuple[Any, Any, int], int] = {}
+    ifc_file = None
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.own = {}
+        cls.derived = {}
+        cls.working_days = {}
+
+    @classmethod
+    def check_file(cls) -> None:
+        ifc_file = tool.Ifc.get()
+        if ifc_file is not cls.ifc_file:
+            cls.invalidate()
+            cls.ifc_file = ifc_file
+
+    @classmethod
+    def get_calendar(cls, task: ifcopenshell.entity_instance) -> Optional[ifcopenshell.entity_instance]:
+        """Calendario asignado directamente a la tarea."""
+        task_id = task.id()
+        if task_id not in cls.own:
+            cls.own[task_id] = ifcopenshell.util.sequence.get_calendar(task)
+        return cls.own[task_id]
+
+    @classmethod
+    def derive_calendar(cls, task: ifcopenshell.entity_instance) -> Optional[ifcopenshell.entity_instance]:
+        """Calendario propio o heredado del ancestro más cercano que lo tenga."""
+        chain = []
+        calendar = None
+        while task is not None:
+            task_id = task.id()
+            if task_id in cls.derived:
+                calendar = cls.derived[task_id]
+                break
+            chain.append(task_id)
+            calendar = cls.get_calendar(task)
+            if calendar:
+                break
+            parent = next(
+                (rel.RelatingObject for rel in task.Nests or [] if rel.RelatingObject.is_a("IfcTask")), None
+            )
+            if parent is None:
+                # Raíz sin calendario propio: delegar en ifcopenshell
+                calendar = ifcopenshell.util.sequence.derive_calendar(task)
+            task = parent
+        for task_id in chain:
+            cls.derived[task_id] = calendar
+        return calendar
+
+    @classmethod
+    def count_working_days(cls, start, finish, calendar: Optional[ifcopenshell.entity_instance]) -> int:
+        key = (start, finish, calendar.id() if calendar else 0)
+        if key not in cls.working_days:
+            cls.working_days[key] = ifcopenshell.util.sequence.count_working_days(start, finish, calendar)
+        return cls.working_days[key]
+
+
+class TaskFrameIndex:
+    """Frames (inicio, fin) de todas las tareas de un cronograma para unos settings.
+
+    Se calcula con una única expresión NumPy sobre las fechas de DerivedDateIndex
+    y se descarta cuando esas fechas se recalculan o cambian los settings.
+    """
+
+    data: dict[int, tuple[Any, tuple, dict[int, tuple[int, int]]]] = {}
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.data = {}
+
+    @classmethod
+    def load(cls, work_schedule_id: int, settings: dict[str, Any]) -> dict[int, tuple[int, int]]:
+        dates = DerivedDateIndex.data.get(work_schedule_id, {})
+        key = (settings["start"], settings["finish"], int(settings["start_frame"]), int(settings["total_frames"]))
+        cached = cls.data.get(work_schedule_id)
+        if cached and cached[0] is dates and cached[1] == key:
+            return cached[2]
+        frames = cls.compute(dates, settings)
+        cls.data[work_schedule_id] = (dates, key, frames)
+        return frames
+
+    @staticmethod
+    def compute(dates: dict[int, tuple[Any, Any]], settings: dict[str, Any]) -> dict[int, tuple[int, int]]:
+        task_ids = list(dates.keys())
+        starts = _seq_frames.to_epoch_seconds(start for start, _ in dates.values())
+        finishes = _seq_frames.to_epoch_seconds(finish for _, finish in dates.values())
+        start_frame = int(settings["start_frame"])
+        start_frames, finish_frames, valid = _seq_frames.frames_from_settings(starts, finishes, settings, clamp=True)
+        viz_start, viz_finish = _seq_frames.to_epoch_seconds((settings["start"], settings["finish"]))
+        # Terminadas antes del período: (start_frame, start_frame); empiezan después: sin frames
+        finished_before = finishes < viz_start
+        valid &= ~(starts > viz_finish) | finished_before
+        start_frames = np.where(finished_before, start_frame, np.minimum(start_frames, finish_frames))
+        finish_frames = np.where(finished_before, start_frame, finish_frames)
+        return {
+            task_id: (sf, ff)
+            for task_id, sf, ff, ok in zip(task_ids, start_frames.tolist(), finish_frames.tolist(), valid.tolist())
+            if ok
+        }
+
+
+class ScheduleGraphIndex:
+    """Adyacencias producto↔tarea y tarea→subtareas en arrays dispersos tipo CSR.
+
+    Se construye en un solo barrido de IfcRelAssignsToProduct (tarea→outputs),
+    IfcRelAssignsToProcess (tarea→inputs) e IfcRelNests (tarea→subtareas), y de
+    ahí se derivan las relaciones inversas producto→tareas. Cada relación se
+    guarda como (keys, offsets, values): los vecinos de ``keys[i]`` son
+    ``values[offsets[i]:offsets[i + 1]]``. Se reconstruye de forma perezosa tras
+    ``refresh()``, al cambiar de archivo IFC o al editar asignaciones.
+    """
+
+    data: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    is_loaded = False
+    ifc_file = None
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.data = {}
+        cls.is_loaded = False
+
+    @classmethod
+    def load(cls) -> None:
+        ifc_file = tool.Ifc.get()
+        edges: dict[str, tuple[list[int], list[int]]] = {
+            "task_outputs": ([], []),
+            "task_inputs": ([], []),
+            "task_children": ([], []),
+        }
+        task_outputs, task_inputs, task_children = edges.values()
+        for rel in ifc_file.by_type("IfcRelAssignsToProduct"):
+            product_id = rel.RelatingProduct.id()
+            for related_object in rel.RelatedObjects:
+                if related_object.is_a("IfcTask"):
+                    task_outputs[0].append(related_object.id())
+                    task_outputs[1].append(product_id)
+        for rel in ifc_file.by_type("IfcRelAssignsToProcess"):
+            if not rel.RelatingProcess.is_a("IfcTask"):
+                continue
+            task_id = rel.RelatingProcess.id()
+            # Solo productos: recursos y controles asignados no son inputs
+            for related_object in rel.RelatedObjects:
+                if related_object.is_a("IfcProduct"):
+                    task_inputs[0].append(task_id)
+                    task_inputs[1].append(related_object.id())
+        for rel in ifc_file.by_type("IfcRelNests"):
+            if not rel.RelatingObject.is_a("IfcTask"):
+                continue
+            task_id = rel.RelatingObject.id()
+            for related_object in rel.RelatedObjects:
+                if related_object.is_a("IfcTask"):
+                    task_children[0].append(task_id)
+                    task_children[1].append(related_object.id())
+
+        cls.data = {name: cls.to_csr(src, dst) for name, (src, dst) in edges.items()}
+        cls.data["product_output_tasks"] = cls.to_csr(task_outputs[1], task_outputs[0])
+        cls.data["product_input_tasks"] = cls.to_csr(task_inputs[1], task_inputs[0])
+        cls.ifc_file = ifc_file
+        cls.is_loaded = True
+
+    @staticmethod
+    def to_csr(src: list[int], dst: list[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        src_ids = np.asarray(src, dtype=np.int64)
+        dst_ids = np.asarray(dst, dtype=np.int64)
+        order = np.argsort(src_ids, kind="stable")
+        keys, starts = np.unique(src_ids[order], return_index=True)
+        offsets = np.append(starts, len(src_ids)).astype(np.int64)
+        return keys, offsets, dst_ids[order]
+
+    @classmethod
+    def neighbours(cls, relation: str, entity_id: int) -> np.ndarray:
+        if not cls.is_loaded or tool.Ifc.get() is not cls.ifc_file:
+            cls.load()
+        keys, offsets, values = cls.data[relation]
+        i = int(np.searchsorted(keys, entity_id))
+        if i < len(keys) and keys[i] == entity_id:
+            return values[offsets[i] : offsets[i + 1]]
+        return values[:0]
+
+    @classmethod
+    def first_neighbours(cls, relation: str, entity_ids: np.ndarray) -> np.ndarray:
+        """Primer vecino de cada entidad (0 si no tiene), vectorizado sobre el CSR."""
+        if not cls.is_loaded or tool.Ifc.get() is not cls.ifc_file:
+            cls.load()
+        keys, offsets, values = cls.data[relation]
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        result = np.zeros(len(entity_ids), dtype=np.int64)
+        if not len(keys):
+            return result
+        pos = np.minimum(np.searchsorted(keys, entity_ids), len(keys) - 1)
+        found = keys[pos] == entity_ids
+        result[found] = values[offsets[pos[found]]]
+        return result
+
+    @classmethod
+    def neighbours_of(cls, relation: str, entity_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Vecinos de varias entidades a la vez: (vecinos, índice de la entidad de cada vecino)."""
+        if not cls.is_loaded or tool.Ifc.get() is not cls.ifc_file:
+            cls.load()
+        keys, offsets, values = cls.data[relation]
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if not len(keys) or not len(entity_ids):
+            return values[:0], np.empty(0, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(keys, entity_ids), len(keys) - 1)
+        found = keys[pos] == entity_ids
+        starts = np.where(found, offsets[pos], 0)
+        counts = np.where(found, offsets[pos + 1] - offsets[pos], 0)
+        owners = np.repeat(np.arange(len(entity_ids)), counts)
+        flat = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return values[flat], owners
+
+    @classmethod
+    def descendants(cls, task_id: int) -> list[int]:
+        """Subtareas de todos los niveles, en pre-orden."""
+        results = []
+        stack = list(reversed(cls.neighbours("task_children", task_id).tolist()))
+        while stack:
+            child_id = stack.pop()
+            results.append(child_id)
+            stack.extend(reversed(cls.neighbours("task_children", child_id).tolist()))
+        return results
+
+    @classmethod
+    def task_products(cls, relation: str, task_id: int, is_deep: bool = False) -> list[int]:
+        """IDs de outputs (``task_outputs``) o inputs (``task_inputs``) de una tarea."""
+        if not is_deep:
+            return cls.neighbours(relation, task_id).tolist()
+        ids = np.concatenate([cls.neighbours(relation, t) for t in [task_id] + cls.descendants(task_id)])
+        _, first = np.unique(ids, return_index=True)
+        return ids[np.sort(first)].tolist()
+
+    @classmethod
+    def entities(cls, ids: list[int]) -> list[ifcopenshell.entity_instance]:
+        ifc_file = tool.Ifc.get()
+        return [ifc_file.by_id(i) for i in ids]
+
+
+class TaskFilterRule(NamedTuple):
+    """Regla de filtro compilada: columna resuelta y valor de la regla ya convertido."""
+
+    column: str
+    data_type: str
+    operator: str
+    value: Any
+
+
+class TaskFilterEngine:
+    """Reglas de filtro activas compiladas en un vector de predicados.
+
+    ``filter_roots`` recorre una vez el bosque de tareas bajo las raíces (por
+    niveles, sobre ``ScheduleGraphIndex``), extrae los valores de cada columna
+    usada para todas las tareas en un solo paso, evalúa cada regla como una
+    máscara numpy y conserva una tarea si ella o algún descendiente cumple, con
+    un único barrido desde las hojas (``keep_with_descendants``).
+    """
+
+    def __init__(self, rules: list[TaskFilterRule], logic_is_and: bool = True):
+        self.rules = rules
+        self.logic_is_and = logic_is_and
+
+    @classmethod
+    def from_props(cls, filters) -> Optional[TaskFilterEngine]:
+        """Motor con las reglas activas de ``filters`` (None si no hay ninguna)."""
+        rules = [cls.compile_rule(rule) for rule in filters.rules if rule.is_active]
+        if not rules:
+            return None
+        return cls(rules, getattr(filters, "logic", "AND") == "AND")
+
+    @staticmethod
+    def compile_rule(rule) -> TaskFilterRule:
+        data_type = getattr(rule, "data_type", "string")
+        if data_type == "integer":
+            value = rule.value_integer
+        elif data_type in ("float", "real"):
+            value = rule.value_float
+        elif data_type == "boolean":
+            value = bool(rule.value_boolean)
+        elif data_type == "date":
+            # La fecha de la regla se interpreta una sola vez
+            rule_date = _seq_frames._to_naive_datetime(parse_datetime(rule.value_string))
+            value = int(_seq_frames.to_epoch_seconds([rule_date])[0])
+        else:
+            value = (rule.value_string or "").lower()
+        return TaskFilterRule((rule.column or "").split("||")[0], data_type, rule.operator, value)
+
+    def filter_roots(self, root_tasks: list[ifcopenshell.entity_instance]) -> list[ifcopenshell.entity_instance]:
+        if not root_tasks:
+            return root_tasks
+        ifc_file = tool.Ifc.get()
+        ids = np.array([task.id() for task in root_tasks], dtype=np.int64)
+        parents = np.full(len(ids), -1, dtype=np.int64)
+        depths = np.zeros(len(ids), dtype=np.int32)
+        frontier = np.arange(len(ids))
+        all_ids, all_parents, all_depths = [ids], [parents], [depths]
+        depth = 0
+        while len(frontier):
+            depth += 1
+            children, owners = ScheduleGraphIndex.neighbours_of("task_children", all_ids[-1])
+            all_parents.append(frontier[owners])
+            all_ids.append(children)
+            all_depths.append(np.full(len(children), depth, dtype=np.int32))
+            frontier = np.arange(len(children)) + sum(len(a) for a in all_ids[:-1])
+        ids = np.concatenate(all_ids)
+        tasks = root_tasks + [ifc_file.by_id(i) for i in ids[len(root_tasks) :].tolist()]
+        keep = _seq_frames.keep_with_descendants(
+            self.matches(tasks, ids), np.concatenate(all_parents), np.concatenate(all_depths)
+        )
+        return [task for task, ok in zip(root_tasks, keep[: len(root_tasks)].tolist()) if ok]
+
+    def matches(self, tasks: list[ifcopenshell.entity_instance], ids: np.ndarray) -> np.ndarray:
+        raw: dict[str, list] = {}
+        typed: dict[tuple[str, str], tuple[np.ndarray, np.ndarray]] = {}
+        result = None
+        for rule in self.rules:
+            if rule.column not in raw:
+                raw[rule.column] = self.column_values(tasks, ids, rule.column)
+            values = raw[rule.column]
+            if rule.operator in ("EMPTY", "NOT_EMPTY"):
+                empty = np.fromiter((v is None or str(v).strip() == "" for v in values), dtype=bool, count=len(values))
+                mask = empty if rule.operator == "EMPTY" else ~empty
+            else:
+                key = (rule.column, rule.data_type)
+                if key not in typed:
+                    typed[key] = self.typed_values(values, rule.data_type)
+                mask = self.rule_mask(rule, *typed[key])
+            if result is None:
+                result = mask
+            else:
+                result = (result & mask) if self.logic_is_and else (result | mask)
+        return result
+
+    @staticmethod
+    def column_values(tasks: list[ifcopenshell.entity_instance], ids: np.ndarray, column: str) -> list:
+        if column == "Special.OutputsCount":
+            # Número de outputs a partir del índice de adyacencias del cronograma
+            _, owners = ScheduleGraphIndex.neighbours_of("task_outputs", ids)
+            return np.bincount(owners, minlength=len(ids)).tolist()
+        try:
+            ifc_class, attr_name = column.split(".", 1)
+        except ValueError:
+            return [None] * len(tasks)
+        if ifc_class == "IfcTask":
+            return [getattr(task, attr_name, None) for task in tasks]
+        elif ifc_class == "IfcTaskTime":
+            return [getattr(task.TaskTime, attr_name, None) if task.TaskTime else None for task in tasks]
+        return [None] * len(tasks)
+
+    @staticmethod
+    def typed_values(values: list, data_type: str) -> tuple[np.ndarray, np.ndarray]:
+        """(valores convertidos, máscara de conversión válida) para un tipo de columna."""
+        if data_type in ("integer", "float", "real"):
+            convert = int if data_type == "integer" else float
+            numbers = np.zeros(len(values), dtype=np.float64)
+            valid = np.zeros(len(values), dtype=bool)
+            for i, value in enumerate(values):
+                try:
+                    numbers[i] = convert(value)
+                    valid[i] = True
+                except (ValueError, TypeError, AttributeError):
+                    pass
+            return numbers, valid
+        if data_type == "boolean":
+            return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values)), np.ones(len(values), dtype=bool)
+        if data_type == "date":
+            # Cada texto de fecha distinto se interpreta una sola vez
+            texts = [str(v) for v in values]
+            unique_texts = list(set(texts))
+            parsed: list[Optional[datetime]] = []
+            for text in unique_texts:
+                try:
+                    parsed.append(datetime.fromisoformat(text))
+                except ValueError:
+                    parsed.append(parse_datetime(text))
+            lookup = dict(zip(unique_texts, _seq_frames.to_epoch_seconds(parsed).tolist()))
+            seconds = np.array([lookup[text] for text in texts], dtype=np.int64)
+            return seconds, seconds != _seq_frames.NAT
+        strings = np.array([str(v).lower() if v is not None else "" for v in values], dtype=str)
+        return strings, np.ones(len(values), dtype=bool)
+
+    @staticmethod
+    def rule_mask(rule: TaskFilterRule, values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        op = rule.operator
+        if rule.data_type in ("integer", "float", "real"):
+            return _seq_frames.compare_column(values, valid, op, rule.value)
+        if rule.data_type == "boolean":
+            if op not in ("EQUALS", "NOT_EQUALS"):
+                return np.zeros(len(values), dtype=bool)
+            return _seq_frames.compare_column(values, valid, op, rule.value)
+        if rule.data_type == "date":
+            if rule.value == _seq_frames.NAT:
+                return np.zeros(len(values), dtype=bool)
+            if op in ("EQUALS", "NOT_EQUALS"):
+                # Igualdad por día, como ``date() == date()``
+                return _seq_frames.compare_column(values // 86400, valid, op, rule.value // 86400)
+            return _seq_frames.compare_column(values, valid, op, rule.value)
+        # Texto, enums, etc.
+        if op == "CONTAINS":
+            return np.char.find(values, rule.value) >= 0
+        if op == "NOT_CONTAINS":
+            return np.char.find(values, rule.value) < 0
+        if op not in ("EQUALS", "NOT_EQUALS"):
+            return np.zeros(len(values), dtype=bool)
+        return _seq_frames.compare_column(values, valid, op, rule.value)
+
+
+class ScheduleStateIndex:
+    """Intervalos producto-tarea de un cronograma para consultar estados por fecha.
+
+    Combina las fechas de DerivedDateIndex con las adyacencias de
+    ScheduleGraphIndex en un ``ScheduleStateTable`` (arrays ordenados por inicio
+    y fin) que responde "estado de cada producto en la fecha D" con
+    ``searchsorted``. Se construye una vez por cronograma y modo de inputs
+    anidados, y se descarta cuando cualquiera de los dos índices se recalcula.
+    """
+
+    data: dict[tuple[int, bool], tuple[Any, Any, _seq_frames.ScheduleStateTable]] = {}
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.data = {}
+
+    @classmethod
+    def load(cls, work_schedule: ifcopenshell.entity_instance, nested_inputs: bool = False) -> _seq_frames.ScheduleStateTable:
+        dates = DerivedDateIndex.load(work_schedule)
+        graph = ScheduleGraphIndex
+        if not graph.is_loaded or tool.Ifc.get() is not graph.ifc_file:
+            graph.load()
+        key = (work_schedule.id(), bool(nested_inputs))
+        cached = cls.data.get(key)
+        if cached and cached[0] is dates and cached[1] is graph.data:
+            return cached[2]
+        table = cls.build(dates, nested_inputs)
+        cls.data[key] = (dates, graph.data, table)
+        return table
+
+    @staticmethod
+    def build(dates: dict[int, tuple[Any, Any]], nested_inputs: bool = False) -> _seq_frames.ScheduleStateTable:
+        product_ids: list[int] = []
+        relationships: list[int] = []
+        task_starts, task_finishes, counts = [], [], []
+        for task_id, (start, finish) in dates.items():
+            if not start or not finish:
+                continue
+            outputs = ScheduleGraphIndex.task_products("task_outputs", task_id)
+            inputs = ScheduleGraphIndex.task_products("task_inputs", task_id, nested_inputs)
+            if not outputs and not inputs:
+                continue
+            product_ids.extend(outputs)
+            product_ids.extend(inputs)
+            relationships.extend([0] * len(outputs))
+            relationships.extend([1] * len(inputs))
+            task_starts.append(start)
+            task_finishes.append(finish)
+            counts.append(len(outputs) + len(inputs))
+        return _seq_frames.ScheduleStateTable(
+            product_ids,
+            relationships,
+            np.repeat(_seq_frames.to_epoch_seconds(task_starts), counts),
+            np.repeat(_seq_frames.to_epoch_seconds(task_finishes), counts),
+        )
+
+
+class TaskSortKeyIndex:
+    """Claves de orden natural de las tareas, precalculadas por columna.
+
+    Cada columna (``IfcTask.Name``, ``IfcTaskTime.ScheduleStart``...) se lee una
+    sola vez para todas las tareas del archivo. Para una combinación de columnas
+    se guarda el rango denso de cada tarea: tareas con las mismas claves comparten
+    rango, así ordenar hermanos es ordenar enteros y el orden estable original se
+    conserva en los empates. Se descarta en ``refresh()`` o al cambiar de archivo.
+    """
+
+    keys: dict[str, dict[int, tuple]] = {}
+    ranks: dict[tuple[str, ...], dict[int, int]] = {}
+    ifc_file = None
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.keys = {}
+        cls.ranks = {}
+
+    @staticmethod
+    def natural_key(value, _nsre=re.compile("([0-9]+)")) -> tuple:
+        return tuple(int(text) if text.isdigit() else text.lower() for text in _nsre.split(str(value)))
+
+    @classmethod
+    def column_keys(cls, column: str) -> dict[int, tuple]:
+        if column not in cls.keys:
+            column_type, _, name = column.partition(".")
+            keys = {}
+            for task in cls.ifc_file.by_type("IfcTask"):
+                if column_type == "IfcTask":
+                    value = getattr(task, name, None)
+                elif column_type == "IfcTaskTime":
+                    value = getattr(task.TaskTime, name, None) if task.TaskTime else None
+                else:
+                    value = task.Identification
+                keys[task.id()] = cls.natural_key(value or "")
+            cls.keys[column] = keys
+        return cls.keys[column]
+
+    @classmethod
+    def get_ranks(cls, columns: tuple[str, ...], task_ids: list[int]) -> dict[int, int]:
+        """Rango denso por tarea para ordenar por ``columns`` (la primera manda)."""
+        ifc_file = tool.Ifc.get()
+        if ifc_file is not cls.ifc_file:
+            cls.invalidate()
+            cls.ifc_file = ifc_file
+        ranks = cls.ranks.get(columns)
+        if ranks is not None and any(task_id not in ranks for task_id in task_ids):
+            # Tareas creadas desde la última lectura
+            cls.invalidate()
+            ranks = None
+        if ranks is None:
+            column_keys = [cls.column_keys(column) for column in columns]
+            keys = {task_id: tuple(k[task_id] for k in column_keys) for task_id in column_keys[0]}
+            dense = {key: rank for rank, key in enumerate(sorted(set(keys.values())))}
+            ranks = cls.ranks[columns] = {task_id: dense[key] for task_id, key in keys.items()}
+        return ranks
+
+
+class TaskSearchIndex:
+    """Índice invertido de trigramas sobre Identification, Name y Description.
+
+    ``SequenceData.load_tasks`` le pasa los textos de todas las tareas; los
+    postings (trigrama → filas) se construyen en la primera búsqueda y solo se
+    rehacen si algún texto cambió. Cada búsqueda suma las apariciones de los
+    trigramas de la consulta por fila con ``bincount``, sin recorrer las tareas.
+    """
+
+    task_ids: list[int] = []
+    texts: list[str] = []
+    identifications: list[str] = []
+    children: list[list[int]] = []
+    postings: dict[str, np.ndarray] = {}
+    is_built = False
+    # (work_schedule_id, máscara de filas de sus tareas)
+    scope: Optional[tuple[int, np.ndarray]] = None
+    last_query: Optional[tuple[str, int, Optional[int]]] = None
+    last_results: list[tuple[int, float]] = []
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.task_ids = []
+        cls.texts = []
+        cls.identifications = []
+        cls.children = []
+        cls.postings = {}
+        cls.is_built = False
+        cls.scope = None
+        cls.last_query = None
+
+    @classmethod
+    def update(cls, tasks: dict[int, dict[str, Any]]) -> None:
+        task_ids = list(tasks)
+        identifications = [(tasks[t]["Identification"] or "").lower() for t in task_ids]
+        texts = [
+            " ".join((identification, (tasks[t]["Name"] or "").lower(), (tasks[t].get("Description") or "").lower()))
+            for t, identification in zip(task_ids, identifications)
+        ]
+        children = [tasks[t]["RelatedObjects"] for t in task_ids]
+        if task_ids == cls.task_ids and texts == cls.texts and children == cls.children:
+            return
+        cls.task_ids, cls.texts, cls.identifications, cls.children = task_ids, texts, identifications, children
+        cls.postings = {}
+        cls.is_built = False
+        cls.scope = None
+        cls.last_query = None
+
+    @staticmethod
+    def trigrams(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    @classmethod
+    def build(cls) -> None:
+        rows: dict[str, list[int]] = {}
+        for row, text in enumerate(cls.texts):
+            for trigram in cls.trigrams(text):
+                rows.setdefault(trigram, []).append(row)
+        cls.postings = {trigram: np.array(r, dtype=np.int32) for trigram, r in rows.items()}
+        cls.is_built = True
+
+    @classmethod
+    def schedule_rows(cls, work_schedule_id: int) -> np.ndarray:
+        """Máscara de las filas que pertenecen al cronograma (raíces y descendientes)."""
+        if cls.scope is not None and cls.scope[0] == work_schedule_id:
+            return cls.scope[1]
+        row_of = {task_id: row for row, task_id in enumerate(cls.task_ids)}
+        mask = np.zeros(len(cls.task_ids), dtype=bool)
+        work_schedule = SequenceData.data.get("work_schedules", {}).get(work_schedule_id)
+        stack = list(work_schedule["RelatedObjects"]) if work_schedule else []
+        while stack:
+            row = row_of.get(stack.pop())
+            if row is None or mask[row]:
+                continue
+            mask[row] = True
+            stack.extend(cls.children[row])
+        cls.scope = (work_schedule_id, mask)
+        return mask
+
+    @classmethod
+    def search(cls, query: str, limit: int = 20, work_schedule_id: Optional[int] = None) -> list[tuple[int, float]]:
+        """Tareas más parecidas a ``query`` como (task_id, puntuación), de mayor a menor.
+
+        Puntuación: fracción de trigramas de la consulta presentes, +1 si la
+        consulta aparece literal y +0.5 si la identificación empieza por ella.
+        Consultas de menos de 3 caracteres se resuelven por subcadena. Con
+        ``work_schedule_id`` solo se devuelven tareas de ese cronograma.
+        """
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+        if cls.last_query == (query, limit, work_schedule_id):
+            return cls.last_results
+        if not cls.is_built:
+            cls.build()
+
+        qgrams = cls.trigrams(query)
+        if qgrams:
+            postings = [cls.postings[g] for g in qgrams if g in cls.postings]
+            if not postings:
+                candidates = np.empty(0, dtype=np.int64)
+                scores = np.empty(0, dtype=np.float64)
+            else:
+                hits = np.bincount(np.concatenate(postings), minlength=len(cls.texts))
+                # Al menos la mitad de los trigramas: tolera erratas pero descarta ruido
+                candidates = np.flatnonzero(hits >= max(1, (len(qgrams) + 1) // 2))
+                scores = hits[candidates] / len(qgrams)
+        else:
+            candidates = np.array([row for row, text in enumerate(cls.texts) if query in text], dtype=np.int64)
+            scores = np.zeros(len(candidates), dtype=np.float64)
+
+        if work_schedule_id is not None:
+            in_schedule = cls.schedule_rows(work_schedule_id)[candidates]
+            candidates, scores = candidates[in_schedule], scores[in_schedule]
+
+        results = []
+        for row, score in zip(candidates.tolist(), scores.tolist()):
+            if query in cls.texts[row]:
+                score += 1.0
+            if cls.identifications[row].startswith(query):
+                score += 0.5
+            results.append((-score, len(cls.texts[row]), row))
+        results = [(cls.task_ids[row], -score) for score, _, row in sorted(results)[:limit]]
+        cls.last_query, cls.last_results = (query, limit, work_schedule_id), results
+        return results
+
+
+class TaskTreeWindow:
+    """Árbol de tareas visible, aplanado, con solo una ventana materializada en la UI.
+
+    ``Sequence.load_task_tree`` recorre el árbol filtrado y ordenado una vez y
+    guarda las filas visibles en arrays (id, nivel, hijos, expandida); solo
+    ``size`` filas a partir de ``offset`` existen como ``Task`` en
+    ``BIMTaskTreeProperties.tasks``. El estado editable de una fila (checkbox y
+    elecciones de perfil) se guarda en ``stash`` al salir de la ventana y se
+    restaura al volver a ella.
+    """
+
+    size = 300
+    # Filas de margen: al activar una fila a esta distancia del borde se desplaza la ventana
+    margin = 10
+    task_ids = np.empty(0, dtype=np.int64)
+    levels = np.empty(0, dtype=np.int32)
+    has_children = np.empty(0, dtype=bool)
+    is_expanded = np.empty(0, dtype=bool)
+    rows: dict[int, int] = {}
+    offset = 0
+    stash: dict[int, dict[str, Any]] = {}
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.set_rows([])
+        cls.offset = 0
+        cls.stash = {}
+
+    @classmethod
+    def set_rows(cls, rows: list[tuple[int, int, bool, bool]]) -> None:
+        """Filas visibles en orden: (task_id, nivel, tiene hijos, expandida)."""
+        count = len(rows)
+        cls.task_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+        cls.levels = np.fromiter((r[1] for r in rows), dtype=np.int32, count=count)
+        cls.has_children = np.fromiter((r[2] for r in rows), dtype=bool, count=count)
+        cls.is_expanded = np.fromiter((r[3] for r in rows), dtype=bool, count=count)
+        cls.rows = {task_id: row for row, task_id in enumerate(cls.task_ids.tolist())}
+
+    @classmethod
+    def insert_rows(cls, row: int, rows: list[tuple[int, int, bool, bool]]) -> None:
+        """Inserta ``rows`` antes de la fila ``row`` (p. ej. el subárbol de una tarea expandida)."""
+        if not rows:
+            return
+        count = len(rows)
+        cls.task_ids = np.insert(cls.task_ids, row, np.fromiter((r[0] for r in rows), dtype=np.int64, count=count))
+        cls.levels = np.insert(cls.levels, row, np.fromiter((r[1] for r in rows), dtype=np.int32, count=count))
+        cls.has_children = np.insert(cls.has_children, row, np.fromiter((r[2] for r in rows), dtype=bool, count=count))
+        cls.is_expanded = np.insert(cls.is_expanded, row, np.fromiter((r[3] for r in rows), dtype=bool, count=count))
+        cls.reindex(row)
+
+    @classmethod
+    def remove_rows(cls, start: int, stop: int) -> None:
+        if stop <= start:
+            return
+        for task_id in cls.task_ids[start:stop].tolist():
+            cls.rows.pop(task_id, None)
+        cls.task_ids = np.delete(cls.task_ids, slice(start, stop))
+        cls.levels = np.delete(cls.levels, slice(start, stop))
+        cls.has_children = np.delete(cls.has_children, slice(start, stop))
+        cls.is_expanded = np.delete(cls.is_expanded, slice(start, stop))
+        cls.reindex(start)
+
+    @classmethod
+    def reindex(cls, start: int) -> None:
+        """Actualiza ``rows`` solo a partir de la fila ``start``."""
+        cls.rows.update(zip(cls.task_ids[start:].tolist(), range(start, len(cls.task_ids))))
+
+    @classmethod
+    def subtree_end(cls, row: int) -> int:
+        """Fila siguiente al último descendiente visible de ``row``."""
+        deeper = cls.levels[row + 1 :] <= cls.levels[row]
+        return row + 1 + (int(np.argmax(deeper)) if deeper.any() else len(deeper))
+
+    @classmethod
+    def total(cls) -> int:
+        return len(cls.task_ids)
+
+    @classmethod
+    def clamp(cls, offset: int) -> int:
+        return max(0, min(int(offset), max(0, cls.total() - cls.size)))
+
+    @classmethod
+    def window(cls, offset: Optional[int] = None) -> range:
+        start = cls.offset if offset is None else offset
+        return range(start, min(start + cls.size, cls.total()))
+
+    @classmethod
+    def offset_for_row(cls, row: int) -> int:
+        """Offset que deja ``row`` visible, moviendo la ventana lo mínimo."""
+        if cls.offset + cls.margin <= row < cls.offset + cls.size - cls.margin:
+            return cls.offset
+        return cls.clamp(row - cls.size // 2)
+
+    @classmethod
+    def stash_item(cls, item) -> None:
+        choices = tuple(
+            (choice.group_name, choice.enabled, choice.selected_profile) for choice in item.profile_group_choices
+        )
+        if item.is_selected or choices:
+            cls.stash[item.ifc_definition_id] = {"is_selected": item.is_selected, "profile_group_choices": choices}
+        else:
+            cls.stash.pop(item.ifc_definition_id, None)
+
+    @classmethod
+    def restore_item(cls, item) -> None:
+        """Restaura el estado guardado sin disparar los callbacks de actualización."""
+        state = cls.stash.pop(item.ifc_definition_id, None)
+        if not state:
+            return
+        item["is_selected"] = state["is_selected"]
+        for group_name, enabled, selected_profile in state["profile_group_choices"]:
+            choice = item.profile_group_choices.add()
+            choice.group_name = group_name
+            choice.enabled = enabled
+            choice.selected_profile = selected_profile
+
+    @classmethod
+    def checked_task_ids(cls) -> list[int]:
+        """Tareas con el checkbox marcado que no están materializadas."""
+        return [task_id for task_id, state in cls.stash.items() if state.get("is_selected")]
+
+
+# Tipos que desaparecen al terminar (hide_at_end por defecto)
+DISAPPEARING_TYPES = frozenset({"DEMOLITION", "REMOVAL", "DISPOSAL", "DISMANTLE"})
+
+
+def _rgba(value, default: tuple[float, ...]) -> tuple[float, float, float, float]:
+    try:
+        color = tuple(float(c) for c in value)
+    except Exception:
+        return default
+    return color + (1.0,) if len(color) == 3 else color[:4]
+
+
+class AppearanceProfileRecord(NamedTuple):
+    """Perfil de apariencia resuelto: inmutable, con colores RGBA y alfas precalculados.
+
+    Sustituye a las clases creadas con ``type('AppearanceProfile', ...)`` en cada
+    consulta. ProfileStore las interna, así que perfiles idénticos son el mismo
+    objeto durante toda la animación.
+    """
+
+    name: str = ""
+    consider_start: bool = True
+    consider_active: bool = True
+    consider_end: bool = True
+    start_color: tuple[float, float, float, float] = (1.0, 1.0, 1.0, 1.0)
+    in_progress_color: tuple[float, float, float, float] = (1.0, 1.0, 0.0, 1.0)
+    end_color: tuple[float, float, float, float] = (0.0, 1.0, 0.0, 1.0)
+    use_start_original_color: bool = False
+    use_active_original_color: bool = False
+    use_end_original_color: bool = True
+    start_transparency: float = 0.0
+    active_start_transparency: float = 0.0
+    active_finish_transparency: float = 0.0
+    active_transparency_interpol: float = 1.0
+    end_transparency: float = 0.0
+    hide_at_end: bool = False
+    # Precalculados (1 - transparencia)
+    start_alpha: float = 1.0
+    active_start_alpha: float = 1.0
+    active_finish_alpha: float = 1.0
+    end_alpha: float = 1.0
+
+    @classmethod
+    def create(cls, name: str, **values) -> AppearanceProfileRecord:
+        defaults = cls._field_defaults
+        colors = {
+            field: _rgba(values.get(field, defaults[field]), defaults[field])
+            for field in ("start_color", "in_progress_color", "end_color")
+        }
+        transparencies = {
+            field: float(values.get(field, defaults[field]))
+            for field in ("start_transparency", "active_start_transparency", "active_finish_transparency", "end_transparency")
+        }
+        return cls(
+            name=name,
+            consider_start=bool(values.get("consider_start", True)),
+            consider_active=bool(values.get("consider_active", True)),
+            consider_end=bool(values.get("consider_end", True)),
+            use_start_original_color=bool(values.get("use_start_original_color", False)),
+            use_active_original_color=bool(values.get("use_active_original_color", False)),
+            use_end_original_color=bool(values.get("use_end_original_color", True)),
+            active_transparency_interpol=float(values.get("active_transparency_interpol", 1.0)),
+            hide_at_end=bool(values.get("hide_at_end", name in DISAPPEARING_TYPES)),
+            start_alpha=1.0 - transparencies["start_transparency"],
+            active_start_alpha=1.0 - transparencies["active_start_transparency"],
+            active_finish_alpha=1.0 - transparencies["active_finish_transparency"],
+            end_alpha=1.0 - transparencies["end_transparency"],
+            **colors,
+            **transparencies,
+        )
+
+    @classmethod
+    def from_data(cls, data: dict[str, Any]) -> AppearanceProfileRecord:
+        """Desde una entrada de ``profiles`` del JSON de grupos."""
+        values = {k: v for k, v in data.items() if k in cls._field_defaults and k != "name"}
+        return cls.create(data.get("name", ""), **values)
+
+
+class ProfileStore:
+    """JSON de perfiles de apariencia (``scene["BIM_AppearanceProfileSets"]``) parseado una vez.
+
+    ``load`` responde desde ``data`` sin leer la escena; el texto de la escena
+    solo se compara en ``sync``, una vez por operación (``refresh()``) y tras
+    deshacer, rehacer o cargar otro .blend (handlers de ``register_handlers``).
+    ``write`` es la única vía de escritura y sube ``version``. Los perfiles
+    resueltos se cachean por (grupo, nombre) y se descartan con cada nueva versión.
+    """
+
+    key = "BIM_AppearanceProfileSets"
+    handlers = ("undo_post", "redo_post", "load_post")
+    raw: Optional[str] = None
+    scene_pointer: Optional[int] = None
+    data: dict[str, Any] = {}
+    version = 0
+    profiles: dict[tuple[str, str], Optional[AppearanceProfileRecord]] = {}
+    interned: dict[AppearanceProfileRecord, AppearanceProfileRecord] = {}
+    pending: Optional[dict[str, Any]] = None
+    enum_items: dict[Any, tuple[Optional[int], list]] = {}
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls.raw = None
+        cls.data = {}
+        cls.clear_profiles()
+        cls.version += 1
+
+    @classmethod
+    def clear_profiles(cls) -> None:
+        cls.profiles = {}
+        cls.interned = {}
+
+    @classmethod
+    def intern(cls, record: AppearanceProfileRecord) -> AppearanceProfileRecord:
+        """Instancia compartida para perfiles con valores idénticos."""
+        return cls.interned.setdefault(record, record)
+
+    @classmethod
+    def get_profile(cls, group_name: str, profile_name: str) -> Optional[AppearanceProfileRecord]:
+        """Perfil resuelto e internado, cacheado por (grupo, nombre)."""
+        cls.load()
+        key = (group_name, profile_name)
+        if key not in cls.profiles:
+            data = cls.get_profile_data(group_name, profile_name)
+            cls.profiles[key] = cls.intern(AppearanceProfileRecord.from_data(data)) if data else None
+        return cls.profiles[key]
+
+    @classmethod
+    def get_generic_profile(cls, predefined_type: str) -> AppearanceProfileRecord:
+        """Perfil genérico para tipos sin perfil configurado."""
+        key = ("", predefined_type)
+        if key not in cls.profiles:
+            cls.profiles[key] = cls.intern(
+                AppearanceProfileRecord.create(
+                    predefined_type,
+                    start_color=(1.0, 1.0, 1.0, 0.0),
+                    in_progress_color=(1.0, 0.5, 0.0, 1.0),
+                    end_color=(0.8, 0.8, 0.8, 1.0),
+                )
+            )
+        return cls.profiles[key]
+
+    @classmethod
+    def load(cls, scene=None, copy: bool = False) -> dict[str, Any]:
+        """Grupos de perfiles; el dict compartido es de solo lectura, usar ``copy`` para modificarlo.
+
+        Dentro de ``transaction`` devuelve la copia de trabajo pendiente (o una
+        copia de ella con ``copy``).
+        """
+        if cls.pending is not None:
+            return deepcopy(cls.pending) if copy else cls.pending
+        scene = scene or bpy.context.scene
+        if cls.raw is None or scene.as_pointer() != cls.scene_pointer:
+            cls.sync(scene)
+        return json.loads(cls.raw) if copy else cls.data
+
+    @classmethod
+    def sync(cls, scene=None) -> None:
+        """Vuelve a parsear el JSON solo si el texto de la escena cambió."""
+        if cls.pending is not None:
+            return
+        scene = scene or getattr(bpy.context, "scene", None)
+        if scene is None:
+            return
+        cls.scene_pointer = scene.as_pointer()
+        raw = scene.get(cls.key, "{}")
+        if not isinstance(raw, str):
+            raw = json.dumps(raw.to_dict() if hasattr(raw, "to_dict") else (raw or {}))
+        if raw != cls.raw:
+            try:
+                data = json.loads(raw)
+            except Exception:
+                data = {}
+            cls.raw = raw
+            cls.data = data if isinstance(data, dict) else {}
+            cls.clear_profiles()
+            cls.version += 1
+
+    @classmethod
+    def write(cls, data: dict[str, Any], scene=None, **dumps_kwargs) -> None:
+        scene = scene or bpy.context.scene
+        raw = json.dumps(data, **dumps_kwargs)
+        scene[cls.key] = raw
+        cls.scene_pointer = scene.as_pointer()
+        cls.raw = raw
+        cls.data = json.loads(raw)
+        cls.clear_profiles()
+        cls.version += 1
+
+    @classmethod
+    @contextmanager
+    def transaction(cls, scene=None, **dumps_kwargs) -> Iterator[dict[str, Any]]:
+        """Lee el JSON una vez, permite muchas mutaciones y escribe una sola vez al salir.
+
+        Las transacciones anidadas comparten la copia de trabajo y solo la más
+        externa escribe. Si salta una excepción no se escribe nada y se descartan
+        los perfiles resueltos desde la copia; si el resultado no cambió tampoco
+        se sube ``version``.
+        """
+        if cls.pending is not None:
+            yield cls.pending
+            return
+        scene = scene or bpy.context.scene
+        # Se va a escribir el JSON entero: partir del texto actual de la escena
+        cls.sync(scene)
+        cls.pending = data = cls.load(scene, copy=True)
+        try:
+            yield data
+        except BaseException:
+            cls.clear_profiles()
+            raise
+        finally:
+            cls.pending = None
+        if json.dumps(data, **dumps_kwargs) != cls.raw:
+            cls.write(data, scene, **dumps_kwargs)
+
+    @classmethod
+    def get_enum_items(cls, key: Any, build, scene=None) -> list:
+        """Items de EnumProperty derivados del JSON, reconstruidos solo al cambiar ``version``.
+
+        Blender exige que las listas devueltas por callbacks dinámicos sigan
+        referenciadas; quedan guardadas aquí hasta la siguiente reconstrucción.
+        Durante una ``transaction`` se devuelve la lista existente sin
+        sustituirla y se marca para reconstruirla al terminar.
+        """
+        data = cls.load(scene)
+        cached = cls.enum_items.get(key)
+        if cls.pending is not None:
+            if cached is None:
+                cached = cls.enum_items[key] = (None, build(data))
+            elif cached[0] is not None:
+                cached = cls.enum_items[key] = (None, cached[1])
+            return cached[1]
+        if cached is None or cached[0] != cls.version:
+            cached = cls.enum_items[key] = (cls.version, build(data))
+        return cached[1]
+
+    @classmethod
+    def register_handlers(cls) -> None:
+        for name in cls.handlers:
+            handlers = getattr(bpy.app.handlers, name)
+            if invalidate_profile_store not in handlers:
+                handlers.append(invalidate_profile_store)
+
+    @classmethod
+    def unregister_handlers(cls) -> None:
+        for name in cls.handlers:
+            handlers = getattr(bpy.app.handlers, name)
+            while invalidate_profile_store in handlers:
+                handlers.remove(invalidate_profile_store)
+
+    @classmethod
+    def get_group(cls, group_name: str) -> dict[str, Any]:
+        group = cls.load().get(group_name, {})
+        return group if isinstance(group, dict) else {}
+
+    @classmethod
+    def get_profile_data(cls, group_name: str, profile_name: str) -> Optional[dict[str, Any]]:
+        for profile_data in cls.get_group(group_name).get("profiles", []):
+            if profile_data.get("name") == profile_name:
+                return profile_data
+        return None
+
+
+@persistent
+def invalidate_profile_store(*args):
+    """Deshacer/rehacer y cargar un .blend cambian el JSON de la escena sin pasar por ``write``."""
+    ProfileStore.invalidate()
+
+
+# Canales que una capa del stack de grupos puede aportar al perfil compuesto
+PROFILE_CHANNELS: dict[str, tuple[str, ...]] = {
+    "color": (
+        "start_color",
+        "in_progress_color",
+        "end_color",
+        "use_start_original_color",
+        "use_active_original_color",
+        "use_end_original_color",
+    ),
+    "alpha": (
+        "start_transparency",
+        "active_start_transparency",
+        "active_finish_transparency",
+        "active_transparency_interpol",
+        "end_transparency",
+        "start_alpha",
+        "active_start_alpha",
+        "active_finish_alpha",
+        "end_alpha",
+    ),
+    "visibility": ("consider_start", "consider_active", "consider_end", "hide_at_end"),
+}
+
+
+class ProfileLayer(NamedTuple):
+    """Capa del stack de animación: un grupo de perfiles y los canales que aporta."""
+
+    group_name: str
+    channels: frozenset[str] = frozenset(PROFILE_CHANNELS)
+
+
+class TaskProfileResolver:
+    """Tabla task_id → perfil de apariencia compuesta a partir de un stack de grupos.
+
+    Las capas se evalúan de mayor a menor prioridad. Para cada tarea, el perfil
+    de una capa es la elección de la tarea en ese grupo (``profile_group_choices``)
+    o, si no, el de su PredefinedType; las capas inferiores rellenan lo que
+    falte en las superiores y cada canal (color, alpha, visibilidad) se toma de
+    la primera capa que lo aporte. Sin ninguna capa se usa el PredefinedType en
+    DEFAULT y por último el perfil genérico. ``task_tree_props.tasks`` se
+    recorre una sola vez y cada tarea se compone una sola vez.
+    """
+
+    def __init__(self, layers, task_tree_props=None):
+        if isinstance(layers, str) or not layers:
+            layers = [ProfileLayer(layers or "DEFAULT")]
+        self.layers: list[ProfileLayer] = [
+            layer if isinstance(layer, ProfileLayer) else ProfileLayer(layer) for layer in layers
+        ]
+        self.group_name = self.layers[0].group_name
+        self.profiles: dict[int, AppearanceProfileRecord] = {}
+        groups = {layer.group_name for layer in self.layers}
+        self.choices: dict[str, dict[int, str]] = {group: {} for group in groups}
+        task_tree_props = task_tree_props or tool.Sequence.get_task_tree_props()
+        for item in getattr(task_tree_props, "tasks", []):
+            for choice in getattr(item, "profile_group_choices", []):
+                group = getattr(choice, "group_name", None)
+                if group in groups and getattr(choice, "selected_profile", None):
+                    self.choices[group].setdefault(item.ifc_definition_id, choice.selected_profile)
+        # Tareas fuera de la ventana materializada del árbol
+        for task_id, state in TaskTreeWindow.stash.items():
+            for group, _, selected_profile in state.get("profile_group_choices", ()):
+                if group in groups and selected_profile:
+                    self.choices[group].setdefault(task_id, selected_profile)
+
+    @classmethod
+    def for_animation(cls, animation_props=None, fallback_group: str = "DEFAULT") -> TaskProfileResolver:
+        """Resolver con las capas habilitadas del Animation Stack (o ``fallback_group``)."""
+        return cls(tool.Sequence.get_animation_profile_layers(animation_props) or [ProfileLayer(fallback_group)])
+
+    def get(self, task: ifcopenshell.entity_instance) -> AppearanceProfileRecord:
+        task_id = task.id()
+        profile = self.profiles.get(task_id)
+        if profile is None:
+            profile = self.profiles[task_id] = self.resolve(task)
+        return profile
+
+    def layer_profile(self, layer: ProfileLayer, task_id: int, predefined_type: str) -> Optional[AppearanceProfileRecord]:
+        for profile_name in (self.choices[layer.group_name].get(task_id), predefined_type):
+            if profile_name:
+                profile = ProfileStore.get_profile(layer.group_name, profile_name)
+                if profile:
+                    return profile
+        return None
+
+    def resolve(self, task: ifcopenshell.entity_instance) -> AppearanceProfileRecord:
+        task_id = task.id()
+        predefined_type = getattr(task, "PredefinedType", None) or "NOTDEFINED"
+        found = []
+        for layer in self.layers:
+            profile = self.layer_profile(layer, task_id, predefined_type)
+            if profile:
+                found.append((layer, profile))
+        if not found:
+            return ProfileStore.get_profile("DEFAULT", predefined_type) or ProfileStore.get_generic_profile(
+                predefined_type
+            )
+
+        base = found[0][1]
+        values = {}
+        for channel, fields in PROFILE_CHANNELS.items():
+            source = next((profile for layer, profile in found if channel in layer.channels), base)
+            if source is not base:
+                values.update({field: getattr(source, field) for field in fields})
+        return ProfileStore.intern(base._replace(**values)) if values else base
+
+    def resolve_all(self, tasks) -> dict[int, AppearanceProfileRecord]:
+        """Evalúa de una vez la tabla plana para todas las tareas dadas."""
+        return {task.id(): self.get(task) for task in tasks}
+
+
 # --- Helpers de estado y perfiles (compatibles con UnifiedProfileManager) ---
 def interpolate_profile_values(profile, state, progress=0.0):
     """Interpola valores del perfil según progreso (0.0..1.0). Devuelve dict con 'alpha' si aplica."""
@@ -556,53 +1835,21 @@ def validate_and_adjust_frame(frame, settings):
     return int(frame)
 
 def compute_task_frames(task, settings):
-    """Versión mejorada con validación de frames"""
-    start_date = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-    finish_date = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
-    
+    """Versión mejorada con validación de frames.
+
+    Los frames de todas las tareas del cronograma se calculan de una vez
+    (TaskFrameIndex) y se reutilizan mientras no cambien fechas ni settings.
+    """
+    start_date, finish_date = DerivedDateIndex.get(task)
     if not start_date or not finish_date:
         return None, None
-    
-    # Validar contra el rango de visualización
-    viz_start = settings["start"]
-    viz_finish = settings["finish"]
-    
-    # Si está completamente fuera del rango
-    if finish_date < viz_start:
-        # Tarea terminada antes del período
-        return settings["start_frame"], settings["start_frame"]
-    
-    if start_date > viz_finish:
-        # Tarea empieza después del período
-        return None, None
-    
-    # Ajustar fechas al rango
-    adjusted_start = max(start_date, viz_start)
-    adjusted_finish = min(finish_date, viz_finish)
-    
-    # Calcular frames
-    total_frames = int(settings["total_frames"])
-    duration = settings["duration"]
-    
-    if duration.total_seconds() > 0:
-        start_progress = (adjusted_start - viz_start) / duration
-        finish_progress = (adjusted_finish - viz_start) / duration
+
+    ws_id = DerivedDateIndex.task_schedule.get(task.id())
+    if ws_id is not None:
+        frames = TaskFrameIndex.load(ws_id, settings)
     else:
-        start_progress = 0
-        finish_progress = 1
-    
-    start_frame = settings["start_frame"] + (start_progress * total_frames)
-    finish_frame = settings["start_frame"] + (finish_progress * total_frames)
-    
-    # Validar y ajustar frames
-    start_frame = validate_and_adjust_frame(start_frame, settings)
-    finish_frame = validate_and_adjust_frame(finish_frame, settings)
-    
-    # Asegurar que start <= finish
-    if start_frame > finish_frame:
-        start_frame = finish_frame
-    
-    return int(start_frame), int(finish_frame)
+        frames = TaskFrameIndex.compute({task.id(): (start_date, finish_date)}, settings)
+    return frames.get(task.id(), (None, None))
 
 def compute_progress_at_frame(task, frame, settings):
     """Devuelve progreso 0..1 de la tarea en un frame, o None si no aplica."""
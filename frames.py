@@ -0,0 +1,779 @@
+# Bonsai - OpenBIM Blender Add-on
+# Copyright (C) 2021 Dion Moult <dion@thinkmoult.com>, 2022 Yassine Oualid <yassine@sigmadimensions.com>
+#
+# This file is part of Bonsai.
+#
+# Bonsai is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bonsai is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bonsai.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import numpy as np
+from collections.abc import Mapping
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Optional
+
+
+# Códigos de relación producto-tarea (columna "relationship")
+RELATIONSHIPS = ("output", "input")
+RELATIONSHIP_CODES = {name: code for code, name in enumerate(RELATIONSHIPS)}
+
+# Códigos de estado (eje 1 de la columna "states")
+STATE_NONE = -1
+STATE_BEFORE_START = 0
+STATE_ACTIVE = 1
+STATE_AFTER_END = 2
+STATE_NAMES = ("before_start", "active", "after_end")
+
+
+# Valor int64 de NaT: marca fechas ausentes en los arrays epoch
+NAT = np.iinfo(np.int64).min
+
+
+def _to_naive_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return None
+
+
+def to_epoch_seconds(dates: Iterable) -> np.ndarray:
+    """Convierte fechas (datetime/date/None) a segundos epoch int64 (NAT si falta)."""
+    return np.array([_to_naive_datetime(d) for d in dates], dtype="datetime64[s]").astype(np.int64)
+
+
+def dates_to_frames(starts, finishes, viz_start, viz_finish, start_frame: int, total_frames: int, clamp: bool = False):
+    """Mapea fechas de inicio/fin a frames para todas las tareas a la vez.
+
+    ``starts``/``finishes`` son arrays epoch (ver ``to_epoch_seconds``) o listas de
+    fechas. El frame es ``start_frame + progreso * total_frames`` redondeado (como
+    ``round`` de Python), con progreso relativo a [viz_start, viz_finish]. Con
+    ``clamp`` se recortan al rango [start_frame, start_frame + total_frames].
+    Devuelve (start_frames, finish_frames, valid) donde ``valid`` marca las filas
+    con ambas fechas.
+    """
+    starts = np.asarray(starts if isinstance(starts, np.ndarray) else to_epoch_seconds(starts), dtype=np.int64)
+    finishes = np.asarray(finishes if isinstance(finishes, np.ndarray) else to_epoch_seconds(finishes), dtype=np.int64)
+    valid = (starts != NAT) & (finishes != NAT)
+    origin, end = to_epoch_seconds((viz_start, viz_finish))
+    span = float(end - origin)
+    if span > 0:
+        scale = float(total_frames) / span
+        start_frames = np.rint(start_frame + (starts.astype(np.float64) - origin) * scale)
+        finish_frames = np.rint(start_frame + (finishes.astype(np.float64) - origin) * scale)
+    else:
+        start_frames = np.full(len(starts), float(start_frame))
+        finish_frames = np.full(len(finishes), float(start_frame + total_frames))
+    if clamp:
+        np.clip(start_frames, start_frame, start_frame + total_frames, out=start_frames)
+        np.clip(finish_frames, start_frame, start_frame + total_frames, out=finish_frames)
+    start_frames[~valid] = 0
+    finish_frames[~valid] = 0
+    return start_frames.astype(np.int64), finish_frames.astype(np.int64), valid
+
+
+def frames_from_settings(starts, finishes, settings: dict[str, Any], clamp: bool = False):
+    """``dates_to_frames`` con el dict de ``Sequence.get_animation_settings``.
+
+    Los modos de velocidad (FRAME_SPEED, DURATION_SPEED, MULTIPLIER_SPEED) ya se
+    reflejan en ``total_frames``, así que todas las rutas los aplican igual.
+    """
+    return dates_to_frames(
+        starts,
+        finishes,
+        settings["start"],
+        settings["finish"],
+        int(settings["start_frame"]),
+        int(settings["total_frames"]),
+        clamp=clamp,
+    )
+
+
+class ProductFrameTableBuilder:
+    """Acumula filas producto-tarea y construye un ProductFrameTable.
+
+    Las filas se agregan por tarea (todas las salidas/entradas de una vez) para
+    no crear un diccionario por producto durante el recorrido del cronograma.
+    """
+
+    def __init__(self, animation_start: int, animation_end: int):
+        self.animation_start = int(animation_start)
+        self.animation_end = int(animation_end)
+        self._product_ids: list[int] = []
+        self._task_ids: list[int] = []
+        self._relationships: list[int] = []
+        self._frames: list[tuple[int, int, int, int]] = []
+        self._states: list[tuple[int, int, int, int, int, int]] = []
+        self._full_range: list[bool] = []
+        self._tasks: dict[int, tuple[Any, Any, Any, str]] = {}
+
+    def add_task(self, task, start_date, finish_date, predefined_type: Optional[str] = None, task_id: Optional[int] = None) -> int:
+        """Registra los datos por tarea (entidad, fechas, tipo) una sola vez."""
+        if not task_id:
+            task_id = task.id() if task is not None else 0
+        task_id = int(task_id)
+        if task_id not in self._tasks:
+            if predefined_type is None:
+                predefined_type = getattr(task, "PredefinedType", None) or "NOTDEFINED"
+            self._tasks[task_id] = (task, start_date, finish_date, predefined_type)
+        return task_id
+
+    def add_rows(self, task_id: int, product_ids: Iterable[int], relationship: str, started: int, completed: int, states, full_range: bool = False) -> None:
+        """Agrega una fila por producto con los mismos frames y estados.
+
+        ``states`` es ((before_s, before_e), (active_s, active_e), (after_s, after_e)).
+        Un rango vacío se codifica con fin < inicio, igual que en el formato legado.
+        """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        (bs, be), (as_, ae), (es, ee) = states
+        n = len(product_ids)
+        self._product_ids.extend(product_ids)
+        self._task_ids.extend([task_id] * n)
+        self._relationships.extend([RELATIONSHIP_CODES.get(relationship, 0)] * n)
+        start_frame = max(self.animation_start, int(started))
+        finish_frame = min(self.animation_end, int(completed))
+        self._frames.extend([(int(started), int(completed), start_frame, finish_frame)] * n)
+        self._states.extend([(int(bs), int(be), int(as_), int(ae), int(es), int(ee))] * n)
+        self._full_range.extend([bool(full_range)] * n)
+
+    def build(self) -> "ProductFrameTable":
+        n = len(self._product_ids)
+        product_id = np.fromiter(self._product_ids, dtype=np.int64, count=n)
+        # Orden estable por producto: conserva el orden de inserción de sus tareas
+        order = np.argsort(product_id, kind="stable")
+        frames = np.array(self._frames, dtype=np.int32).reshape(n, 4)[order]
+        states = np.array(self._states, dtype=np.int32).reshape(n, 3, 2)[order]
+        return ProductFrameTable(
+            product_id=product_id[order],
+            task_id=np.fromiter(self._task_ids, dtype=np.int64, count=n)[order],
+            relationship=np.fromiter(self._relationships, dtype=np.int8, count=n)[order],
+            started=frames[:, 0],
+            completed=frames[:, 1],
+            start_frame=frames[:, 2],
+            finish_frame=frames[:, 3],
+            states=states,
+            full_range=np.fromiter(self._full_range, dtype=bool, count=n)[order],
+            tasks=self._tasks,
+            animation_start=self.animation_start,
+            animation_end=self.animation_end,
+        )
+
+
+class ProductFrameTable(Mapping):
+    """Tabla columnar (NumPy) de frames por producto para la animación 4D.
+
+    Una fila por par producto-tarea. Las columnas son arrays contiguos:
+    ``product_id``, ``task_id``, ``relationship`` (código, ver RELATIONSHIPS),
+    ``started``/``completed`` (frames sin recortar), ``start_frame``/``finish_frame``
+    (recortados al rango de animación), ``states`` con forma (n, 3, 2) para los
+    rangos before_start/active/after_end y ``full_range`` para las tareas en modo
+    prioritario (solo estado activo en todo el rango).
+
+    Las filas están ordenadas por producto, así que las filas de un producto son
+    un bloque contiguo. Como Mapping, ``table[product_id]`` devuelve la lista de
+    dicts del formato legado para los consumidores antiguos.
+    """
+
+    def __init__(self, product_id, task_id, relationship, started, completed, start_frame, finish_frame, states, full_range, tasks, animation_start, animation_end):
+        self.product_id = product_id
+        self.task_id = task_id
+        self.relationship = relationship
+        self.started = started
+        self.completed = completed
+        self.start_frame = start_frame
+        self.finish_frame = finish_frame
+        self.states = states
+        self.full_range = full_range
+        self.tasks = tasks
+        self.animation_start = int(animation_start)
+        self.animation_end = int(animation_end)
+        self.products, self.offsets = self._compute_offsets(product_id)
+        self._index = {int(pid): i for i, pid in enumerate(self.products)}
+
+    @staticmethod
+    def _compute_offsets(product_id):
+        if len(product_id) == 0:
+            return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        products, starts = np.unique(product_id, return_index=True)
+        offsets = np.append(starts, len(product_id)).astype(np.int64)
+        return products, offsets
+
+    @classmethod
+    def from_mapping(cls, product_frames: Mapping, animation_start: int, animation_end: int) -> "ProductFrameTable":
+        """Convierte un dict legado {product_id: [frame_data, ...]} a tabla."""
+        if isinstance(product_frames, cls):
+            return product_frames
+        builder = ProductFrameTableBuilder(animation_start, animation_end)
+        empty = (animation_start, animation_start - 1)
+        for pid, items in (product_frames or {}).items():
+            for fd in items or []:
+                task_id = builder.add_task(
+                    fd.get("task"), fd.get("start_date"), fd.get("finish_date"), fd.get("type"), task_id=fd.get("task_id")
+                )
+                st = fd.get("states", {})
+                full_range = bool(fd.get("consider_start_active", False))
+                states = (st.get("before_start", empty), st.get("active", empty), st.get("after_end", empty))
+                builder.add_rows(task_id, [int(pid)], fd.get("relationship") or "output", fd.get("STARTED", 0), fd.get("COMPLETED", 0), states, full_range)
+        return builder.build()
+
+    # --- Mapping (vista compatible con el formato legado) ---
+
+    def __getitem__(self, product_id) -> list[dict]:
+        i = self._index[int(product_id)]
+        return [self.frame_data(row) for row in range(self.offsets[i], self.offsets[i + 1])]
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(pid) for pid in self.products)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __contains__(self, product_id) -> bool:
+        try:
+            return int(product_id) in self._index
+        except (TypeError, ValueError):
+            return False
+
+    @property
+    def row_count(self) -> int:
+        return len(self.product_id)
+
+    def rows(self, product_id) -> range:
+        """Índices de fila (contiguos) del producto; vacío si no existe."""
+        i = self._index.get(int(product_id))
+        if i is None:
+            return range(0)
+        return range(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def frame_data(self, row: int) -> dict:
+        """Construye el dict legado de una fila (solo cuando se necesita)."""
+        task_id = int(self.task_id[row])
+        task, start_date, finish_date, predefined_type = self.tasks.get(task_id, (None, None, None, "NOTDEFINED"))
+        states = self.states[row]
+        data = {
+            "task": task,
+            "task_id": task_id,
+            "type": predefined_type,
+            "relationship": RELATIONSHIPS[int(self.relationship[row])],
+            "start_date": start_date,
+            "finish_date": finish_date,
+            "STARTED": int(self.started[row]),
+            "COMPLETED": int(self.completed[row]),
+            "start_frame": int(self.start_frame[row]),
+            "finish_frame": int(self.finish_frame[row]),
+        }
+        if self.full_range[row]:
+            data["states"] = {"active": (int(states[STATE_ACTIVE, 0]), int(states[STATE_ACTIVE, 1]))}
+            data["consider_start_active"] = True
+        else:
+            data["states"] = {
+                name: (int(states[code, 0]), int(states[code, 1])) for code, name in enumerate(STATE_NAMES)
+            }
+        return data
+
+    def as_dict(self) -> dict[int, list[dict]]:
+        return {pid: self[pid] for pid in self}
+
+    # --- Consultas vectorizadas ---
+
+    def state_codes_at(self, frame: int) -> np.ndarray:
+        """Código de estado de cada fila en ``frame`` (STATE_NONE si ninguno cubre)."""
+        starts = self.states[:, :, 0]
+        ends = self.states[:, :, 1]
+        covers = (starts <= frame) & (frame <= ends)
+        if len(covers):
+            # Las filas de rango completo solo exponen el estado activo
+            covers[self.full_range, STATE_BEFORE_START] = False
+            covers[self.full_range, STATE_AFTER_END] = False
+        codes = np.argmax(covers, axis=1).astype(np.int8)
+        codes[~covers.any(axis=1)] = STATE_NONE
+        return codes
+
+    def pick_rows_at(self, frame: int, prefer_active: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """Elige una fila por producto para ``frame``.
+
+        Con ``prefer_active`` se toma la primera fila cuyo estado activo cubre el
+        frame; si no, la primera fila con cualquier estado que lo cubra. Si no hay
+        ninguna, se usa la primera fila del producto. Devuelve (filas, códigos de
+        estado), alineados con ``self.products``.
+        """
+        codes = self.state_codes_at(frame)
+        first = self.offsets[:-1]
+        picked = first.copy()
+        mask = codes == STATE_ACTIVE if prefer_active else codes != STATE_NONE
+        candidates = np.flatnonzero(mask)
+        if len(candidates):
+            pos = np.searchsorted(candidates, first)
+            valid = pos < len(candidates)
+            chosen = candidates[np.minimum(pos, len(candidates) - 1)]
+            valid &= chosen < self.offsets[1:]
+            picked[valid] = chosen[valid]
+        return picked, codes[picked] if len(picked) else codes[:0]
+
+    def product_signatures(self, task_signatures: Optional[Mapping[int, Any]] = None) -> dict[int, int]:
+        """Hash por producto de sus filas (tareas, frames, estados) y perfiles.
+
+        ``task_signatures`` mapea task_id a una firma hashable del perfil de la
+        tarea, de modo que un cambio de perfil también cambia la firma.
+        """
+        n = self.row_count
+        columns = np.column_stack(
+            [
+                self.task_id,
+                self.relationship.astype(np.int64),
+                self.started.astype(np.int64),
+                self.completed.astype(np.int64),
+                self.states.reshape(n, 6).astype(np.int64),
+                self.full_range.astype(np.int64),
+            ]
+        ) if n else np.empty((0, 11), dtype=np.int64)
+        rows = np.ascontiguousarray(columns)
+        task_ids = self.task_id.tolist()
+        signatures = {}
+        for i, pid in enumerate(self.products.tolist()):
+            a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+            key = rows[a:b].tobytes()
+            if task_signatures is not None:
+                key = (key, tuple(task_signatures.get(t) for t in task_ids[a:b]))
+            signatures[pid] = hash(key)
+        return signatures
+
+    def timeline_key(self, rows: range, task_signatures: Mapping[int, Any]) -> tuple:
+        """Clave de la línea de tiempo visual de unas filas: estados, relación y perfil.
+
+        Dos productos con la misma clave reciben exactamente los mismos keyframes
+        (salvo color original), por lo que pueden compartir Action.
+        """
+        rows = slice(rows.start, rows.stop)
+        return (
+            self.states[rows].tobytes(),
+            self.relationship[rows].tobytes(),
+            self.full_range[rows].tobytes(),
+            tuple(task_signatures.get(t) for t in self.task_id[rows].tolist()),
+        )
+
+
+def changed_products(old_signatures: Mapping[int, int], new_signatures: Mapping[int, int]) -> set[int]:
+    """Productos nuevos, eliminados o con firma distinta entre dos tablas."""
+    changed = {pid for pid, signature in new_signatures.items() if old_signatures.get(pid) != signature}
+    changed.update(pid for pid in old_signatures if pid not in new_signatures)
+    return changed
+
+
+# Nombres de los conjuntos de estado de un snapshot por (relación, estado)
+SNAPSHOT_STATE_NAMES = {
+    (0, STATE_BEFORE_START): "TO_BUILD",
+    (0, STATE_ACTIVE): "IN_CONSTRUCTION",
+    (0, STATE_AFTER_END): "COMPLETED",
+    (1, STATE_BEFORE_START): "TO_DEMOLISH",
+    (1, STATE_ACTIVE): "IN_DEMOLITION",
+    (1, STATE_AFTER_END): "DEMOLISHED",
+}
+# Orden en que se aplican los conjuntos; con varios estados gana el último
+SNAPSHOT_STATE_ORDER = tuple(SNAPSHOT_STATE_NAMES.values())
+
+
+class ScheduleStateTable:
+    """Intervalos producto-tarea ordenados para consultar estados por fecha.
+
+    Una fila por par producto-tarea con fechas (epoch, ver ``to_epoch_seconds``).
+    Las filas se guardan ordenadas por inicio y se mantiene además el orden por
+    fin, de modo que "qué filas empezaron / terminaron antes de D" son dos
+    ``searchsorted`` y el estado de todos los productos en una fecha se obtiene
+    sin recorrer el cronograma.
+    """
+
+    def __init__(self, product_id, relationship, starts, finishes):
+        product_id = np.asarray(product_id, dtype=np.int64)
+        relationship = np.asarray(relationship, dtype=np.int8)
+        starts = np.asarray(starts, dtype=np.int64)
+        finishes = np.asarray(finishes, dtype=np.int64)
+        valid = (starts != NAT) & (finishes != NAT)
+        order = np.argsort(starts[valid], kind="stable")
+        self.product_id = product_id[valid][order]
+        self.relationship = relationship[valid][order]
+        self.starts = starts[valid][order]
+        self.finishes = finishes[valid][order]
+        self.finish_order = np.argsort(self.finishes, kind="stable")
+        self.sorted_finishes = self.finishes[self.finish_order]
+        # Filas agrupadas por producto para reducir estados por producto
+        self.product_order = np.argsort(self.product_id, kind="stable")
+        self.products, self.product_offsets = np.unique(self.product_id[self.product_order], return_index=True)
+
+    def __len__(self) -> int:
+        return len(self.product_id)
+
+    def _finished_before(self, t: int) -> np.ndarray:
+        """Máscara de filas con fin < t."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.finish_order[: int(np.searchsorted(self.sorted_finishes, t, side="left"))]] = True
+        return mask
+
+    def state_codes(self, when, viz_start=None, viz_finish=None) -> np.ndarray:
+        """Estado (STATE_*) de cada fila en ``when`` respetando el rango de visualización.
+
+        Tareas que empiezan después de ``viz_finish``: STATE_NONE. Tareas que
+        terminan antes de ``viz_start``: STATE_AFTER_END. El resto: antes del
+        inicio, entre inicio y fin (inclusive) o después del fin.
+        """
+        t = int(to_epoch_seconds([when])[0])
+        codes = np.full(len(self), STATE_BEFORE_START, dtype=np.int8)
+        started = np.zeros(len(self), dtype=bool)
+        started[: int(np.searchsorted(self.starts, t, side="right"))] = True
+        codes[started] = STATE_ACTIVE
+        codes[started & self._finished_before(t)] = STATE_AFTER_END
+        if viz_start:
+            codes[self._finished_before(int(to_epoch_seconds([viz_start])[0]))] = STATE_AFTER_END
+        if viz_finish:
+            codes[int(np.searchsorted(self.starts, int(to_epoch_seconds([viz_finish])[0]), side="right")) :] = STATE_NONE
+        return codes
+
+    def product_states(self, codes: np.ndarray) -> np.ndarray:
+        """Estado final de cada producto de ``products`` como índice en SNAPSHOT_STATE_ORDER (-1: ninguno).
+
+        Equivale a aplicar los conjuntos de ``states_at`` en orden: si un producto
+        aparece en varios, prevalece el último.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int8)
+        ranks = np.where(codes >= 0, self.relationship * 3 + codes, -1).astype(np.int8)
+        return np.maximum.reduceat(ranks[self.product_order], self.product_offsets)
+
+    def states_at(self, when, viz_start=None, viz_finish=None) -> dict[str, np.ndarray]:
+        """IDs de producto por conjunto de estado (TO_BUILD, IN_CONSTRUCTION, ...)."""
+        codes = self.state_codes(when, viz_start, viz_finish)
+        return {
+            name: np.unique(self.product_id[(self.relationship == relationship) & (codes == state)])
+            for (relationship, state), name in SNAPSHOT_STATE_NAMES.items()
+        }
+
+
+# Valores enteros del enum Keyframe.interpolation (para foreach_set)
+INTERPOLATION_CODES = {"CONSTANT": 0, "LINEAR": 1, "BEZIER": 2}
+INTERPOLATION_NAMES = {code: name for name, code in INTERPOLATION_CODES.items()}
+
+
+class KeyframeBatch:
+    """Acumula keyframes por canal y los escribe en bloque en un Action.
+
+    Sustituye a ``obj.keyframe_insert`` por propiedad: cada canal
+    ``(data_path, index)`` guarda ``{frame: (value, interpolation)}`` (la última
+    escritura en un frame gana, como con keyframe_insert) y ``write`` crea cada
+    F-curve con ``keyframe_points.add(n)`` + ``foreach_set``.
+    """
+
+    def __init__(self, default_interpolation: str = "BEZIER"):
+        self.default_interpolation = default_interpolation
+        self.channels: dict[tuple[str, int], dict[float, tuple[float, str]]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.channels)
+
+    def add(self, data_path: str, index: int, frame: float, value: float, interpolation: Optional[str] = None) -> None:
+        channel = self.channels.setdefault((data_path, index), {})
+        channel[float(frame)] = (float(value), interpolation or self.default_interpolation)
+
+    def add_vector(self, data_path: str, frame: float, values: Iterable[float], interpolation: Optional[str] = None) -> None:
+        for index, value in enumerate(values):
+            self.add(data_path, index, frame, value, interpolation)
+
+    def add_visibility(self, frame: float, hidden: bool) -> None:
+        """hide_viewport + hide_render (canales discretos: interpolación CONSTANT)."""
+        self.add("hide_viewport", 0, frame, hidden, "CONSTANT")
+        self.add("hide_render", 0, frame, hidden, "CONSTANT")
+
+    def set_interpolation(self, data_path: str, index: int, frames: Iterable[float], interpolation: str) -> None:
+        channel = self.channels.get((data_path, index), {})
+        for frame in frames:
+            key = channel.get(float(frame))
+            if key is not None:
+                channel[float(frame)] = (key[0], interpolation)
+
+    @staticmethod
+    def get_fcurves(action, slot=None):
+        """F-curves donde escribir: la channelbag de ``slot`` en Blender 4.4+ (Actions
+        con slots) o ``action.fcurves`` en versiones anteriores."""
+        if not hasattr(action, "slots"):
+            return action.fcurves
+        if slot is None:
+            slot = action.slots[0] if len(action.slots) else action.slots.new(id_type="OBJECT", name="Object")
+        layer = action.layers[0] if len(action.layers) else action.layers.new("Layer")
+        strip = layer.strips[0] if len(layer.strips) else layer.strips.new(type="KEYFRAME")
+        return strip.channelbag(slot, ensure=True).fcurves
+
+    def write(self, action, slot=None) -> None:
+        """Crea/reescribe en ``action`` (y ``slot``) las F-curves de todos los canales acumulados."""
+        fcurves = self.get_fcurves(action, slot)
+        for (data_path, index), channel in self.channels.items():
+            fcurve = fcurves.find(data_path, index=index)
+            if fcurve is not None:
+                # Conservar las claves existentes que no se sobrescriben
+                count = len(fcurve.keyframe_points)
+                co = np.empty(count * 2, dtype=np.float32)
+                ipo = np.empty(count, dtype=np.int32)
+                fcurve.keyframe_points.foreach_get("co", co)
+                fcurve.keyframe_points.foreach_get("interpolation", ipo)
+                merged = {float(f): (float(v), INTERPOLATION_NAMES.get(int(i), self.default_interpolation)) for (f, v), i in zip(co.reshape(-1, 2), ipo)}
+                merged.update(channel)
+                channel = merged
+                fcurves.remove(fcurve)
+            fcurve = fcurves.new(data_path, index=index)
+
+            frames = sorted(channel)
+            co = np.empty(len(frames) * 2, dtype=np.float32)
+            co[0::2] = frames
+            co[1::2] = [channel[f][0] for f in frames]
+            ipo = np.fromiter(
+                (INTERPOLATION_CODES.get(channel[f][1], INTERPOLATION_CODES["BEZIER"]) for f in frames),
+                dtype=np.int32,
+                count=len(frames),
+            )
+            fcurve.keyframe_points.add(len(frames))
+            fcurve.keyframe_points.foreach_set("co", co)
+            fcurve.keyframe_points.foreach_set("interpolation", ipo)
+            fcurve.update()
+
+    def apply(self, obj) -> None:
+        """Escribe el lote en el Action del objeto (creándolo si hace falta)."""
+        if not self.channels:
+            return
+        if not obj.animation_data:
+            obj.animation_data_create()
+        animation_data = obj.animation_data
+        action = animation_data.action
+        if action is None:
+            import bpy
+
+            action = bpy.data.actions.new(name=f"{obj.name}Action")
+            animation_data.action = action
+        slot = None
+        if hasattr(animation_data, "action_slot"):
+            slot = animation_data.action_slot
+            if slot is None:
+                slot = action.slots.new(id_type="OBJECT", name=obj.name)
+                animation_data.action_slot = slot
+        self.write(action, slot)
+
+
+# Campos de perfil que usa el modo de animación por atributos
+ATTRIBUTE_PROFILE_FIELDS = {
+    "consider_start": True,
+    "consider_active": True,
+    "consider_end": True,
+    "start_color": (1.0, 1.0, 1.0, 1.0),
+    "in_progress_color": (1.0, 1.0, 1.0, 1.0),
+    "end_color": (1.0, 1.0, 1.0, 1.0),
+    "use_start_original_color": False,
+    "use_active_original_color": False,
+    "use_end_original_color": True,
+    "start_transparency": 0.0,
+    "active_start_transparency": 0.0,
+    "active_finish_transparency": 0.0,
+    "active_transparency_interpol": 1.0,
+    "end_transparency": 0.0,
+    "hide_at_end": False,
+}
+
+
+def profile_to_attributes(profile) -> dict[str, Any]:
+    """Copia serializable (JSON) de los campos de un perfil usados por AttributeAppearance."""
+    data = {}
+    for field, default in ATTRIBUTE_PROFILE_FIELDS.items():
+        value = getattr(profile, field, default)
+        data[field] = [float(c) for c in value] if isinstance(default, tuple) else type(default)(value)
+    return data
+
+
+def snapshot_appearance(ranks, profile_index, profiles, original_colors):
+    """Visibilidad y color de snapshot de muchos objetos a la vez.
+
+    Versión vectorizada de ``Sequence.get_snapshot_appearance``: ``ranks`` es el
+    estado de cada objeto como índice en SNAPSHOT_STATE_ORDER (-1: sin estado),
+    ``profile_index`` su perfil dentro de ``profiles`` y ``original_colors`` un
+    array (n, 4). Devuelve (hidden, colors); en los objetos ocultos ``colors``
+    no se usa.
+    """
+    ranks = np.asarray(ranks, dtype=np.int64)
+    profile_index = np.asarray(profile_index, dtype=np.int64)
+    original_colors = np.asarray(original_colors, dtype=np.float64).reshape(-1, 4)
+    if not len(ranks):
+        return np.zeros(0, dtype=bool), np.zeros((0, 4))
+    attrs = [profile_to_attributes(profile) for profile in profiles]
+
+    def column(field):
+        return np.array([a[field] for a in attrs], dtype=np.float64)
+
+    # Por perfil y estado de perfil (0 start, 1 in_progress, 2 end)
+    profile_colors = np.stack([column("start_color"), column("in_progress_color"), column("end_color")], axis=1)
+    use_original = np.stack(
+        [column("use_start_original_color"), column("use_active_original_color"), column("use_end_original_color")], axis=1
+    ).astype(bool)
+    transparency = np.stack(
+        [
+            column("start_transparency"),
+            (column("active_start_transparency") + column("active_finish_transparency")) / 2.0,
+            column("end_transparency"),
+        ],
+        axis=1,
+    )
+    consider_start = column("consider_start").astype(bool)[profile_index]
+
+    # TO_BUILD y DEMOLISHED se ocultan salvo con consider_start, que fuerza el estado start
+    hidden = (ranks < 0) | (~consider_start & np.isin(ranks, (0, 5)))
+    state = np.where(consider_start, 0, np.maximum(ranks, 0) % 3)
+    colors = profile_colors[profile_index, state].copy()
+    original = use_original[profile_index, state]
+    colors[original] = original_colors[original]
+    colors[:, 3] = 1.0 - transparency[profile_index, state]
+    return hidden, colors
+
+
+class AttributeAppearance:
+    """Resuelve visibilidad y color de los productos para un instante dado, sin keyframes.
+
+    Cada fila es un par producto-tarea: ``owner`` (índice del objeto), fechas de
+    inicio/fin de la tarea en segundos epoch, relación, rango completo e índice
+    de perfil. Reproduce la lógica de ``apply_state_appearance``: por objeto se
+    elige la fila activa, si no la última finalizada y si no la próxima en empezar.
+    """
+
+    def __init__(self, owner, starts, finishes, relationship, full_range, profile_index, profiles, original_colors):
+        self.owner = np.asarray(owner, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.finishes = np.asarray(finishes, dtype=np.float64)
+        self.relationship = np.asarray(relationship, dtype=np.int8)
+        self.full_range = np.asarray(full_range, dtype=bool)
+        self.profile_index = np.asarray(profile_index, dtype=np.int64)
+        self.original_colors = np.asarray(original_colors, dtype=np.float64).reshape(-1, 4)
+        self.object_count = len(self.original_colors)
+
+        def column(field, dtype=np.float64):
+            return np.array([profile.get(field, ATTRIBUTE_PROFILE_FIELDS[field]) for profile in profiles], dtype=dtype)
+
+        # Columnas de perfil expandidas a filas
+        p = self.profile_index
+        self.consider_start = column("consider_start", bool)[p]
+        self.consider_active = column("consider_active", bool)[p]
+        self.consider_end = column("consider_end", bool)[p]
+        self.hide_at_end = column("hide_at_end", bool)[p]
+        self.start_color = column("start_color").reshape(-1, 4)[p]
+        self.active_color = column("in_progress_color").reshape(-1, 4)[p]
+        self.end_color = column("end_color").reshape(-1, 4)[p]
+        self.use_start_original = column("use_start_original_color", bool)[p]
+        self.use_active_original = column("use_active_original_color", bool)[p]
+        self.use_end_original = column("use_end_original_color", bool)[p]
+        self.start_alpha = 1.0 - column("start_transparency")[p]
+        self.active_start_alpha = 1.0 - column("active_start_transparency")[p]
+        self.active_finish_alpha = 1.0 - column("active_finish_transparency")[p]
+        self.active_linear = column("active_transparency_interpol")[p] >= 0.5
+        self.end_alpha = 1.0 - column("end_transparency")[p]
+
+    def pick_rows(self, t: float):
+        """Fila elegida por objeto (-1 si no tiene) y código de estado de cada fila."""
+        states = np.where(
+            t < self.starts, STATE_BEFORE_START, np.where(t > self.finishes, STATE_AFTER_END, STATE_ACTIVE)
+        )
+        # Prioridad: activa > finalizada (la más reciente) > pendiente (la más próxima)
+        priority = np.select([states == STATE_ACTIVE, states == STATE_AFTER_END], [2, 1], 0)
+        tie = np.where(
+            states == STATE_AFTER_END, self.finishes, np.where(states == STATE_BEFORE_START, -self.starts, self.starts)
+        )
+        order = np.lexsort((tie, priority, self.owner))
+        picked = np.full(self.object_count, -1, dtype=np.int64)
+        picked[self.owner[order]] = order  # la última asignación por objeto gana
+        return picked, states
+
+    def evaluate(self, t: float):
+        """Devuelve ``(hidden, colors)`` por objeto para el instante ``t`` (segundos epoch)."""
+        hidden = np.zeros(self.object_count, dtype=bool)
+        colors = self.original_colors.copy()
+        picked, states = self.pick_rows(t)
+        objects = np.flatnonzero(picked >= 0)
+        rows = picked[objects]
+        state = states[rows]
+        original = self.original_colors[objects]
+
+        def paint(mask, color, use_original, alpha):
+            rgb = np.where(use_original[rows][:, None], original[:, :3], color[rows][:, :3])
+            target = objects[mask]
+            colors[target, :3] = rgb[mask]
+            colors[target, 3] = alpha[mask]
+
+        full = self.full_range[rows]
+        before = (state == STATE_BEFORE_START) & ~full
+        active = (state == STATE_ACTIVE) & ~full
+        after = (state == STATE_AFTER_END) & ~full
+
+        # Start (o rango completo con Start prioritario)
+        start_mask = full | (before & self.consider_start[rows])
+        paint(start_mask, self.start_color, self.use_start_original, self.start_alpha[rows])
+        # Sin Start: los outputs permanecen ocultos hasta empezar
+        hidden[objects[before & ~self.consider_start[rows] & (self.relationship[rows] == RELATIONSHIP_CODES["output"])]] = True
+
+        # Active, con transparencia interpolada si el perfil lo pide
+        span = np.maximum(self.finishes[rows] - self.starts[rows], 1.0)
+        progress = np.clip((t - self.starts[rows]) / span, 0.0, 1.0)
+        alpha = self.active_start_alpha[rows] + np.where(
+            self.active_linear[rows], (self.active_finish_alpha[rows] - self.active_start_alpha[rows]) * progress, 0.0
+        )
+        paint(active & self.consider_active[rows], self.active_color, self.use_active_original, alpha)
+
+        # End: ocultar o color final
+        end_mask = after & self.consider_end[rows]
+        hidden[objects[end_mask & self.hide_at_end[rows]]] = True
+        paint(end_mask & ~self.hide_at_end[rows], self.end_color, self.use_end_original, self.end_alpha[rows])
+        return hidden, colors
+
+
+# Comparaciones de las reglas de filtro de tareas (operador → ufunc)
+FILTER_COMPARISONS = {
+    "EQUALS": np.equal,
+    "NOT_EQUALS": np.not_equal,
+    "GREATER": np.greater,
+    "LESS": np.less,
+    "GTE": np.greater_equal,
+    "LTE": np.less_equal,
+}
+
+
+def compare_column(values: np.ndarray, valid: np.ndarray, operator: str, rule_value) -> np.ndarray:
+    """Máscara de las tareas cuyo valor cumple ``values <operator> rule_value``.
+
+    Las tareas sin valor convertible (``valid`` False) nunca cumplen, como un
+    operador no soportado por el tipo de columna.
+    """
+    compare = FILTER_COMPARISONS.get(operator)
+    if compare is None:
+        return np.zeros(len(values), dtype=bool)
+    return valid & compare(values, rule_value)
+
+
+def keep_with_descendants(matches: np.ndarray, parents: np.ndarray, depths: np.ndarray) -> np.ndarray:
+    """Propaga ``matches`` hacia arriba: una tarea se conserva si ella o algún descendiente cumple.
+
+    ``parents`` es la fila del padre de cada fila (-1 en las raíces) y ``depths``
+    su nivel. Un barrido por niveles, del más profundo a la raíz, equivale al
+    recorrido post-orden.
+    """
+    keep = np.asarray(matches, dtype=bool).copy()
+    if not len(keep):
+        return keep
+    for depth in range(int(depths.max()), 0, -1):
+        rows = np.flatnonzero((depths == depth) & keep)
+        keep[parents[rows]] = True
+    return keep
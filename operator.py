@@ -131,17 +131,11 @@ class Align4DCameraToView(bpy.types.Operator):
 # along with Bonsai.  If not, see <http://www.gnu.org/licenses/>.
 def _get_internal_profile_sets(context):
     scene = context.scene
-    key = "BIM_AppearanceProfileSets"
     # Ensure container exists
-    if key not in scene:
-        scene[key] = json.dumps({})
-    # Parse
-    try:
-        data = json.loads(scene[key])
-        if not isinstance(data, dict):
-            data = {}
-    except Exception:
-        data = {}
+    if _seq_data.ProfileStore.key not in scene:
+        _seq_data.ProfileStore.write({}, scene)
+    # Parse (copia modificable del caché de ProfileStore)
+    data = _seq_data.ProfileStore.load(scene, copy=True)
     # --- Auto-create DEFAULT group if empty ---
     try:
         if not data:
@@ -151,13 +145,13 @@ def _get_internal_profile_sets(context):
                 "MOVE", "OPERATION", "REMOVAL", "RENOVATION",
             ]
             data = {"DEFAULT": {"profiles": [{"name": n} for n in default_names]}}
-            scene[key] = json.dumps(data)
+            _seq_data.ProfileStore.write(data, scene)
     except Exception:
         pass
     return data
 
 def _set_internal_profile_sets(context, data: dict):
-    context.scene["BIM_AppearanceProfileSets"] = json.dumps(data)
+    _seq_data.ProfileStore.write(data, context.scene)
 
 # pyright: reportUnnecessaryTypeIgnoreComment=error
 
@@ -178,6 +172,8 @@ import isodate
 import bonsai.core.sequence as core
 import bonsai.tool as tool
 import bonsai.bim.module.sequence.helper as helper
+from bonsai.bim.module.sequence import data as _seq_data
+from bonsai.bim.module.sequence import frames as _seq_frames
 try:
     from bonsai.bim.module.sequence.prop import UnifiedProfileManager
 except Exception:
@@ -534,6 +530,32 @@ def _sequence_has(attr: str) -> bool:
     except Exception:
         return False
 
+# Creación troceada: duración objetivo de cada tick del timer (UI interactiva)
+JOB_TICK_SECONDS = 1 / 30
+JOB_INITIAL_CHUNK = 32
+JOB_MAX_CHUNK = 5000
+
+
+def _adapt_chunk_size(chunk: int, elapsed: float) -> int:
+    """Ajusta los objetos por tick según la duración medida del último tick."""
+    target = chunk * JOB_TICK_SECONDS / max(elapsed, 1e-4)
+    # Media con el valor anterior para evitar oscilaciones
+    return max(1, min(JOB_MAX_CHUNK, int((chunk + target) / 2)))
+
+
+def _clear_product_animation() -> None:
+    """Limpia keyframes, visibilidad y color de los objetos (sin tocar textos ni barras)."""
+    tool.Sequence.last_animation_state = None
+    tool.Sequence.clear_attribute_animation()
+    for ob in list(bpy.data.objects):
+        if ob.animation_data:
+            ob.animation_data_clear()
+        # Reset de propiedades para snapshots
+        if hasattr(ob, 'hide_viewport'): ob.hide_viewport = False
+        if hasattr(ob, 'hide_render'): ob.hide_render = False
+        if hasattr(ob, 'color'): ob.color = (1.0, 1.0, 1.0, 1.0)
+
+
 def _clear_previous_animation(context) -> None:
     """Unified function to clear all 4D animation data, including snapshots."""
     try:
@@ -562,13 +584,7 @@ def _clear_previous_animation(context) -> None:
         pass
 
     # Fallback final: limpieza manual y forzada
-    for ob in list(bpy.data.objects):
-        if ob.animation_data:
-            ob.animation_data_clear()
-        # Reset de propiedades para snapshots
-        if hasattr(ob, 'hide_viewport'): ob.hide_viewport = False
-        if hasattr(ob, 'hide_render'): ob.hide_render = False
-        if hasattr(ob, 'color'): ob.color = (1.0, 1.0, 1.0, 1.0)
+    _clear_product_animation()
 
     # Limpieza de colecciones auxiliares
     for coll_name in ["Schedule_Display_Texts", "Bar Visual"]:
@@ -643,12 +659,12 @@ def _clean_task_profile_mappings(context, removed_group_name: str | None = None)
     """
     try:
         wprops = tool.Sequence.get_work_schedule_props()
-        tprops = tool.Sequence.get_task_tree_props()
         anim = tool.Sequence.get_animation_props()
         active_group = getattr(anim, "profile_groups", "") or ""
         valid_names = set(_current_profile_names())
 
-        for t in list(getattr(tprops, "tasks", [])):
+        # Incluye las tareas fuera de la ventana materializada del árbol
+        for t in tool.Sequence.iter_all_task_items():
             # Remove group-specific entry if group removed
             if removed_group_name and hasattr(t, "profile_group_choices"):
                 to_keep = []
@@ -977,6 +993,7 @@ class AddTask(bpy.types.Operator, tool.Ifc.Operator):
     task: bpy.props.IntProperty()
 
     def _execute(self, context):
+        _seq_data.ScheduleGraphIndex.invalidate()
         core.add_task(tool.Ifc, tool.Sequence, parent_task=tool.Ifc.get().by_id(self.task))
 
 class AddSummaryTask(bpy.types.Operator, tool.Ifc.Operator):
@@ -986,6 +1003,7 @@ class AddSummaryTask(bpy.types.Operator, tool.Ifc.Operator):
     work_schedule: bpy.props.IntProperty()
 
     def _execute(self, context):
+        _seq_data.ScheduleGraphIndex.invalidate()
         core.add_summary_task(tool.Ifc, tool.Sequence, work_schedule=tool.Ifc.get().by_id(self.work_schedule))
 
 class ExpandTask(bpy.types.Operator):
@@ -995,7 +1013,10 @@ class ExpandTask(bpy.types.Operator):
     task: bpy.props.IntProperty()
 
     def execute(self, context):
-        core.expand_task(tool.Sequence, task=tool.Ifc.get().by_id(self.task))
+        task = tool.Ifc.get().by_id(self.task)
+        # Inserta solo las filas del subárbol; si la tarea no está en el árbol, recarga completa
+        if not tool.Sequence.expand_task_rows(task):
+            core.expand_task(tool.Sequence, task=task)
         return {"FINISHED"}
 
 class ContractTask(bpy.types.Operator):
@@ -1005,7 +1026,10 @@ class ContractTask(bpy.types.Operator):
     task: bpy.props.IntProperty()
 
     def execute(self, context):
-        core.contract_task(tool.Sequence, task=tool.Ifc.get().by_id(self.task))
+        task = tool.Ifc.get().by_id(self.task)
+        # Elimina solo las filas del subárbol; si la tarea no está en el árbol, recarga completa
+        if not tool.Sequence.contract_task_rows(task):
+            core.contract_task(tool.Sequence, task=task)
         return {"FINISHED"}
 
 class RemoveTask(bpy.types.Operator, tool.Ifc.Operator):
@@ -1015,6 +1039,7 @@ class RemoveTask(bpy.types.Operator, tool.Ifc.Operator):
     task: bpy.props.IntProperty()
 
     def _execute(self, context):
+        _seq_data.ScheduleGraphIndex.invalidate()
         core.remove_task(tool.Ifc, tool.Sequence, task=tool.Ifc.get().by_id(self.task))
 
 class EnableEditingTaskTime(bpy.types.Operator, tool.Ifc.Operator):
@@ -1035,6 +1060,8 @@ class EditTaskTime(bpy.types.Operator, tool.Ifc.Operator):
 
     def _execute(self, context):
         props = tool.Sequence.get_work_schedule_props()
+        # Las fechas derivadas se recalculan (de forma perezosa) tras la edición
+        _seq_data.DerivedDateIndex.invalidate()
         core.edit_task_time(
             tool.Ifc,
             tool.Sequence,
@@ -1118,16 +1145,20 @@ class CopyTaskCustomProfileGroup(bpy.types.Operator, tool.Ifc.Operator):
                         'enabled': getattr(choice, 'enabled', False),
                         'selected_profile': getattr(choice, 'selected_profile', "")
                     }
-            # Contar tareas seleccionadas
-            selected_tasks = [task for task in tprops.tasks if getattr(task, 'is_selected', False)]
-            if not selected_tasks:
+            # Contar tareas seleccionadas (incluidas las marcadas fuera de la ventana del árbol)
+            selected_count = len([task for task in tprops.tasks if getattr(task, 'is_selected', False)])
+            selected_count += len(_seq_data.TaskTreeWindow.checked_task_ids())
+            if not selected_count:
                 self.report({'WARNING'}, "No tasks selected for copying. Please select target tasks first.")
                 return {'CANCELLED'}
 
-            # Aplicar a todas las tareas seleccionadas
+            # Aplicar a todas las tareas seleccionadas; la ventana se rematerializa al recorrerlas
+            source_task_id = source_task.ifc_definition_id
             copied_count = 0
-            for target_task in selected_tasks:
-                if target_task.ifc_definition_id == source_task.ifc_definition_id:
+            for target_task in tool.Sequence.iter_all_task_items():
+                if not getattr(target_task, 'is_selected', False):
+                    continue
+                if target_task.ifc_definition_id == source_task_id:
                     continue  # Skip source task
 
                 try:
@@ -1222,6 +1253,7 @@ class AssignProduct(bpy.types.Operator, tool.Ifc.Operator):
             core.assign_products(tool.Ifc, tool.Sequence, tool.Spatial, task=tool.Ifc.get().by_id(self.task))
 
         # Forzar el recálculo del conteo de outputs después de asignar.
+        _seq_data.ScheduleGraphIndex.invalidate()
         tool.Sequence.load_task_properties()
 class UnassignProduct(bpy.types.Operator, tool.Ifc.Operator):
     bl_idname = "bim.unassign_product"
@@ -1243,6 +1275,7 @@ class UnassignProduct(bpy.types.Operator, tool.Ifc.Operator):
             core.unassign_products(tool.Ifc, tool.Sequence, tool.Spatial, task=tool.Ifc.get().by_id(self.task))
 
         # Forzar el recálculo del conteo de outputs después de desasignar.
+        _seq_data.ScheduleGraphIndex.invalidate()
         tool.Sequence.load_task_properties()
 class AssignProcess(bpy.types.Operator, tool.Ifc.Operator):
     bl_idname = "bim.assign_process"
@@ -1262,6 +1295,8 @@ class AssignProcess(bpy.types.Operator, tool.Ifc.Operator):
         return f"Assign selected {properties.related_object_type} to the selected task"
 
     def _execute(self, context):
+        # Las asignaciones cambian: reconstruir el índice producto↔tarea tras editar
+        _seq_data.ScheduleGraphIndex.invalidate()
         if self.related_object_type == "RESOURCE":
             core.assign_resource(tool.Ifc, tool.Sequence, tool.Resource, task=tool.Ifc.get().by_id(self.task))
         elif self.related_object_type == "PRODUCT":
@@ -1299,6 +1334,8 @@ class UnassignProcess(bpy.types.Operator, tool.Ifc.Operator):
         return f"Unassign selected {properties.related_object_type} from the selected task"
 
     def _execute(self, context):
+        # Las asignaciones cambian: reconstruir el índice producto↔tarea tras editar
+        _seq_data.ScheduleGraphIndex.invalidate()
         if self.related_object_type == "RESOURCE":
             core.unassign_resource(
                 tool.Ifc,
@@ -1757,6 +1794,8 @@ class EditTaskCalendar(bpy.types.Operator, tool.Ifc.Operator):
     task: bpy.props.IntProperty()
 
     def _execute(self, context):
+        # El core recarga las propiedades de las tareas: el calendario cacheado ya no vale
+        _seq_data.TaskCalendarIndex.invalidate()
         core.edit_task_calendar(
             tool.Ifc,
             tool.Sequence,
@@ -1772,6 +1811,8 @@ class RemoveTaskCalendar(bpy.types.Operator, tool.Ifc.Operator):
     task: bpy.props.IntProperty()
 
     def _execute(self, context):
+        # El core recarga las propiedades de las tareas: el calendario cacheado ya no vale
+        _seq_data.TaskCalendarIndex.invalidate()
         core.remove_task_calendar(
             tool.Ifc,
             tool.Sequence,
@@ -1923,26 +1964,13 @@ class VisualiseWorkScheduleDate(bpy.types.Operator):
         # CORRECCIÓN: Usar la fecha de inicio de visualización como fecha del snapshot
         snapshot_date = viz_start
 
-        # Ejecutar la lógica central de visualización CON el rango de visualización
-        product_states = tool.Sequence.process_construction_state(
-            work_schedule,
-            snapshot_date,
-            viz_start=viz_start,
-            viz_finish=viz_finish  # NUEVO: Pasar el rango de visualización
-        )
-
-        # Aplicar el snapshot con los estados corregidos
-        tool.Sequence.show_snapshot(product_states)
+        # Estados desde el índice del cronograma y aplicación en bloque, CON el rango de visualización
+        tool.Sequence.show_snapshot_at(work_schedule, snapshot_date, viz_start=viz_start, viz_finish=viz_finish)
 
         # Dar feedback claro al usuario sobre qué grupo se usó
         anim_props = tool.Sequence.get_animation_props()
-        active_group = None
-        for stack_item in anim_props.animation_group_stack:
-            if getattr(stack_item, 'enabled', False) and stack_item.group:
-                active_group = stack_item.group
-                break
-
-        group_used = active_group or "DEFAULT"
+        layers = tool.Sequence.get_animation_profile_layers(anim_props)
+        group_used = " > ".join(layer.group_name for layer in layers) or "DEFAULT"
 
         # NUEVO: Información adicional sobre el filtrado
         viz_end_str = viz_finish.strftime('%Y-%m-%d') if viz_finish else "No limit"
@@ -2025,6 +2053,21 @@ class VisualiseWorkScheduleDateRange(bpy.types.Operator):
         ],
         default='UPDATE'
     )
+    incremental: bpy.props.BoolProperty(
+        name="Only Update Changes",
+        description="Reuse the current animation and only rewrite products whose frames or profiles changed",
+        default=True,
+    )
+    share_actions: bpy.props.BoolProperty(
+        name="Share Actions",
+        description="Products with identical timelines and profiles share a single Action (fewer datablocks, smaller .blend)",
+        default=True,
+    )
+    chunked: bpy.props.BoolProperty(
+        name="Run in Background",
+        description="Create the keyframes in small time slices with a progress bar, keeping Blender responsive (Esc cancels and restores the previous animation)",
+        default=True,
+    )
 
     @classmethod
     def poll(cls, context):
@@ -2043,84 +2086,183 @@ class VisualiseWorkScheduleDateRange(bpy.types.Operator):
                 self.report({'ERROR'}, "Work schedule or animation settings are invalid.")
                 return {'CANCELLED'}
 
-            _clear_previous_animation(context)
+            attribute_mode = tool.Sequence.get_animation_props().appearance_mode == "ATTRIBUTES"
+            if attribute_mode:
+                # El modo por atributos detecta por sí mismo si solo cambió el rango
+                incremental = self.incremental and tool.Sequence.can_update_attribute_animation()
+            else:
+                incremental = self.incremental and tool.Sequence.can_animate_incrementally(settings)
+            # El modo por atributos ya es O(n) escrituras: solo se trocea el horneado de keyframes
+            chunked = self.chunked and not attribute_mode and context.window is not None
+
+            if chunked:
+                # Textos y barras se rehacen al terminar; hasta entonces se conservan por si se cancela
+                self._snapshot = tool.Sequence.snapshot_animation_state()
+                if not incremental:
+                    _clear_product_animation()
+            elif incremental:
+                # Solo textos/barras; los objetos se reescriben según el diff
+                tool.Sequence.clear_objects_animation(include_blender_objects=False)
+            else:
+                _clear_previous_animation(context)
 
             product_frames = tool.Sequence.get_animation_product_frames_enhanced(work_schedule, settings)
             if not product_frames:
                 self.report({'WARNING'}, "No products found to animate.")
 
-            tool.Sequence.animate_objects_with_profiles(settings, product_frames)
-            tool.Sequence.add_text_animation_handler(settings)
-            tool.Sequence.set_object_shading()
-            bpy.context.scene.frame_start = settings["start_frame"]
-            bpy.context.scene.frame_end = int(settings["start_frame"] + settings["total_frames"])
-
-            # --- 2. LÓGICA DE CÁMARA CORREGIDA ---
-            # --- 2. LÓGICA DE CÁMARA CORREGIDA ---
-            if self.camera_action != 'NONE':
-                existing_cam = next((obj for obj in bpy.data.objects if "4D_Animation_Camera" in obj.name), None)
-
-                if self.camera_action == 'UPDATE':
-                    if existing_cam:
-                        self.report({'INFO'}, f"Updating existing camera: {existing_cam.name}")
-                        # CORRECCIÓN: Llamar a la función solo con el objeto cámara.
-                        tool.Sequence.update_animation_camera(existing_cam)
-                    else:
-                        self.report({'INFO'}, "No existing camera to update. Creating a new one instead.")
-                        # CORRECCIÓN: Llamar a la función sin argumentos.
-                        tool.Sequence.add_animation_camera()
-                elif self.camera_action == 'CREATE_NEW':
-                    self.report({'INFO'}, "Creating a new 4D camera.")
-                    # CORRECCIÓN: Llamar a la función sin argumentos.
-                    tool.Sequence.add_animation_camera()
+            if chunked:
+                return self._start_job(context, settings, product_frames, incremental)
 
-                        # --- CONFIGURACIÓN AUTOMÁTICA DEL HUD (Sistema Dual) ---
-            try:
-                if settings and settings.get("start") and settings.get("finish"):
-                    print("🎬 Auto-configuring HUD Compositor for high-quality renders...")
-                    bpy.ops.bim.setup_hud_compositor()
-                    print("✅ HUD Compositor auto-configured successfully")
-                    print("📹 Regular renders (Ctrl+F12) will now include HUD overlay")
-                else: # Fallback al HUD de Viewport si no hay timeline
-                    bpy.ops.bim.enable_schedule_hud()
-            except Exception as e:
-                print(f"⚠️ Auto-setup of HUD failed: {e}. Falling back to Viewport HUD.")
-                try:
-                    bpy.ops.bim.enable_schedule_hud()
-                except Exception:
-                    pass
-            
-            # <-- INICIO DE LA CORRECCIÓN DE VISIBILIDAD DE TEXTOS 3D -->
-            try:
-                anim_props = tool.Sequence.get_animation_props()
-                camera_props = anim_props.camera_orbit
-                collection = bpy.data.collections.get("Schedule_Display_Texts")
-                
-                if collection:
-                    # Sincroniza la visibilidad de la colección con el estado del checkbox.
-                    # Si show_3d_schedule_texts es False, hide_viewport debe ser True.
-                    should_hide = not getattr(camera_props, "show_3d_schedule_texts", False)
-                    collection.hide_viewport = should_hide
-                    collection.hide_render = should_hide
-                    
-                    # Forzar redibujado de la vista 3D para que el cambio sea inmediato.
-                    for window in context.window_manager.windows:
-                        for area in window.screen.areas:
-                            if area.type == 'VIEW_3D':
-                                area.tag_redraw()
-            except Exception as e:
-                print(f"⚠️ Could not sync 3D text visibility: {e}")
-            # <-- FIN DE LA CORRECCIÓN -->
+            if attribute_mode:
+                rewritten = tool.Sequence.animate_objects_with_attributes(settings, product_frames)
+            else:
+                rewritten = tool.Sequence.animate_objects_with_profiles(
+                    settings, product_frames, incremental=incremental, share_actions=self.share_actions
+                )
+            return self._finish_animation(context, settings, product_frames, rewritten, incremental)
 
-            self.report({'INFO'}, f"Animation created successfully for {len(product_frames)} products.")
-            return {'FINISHED'}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.report({'ERROR'}, f"Animation failed: {str(e)}")
+            return {'CANCELLED'}
+
+    # --- Creación troceada (modal + timer) ---
+    def _start_job(self, context, settings, product_frames, incremental):
+        wm = context.window_manager
+        self._steps = tool.Sequence.iter_animate_objects_with_profiles(
+            settings, product_frames, incremental, self.share_actions
+        )
+        self._job = (settings, product_frames, incremental)
+        self._chunk = JOB_INITIAL_CHUNK
+        self._total = len(bpy.data.objects)
+        wm.progress_begin(0, self._total)
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            return self._cancel_job(context)
+        if event.type != 'TIMER':
+            # Deja navegar la vista mientras se crea la animación
+            return {'PASS_THROUGH'}
+
+        settings, product_frames, incremental = self._job
+        tick_start = time.perf_counter()
+        done = 0
+        try:
+            for _ in range(self._chunk):
+                done, self._total = next(self._steps)
+        except StopIteration as stop:
+            self._end_job(context)
+            try:
+                # Ahora sí: rehacer textos y barras del cronograma
+                tool.Sequence.clear_objects_animation(include_blender_objects=False)
+                return self._finish_animation(context, settings, product_frames, stop.value, incremental)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                self.report({'ERROR'}, f"Animation failed: {str(e)}")
+                return {'CANCELLED'}
         except Exception as e:
             import traceback
             traceback.print_exc()
+            self._cancel_job(context)
             self.report({'ERROR'}, f"Animation failed: {str(e)}")
             return {'CANCELLED'}
 
+        self._chunk = _adapt_chunk_size(self._chunk, time.perf_counter() - tick_start)
+        context.window_manager.progress_update(done)
+        context.workspace.status_text_set(
+            f"Creating 4D animation: {done}/{self._total} objects ({self._chunk} per tick) - Esc to cancel"
+        )
+        return {'RUNNING_MODAL'}
+
+    def _end_job(self, context):
+        wm = context.window_manager
+        if getattr(self, "_timer", None):
+            wm.event_timer_remove(self._timer)
+            self._timer = None
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def _cancel_job(self, context):
+        self._end_job(context)
+        self._steps.close()
+        tool.Sequence.restore_animation_state(self._snapshot)
+        self.report({'WARNING'}, "4D animation cancelled. Previous animation restored.")
+        return {'CANCELLED'}
+
+    def _finish_animation(self, context, settings, product_frames, rewritten, incremental):
+        tool.Sequence.add_text_animation_handler(settings)
+        tool.Sequence.set_object_shading()
+        bpy.context.scene.frame_start = settings["start_frame"]
+        bpy.context.scene.frame_end = int(settings["start_frame"] + settings["total_frames"])
+
+        # --- 2. LÓGICA DE CÁMARA CORREGIDA ---
+        # --- 2. LÓGICA DE CÁMARA CORREGIDA ---
+        if self.camera_action != 'NONE':
+            existing_cam = next((obj for obj in bpy.data.objects if "4D_Animation_Camera" in obj.name), None)
+
+            if self.camera_action == 'UPDATE':
+                if existing_cam:
+                    self.report({'INFO'}, f"Updating existing camera: {existing_cam.name}")
+                    # CORRECCIÓN: Llamar a la función solo con el objeto cámara.
+                    tool.Sequence.update_animation_camera(existing_cam)
+                else:
+                    self.report({'INFO'}, "No existing camera to update. Creating a new one instead.")
+                    # CORRECCIÓN: Llamar a la función sin argumentos.
+                    tool.Sequence.add_animation_camera()
+            elif self.camera_action == 'CREATE_NEW':
+                self.report({'INFO'}, "Creating a new 4D camera.")
+                # CORRECCIÓN: Llamar a la función sin argumentos.
+                tool.Sequence.add_animation_camera()
+
+                    # --- CONFIGURACIÓN AUTOMÁTICA DEL HUD (Sistema Dual) ---
+        try:
+            if settings and settings.get("start") and settings.get("finish"):
+                print("🎬 Auto-configuring HUD Compositor for high-quality renders...")
+                bpy.ops.bim.setup_hud_compositor()
+                print("✅ HUD Compositor auto-configured successfully")
+                print("📹 Regular renders (Ctrl+F12) will now include HUD overlay")
+            else: # Fallback al HUD de Viewport si no hay timeline
+                bpy.ops.bim.enable_schedule_hud()
+        except Exception as e:
+            print(f"⚠️ Auto-setup of HUD failed: {e}. Falling back to Viewport HUD.")
+            try:
+                bpy.ops.bim.enable_schedule_hud()
+            except Exception:
+                pass
+        
+        # <-- INICIO DE LA CORRECCIÓN DE VISIBILIDAD DE TEXTOS 3D -->
+        try:
+            anim_props = tool.Sequence.get_animation_props()
+            camera_props = anim_props.camera_orbit
+            collection = bpy.data.collections.get("Schedule_Display_Texts")
+            
+            if collection:
+                # Sincroniza la visibilidad de la colección con el estado del checkbox.
+                # Si show_3d_schedule_texts es False, hide_viewport debe ser True.
+                should_hide = not getattr(camera_props, "show_3d_schedule_texts", False)
+                collection.hide_viewport = should_hide
+                collection.hide_render = should_hide
+                
+                # Forzar redibujado de la vista 3D para que el cambio sea inmediato.
+                for window in context.window_manager.windows:
+                    for area in window.screen.areas:
+                        if area.type == 'VIEW_3D':
+                            area.tag_redraw()
+        except Exception as e:
+            print(f"⚠️ Could not sync 3D text visibility: {e}")
+        # <-- FIN DE LA CORRECCIÓN -->
+
+        if incremental:
+            self.report({'INFO'}, f"Incremental update: {rewritten} of {len(product_frames)} products rewritten.")
+        else:
+            self.report({'INFO'}, f"Animation created successfully for {len(product_frames)} products.")
+        return {'FINISHED'}
+
     def invoke(self, context, event):
         # CORRECCIÓN: La búsqueda de la cámara es más robusta.
         existing_cam = next((obj for obj in bpy.data.objects if "4D_Animation_Camera" in obj.name), None)
@@ -2139,6 +2281,9 @@ class VisualiseWorkScheduleDateRange(bpy.types.Operator):
         layout.label(text="An existing 4D camera was found.")
         layout.label(text="What would you like to do with the camera?")
         layout.prop(self, "camera_action", expand=True)
+        layout.prop(self, "incremental")
+        layout.prop(self, "share_actions")
+        layout.prop(self, "chunked")
 
 class CreateAnimation(bpy.types.Operator, tool.Ifc.Operator):
     bl_idname = "bim.create_animation"
@@ -2285,6 +2430,15 @@ class SnapshotWithProfiles(tool.Ifc.Operator, bpy.types.Operator):
                 pass
         except Exception:
             snap_group = 'DEFAULT'
+        # Perfil por tarea compuesto desde el Animation Stack, resuelto una sola vez
+        profile_resolver = _seq_data.TaskProfileResolver.for_animation(anim_props, fallback_group=snap_group)
+
+        # Elegir, de forma vectorizada, la fila y el estado de cada producto en el frame actual
+        frame_table = _seq_frames.ProductFrameTable.from_mapping(
+            product_frames, int(settings["start_frame"]), int(settings["start_frame"] + settings["total_frames"])
+        )
+        picked_rows, picked_states = frame_table.pick_rows_at(cur_frame, prefer_active=True)
+        picks = dict(zip(frame_table.products.tolist(), zip(picked_rows.tolist(), picked_states.tolist())))
 
         # Cache original colors
         original_colors = {}
@@ -2306,51 +2460,25 @@ class SnapshotWithProfiles(tool.Ifc.Operator, bpy.types.Operator):
                     pass
                 continue
             pid = element.id() if hasattr(element, "id") else None
-            if pid is None or pid not in product_frames:
+            if pid is None or pid not in picks:
                 continue
 
             original_color = original_colors.get(obj.name, [1.0, 1.0, 1.0, 1.0])
-            frames_list = product_frames[pid]
-            # choose the frame_data whose interval covers current frame; fallback to closest
-            frame_data = None
-            for fd in frames_list:
-                st = fd.get("states", {}).get("active", (0, -1))
-                if st[0] <= cur_frame <= st[1]:
-                    frame_data = fd; break
-            if frame_data is None:
-                # Check before_start then after_end
-                for key in ("before_start", "after_end"):
-                    st = frames_list[0].get("states", {}).get(key, (0, -1))
-                    if st[0] <= cur_frame <= st[1]:
-                        frame_data = frames_list[0]; break
-            if frame_data is None:
-                frame_data = frames_list[0]
+            # Fila cuyo estado activo cubre el frame actual (o la primera del producto)
+            row, state_code = picks[pid]
+            frame_data = frame_table.frame_data(row)
 
             # Resolve a profile by task assignment first; else by group+predefined; else generic
             task = frame_data.get("task") or tool.Ifc.get().by_id(frame_data.get("task_id"))
-            profile = None
             try:
-                profile = tool.Sequence.get_assigned_profile_for_task(task, anim_props, snap_group)
+                profile = profile_resolver.get(task)
             except Exception:
-                pass
-            if not profile:
-                try:
-                    predefined_type = (task.PredefinedType if task else None) or "NOTDEFINED"
-                except Exception:
-                    predefined_type = "NOTDEFINED"
-                try:
-                    profile = tool.Sequence.load_profile_from_group(snap_group, predefined_type)
-                except Exception:
-                    profile = None
-                if not profile:
-                    profile = tool.Sequence.create_generic_profile(predefined_type)
+                profile = tool.Sequence.create_generic_profile("NOTDEFINED")
 
             # Derive state at current frame
-            state = "end"
-            st_map = frame_data.get("states", {})
-            if "before_start" in st_map and st_map["before_start"][0] <= cur_frame <= st_map["before_start"][1]:
+            if state_code == _seq_frames.STATE_BEFORE_START:
                 state = "start"
-            elif "active" in st_map and st_map["active"][0] <= cur_frame <= st_map["active"][1]:
+            elif state_code == _seq_frames.STATE_ACTIVE:
                 state = "in_progress"
             else:
                 state = "end"
@@ -2583,11 +2711,22 @@ class RemoveTaskColumn(bpy.types.Operator):
 class SetTaskSortColumn(bpy.types.Operator):
     bl_idname = "bim.set_task_sort_column"
     bl_label = "Set Task Sort Column"
+    bl_description = "Sort tasks by this column.\nSHIFT+Click to add it as a tie-breaker after the current sort columns"
     bl_options = {"REGISTER", "UNDO"}
     column: bpy.props.StringProperty()
+    is_additive: bpy.props.BoolProperty(name="Add Sort Column", default=False, options={"SKIP_SAVE"})
+
+    def invoke(self, context, event):
+        self.is_additive = event.shift
+        return self.execute(context)
 
     def execute(self, context):
-        core.set_task_sort_column(tool.Sequence, self.column)
+        column = self.column
+        if self.is_additive:
+            props = tool.Sequence.get_work_schedule_props()
+            columns = [c for c in props.sort_column.split(",") if c and c != self.column]
+            column = ",".join(columns + [self.column])
+        core.set_task_sort_column(tool.Sequence, column)
         return {"FINISHED"}
 
 class CalculateTaskDuration(bpy.types.Operator, tool.Ifc.Operator):
@@ -2607,7 +2746,8 @@ class ExpandAllTasks(bpy.types.Operator, tool.Ifc.Operator):
     product_type: bpy.props.StringProperty()
 
     def _execute(self, context):
-        core.expand_all_tasks(tool.Sequence)
+        if not tool.Sequence.expand_all_task_rows():
+            core.expand_all_tasks(tool.Sequence)
 
 class ContractAllTasks(bpy.types.Operator, tool.Ifc.Operator):
     bl_idname = "bim.contract_all_tasks"
@@ -2617,7 +2757,8 @@ class ContractAllTasks(bpy.types.Operator, tool.Ifc.Operator):
     product_type: bpy.props.StringProperty()
 
     def _execute(self, context):
-        core.contract_all_tasks(tool.Sequence)
+        if not tool.Sequence.contract_all_task_rows():
+            core.contract_all_tasks(tool.Sequence)
 
 class AddTaskBars(bpy.types.Operator):
     bl_idname = "bim.add_task_bars"
@@ -2740,6 +2881,7 @@ class CopyTask(bpy.types.Operator, tool.Ifc.Operator):
     task: bpy.props.IntProperty()
 
     def _execute(self, context):
+        _seq_data.ScheduleGraphIndex.invalidate()
         core.duplicate_task(tool.Ifc, tool.Sequence, task=tool.Ifc.get().by_id(self.task))
 
 class LoadProductTasks(bpy.types.Operator):
@@ -2793,6 +2935,8 @@ class GoToTask(bpy.types.Operator):
         r = core.go_to_task(tool.Sequence, task=tool.Ifc.get().by_id(self.task))
         if isinstance(r, str):
             self.report({"WARNING"}, r)
+        elif self.task not in _seq_data.TaskTreeWindow.rows:
+            self.report({"WARNING"}, "Task is not in the active work schedule or is hidden by the task filters")
         return {"FINISHED"}
 
 class SelectWorkScheduleProducts(bpy.types.Operator):
@@ -3018,8 +3162,8 @@ class RemoveAppearanceProfile(bpy.types.Operator):
         try:
             anim = tool.Sequence.get_animation_props()
             current_group = getattr(anim, "profile_groups", "") or ""
-            tprops = tool.Sequence.get_task_tree_props()
-            for t in getattr(tprops, "tasks", []):
+            # Incluye las tareas fuera de la ventana materializada del árbol
+            for t in tool.Sequence.iter_all_task_items():
                 for entry in getattr(t, "profile_group_choices", []):
                     if entry.group_name == current_group and getattr(entry, 'selected_profile', "") == target_name:
                         in_use += 1
@@ -3266,13 +3410,9 @@ class ImportAppearanceProfileSetFromFile(bpy.types.Operator, ImportHelper):
         # Store into the internal Scene JSON dictionary so it appears as a Group option
         try:
             scene = context.scene
-            key = "BIM_AppearanceProfileSets"
-            raw = scene.get(key, "{}")
-            container = json.loads(raw) if isinstance(raw, str) else (raw or {})
-            if not isinstance(container, dict):
-                container = {}
+            container = _seq_data.ProfileStore.load(scene, copy=True)
             container[set_name] = {"profiles": profile_data}
-            scene[key] = json.dumps(container)
+            _seq_data.ProfileStore.write(container, scene)
         except Exception:
             pass
 
@@ -3537,10 +3677,8 @@ class BIM_OT_cleanup_profile_groups(bpy.types.Operator):
 
     def execute(self, context):
         scn = context.scene
-        key = "BIM_AppearanceProfileSets"
         try:
-            sets = scn.get(key, "{}")
-            sets = json.loads(sets) if isinstance(sets, str) else (sets or {})
+            sets = _seq_data.ProfileStore.load(scn)
         except Exception:
             sets = {}
         valid_groups = set(sets.keys()) if isinstance(sets, dict) else set()
@@ -3879,7 +4017,7 @@ class BIM_OT_fix_profile_hide_at_end_immediate(bpy.types.Operator):
         # Save back if modified
         if changed:
             try:
-                context.scene["BIM_AppearanceProfileSets"] = json.dumps(data, ensure_ascii=False)
+                _seq_data.ProfileStore.write(data, context.scene, ensure_ascii=False)
             except Exception as e:
                 print("⚠️ Failed to guardar JSON de perfiles:", e)
         for nm in sorted(DEMO_KEYS):
@@ -4073,22 +4211,24 @@ class InitializeProfileSystem(bpy.types.Operator):
             UnifiedProfileManager.ensure_default_group(context)
 
             # 2. Inicializar asignaciones para todas las tareas
-            tprops = tool.Sequence.get_task_tree_props()
             initialized_count = 0
 
-            for task_item in tprops.tasks:
-                try:
-                    # Asegurar que tiene la estructura de profile_group_choices
-                    if not hasattr(task_item, 'profile_group_choices'):
-                        continue
+            # Una sola lectura/escritura del JSON de perfiles para todas las tareas,
+            # incluidas las que están fuera de la ventana materializada del árbol
+            with UnifiedProfileManager.batch(context):
+                for task_item in tool.Sequence.iter_all_task_items(include_unloaded=True):
+                    try:
+                        # Asegurar que tiene la estructura de profile_group_choices
+                        if not hasattr(task_item, 'profile_group_choices'):
+                            continue
 
-                    # Sincronizar con DEFAULT
-                    UnifiedProfileManager.sync_default_group_to_predefinedtype(context, task_item)
-                    initialized_count += 1
+                        # Sincronizar con DEFAULT
+                        UnifiedProfileManager.sync_default_group_to_predefinedtype(context, task_item)
+                        initialized_count += 1
 
-                except Exception as e:
-                    print(f"Error initializing task {task_item.ifc_definition_id}: {e}")
-                    continue
+                    except Exception as e:
+                        print(f"Error initializing task {task_item.ifc_definition_id}: {e}")
+                        continue
 
             self.report({'INFO'}, f"Profile system initialized. {initialized_count} tasks processed.")
             return {'FINISHED'}
@@ -4799,6 +4939,15 @@ class SnapshotWithProfilesFixed(tool.Ifc.Operator, bpy.types.Operator):
             except Exception as group_error:
                 print(f"Warning: Group determination failed, using DEFAULT: {group_error}")
                 snap_group = 'DEFAULT'
+            # Perfil por tarea compuesto desde el Animation Stack, resuelto una sola vez
+            profile_resolver = _seq_data.TaskProfileResolver.for_animation(anim_props, fallback_group=snap_group)
+
+            # Elegir, de forma vectorizada, la fila y el estado de cada producto en el frame actual
+            frame_table = _seq_frames.ProductFrameTable.from_mapping(
+                product_frames, int(settings["start_frame"]), int(settings["start_frame"] + settings["total_frames"])
+            )
+            picked_rows, picked_states = frame_table.pick_rows_at(int(cur_frame), prefer_active=False)
+            picks = dict(zip(frame_table.products.tolist(), zip(picked_rows.tolist(), picked_states.tolist())))
 
             # Cache original colors
             original_colors = {}
@@ -4831,60 +4980,29 @@ class SnapshotWithProfilesFixed(tool.Ifc.Operator, bpy.types.Operator):
                         pid = element.id() if hasattr(element, "id") else None
                     except Exception:
                         pid = None
-                    if pid is None or pid not in product_frames:
+                    if pid is None or pid not in picks:
                         continue
 
                     original_color = original_colors.get(obj.name, [1.0, 1.0, 1.0, 1.0])
-                    frames_list = product_frames[pid]
 
                     # Find appropriate frame data for current frame
-                    frame_data = None
-                    for fd in frames_list:
-                        states = fd.get("states", {})
-                        for state_name, (start, end) in states.items():
-                            if start <= cur_frame <= end:
-                                frame_data = fd
-                                break
-                        if frame_data:
-                            break
-                    if not frame_data:
-                        frame_data = frames_list[0] if frames_list else None
-                    if not frame_data:
-                        continue
+                    row, state_code = picks[pid]
+                    frame_data = frame_table.frame_data(row)
 
                     # Resolve task and profile
                     task = frame_data.get("task") or tool.Ifc.get().by_id(frame_data.get("task_id", 0))
-                    profile = None
-                    try:
-                        if task:
-                            profile = tool.Sequence.get_assigned_profile_for_task(task, anim_props, snap_group)
-                    except Exception:
-                        profile = None
-                    if not profile:
-                        try:
-                            predefined_type = getattr(task, 'PredefinedType', 'NOTDEFINED') if task else 'NOTDEFINED'
-                            profile = tool.Sequence.load_profile_from_group(snap_group, predefined_type)
-                        except Exception:
-                            profile = None
-                    if not profile:
-                        try:
-                            predefined_type = getattr(task, 'PredefinedType', 'NOTDEFINED') if task else 'NOTDEFINED'
-                            profile = tool.Sequence.create_generic_profile(predefined_type)
-                        except Exception:
-                            continue
+                    if task:
+                        profile = profile_resolver.get(task)
+                    else:
+                        profile = tool.Sequence.create_generic_profile("NOTDEFINED")
 
                     # Determine state
-                    state = "end"
-                    states = frame_data.get("states", {})
-                    for state_name, (start, end) in states.items():
-                        if start <= cur_frame <= end:
-                            if state_name in ("before_start", "start"):
-                                state = "start"
-                            elif state_name == "active":
-                                state = "in_progress"
-                            else:
-                                state = "end"
-                            break
+                    if state_code == _seq_frames.STATE_BEFORE_START:
+                        state = "start"
+                    elif state_code == _seq_frames.STATE_ACTIVE:
+                        state = "in_progress"
+                    else:
+                        state = "end"
 
                     # Apply state
                     self._apply_profile_state(obj, profile, state, original_color, frame_data)
@@ -4952,6 +5070,190 @@ class SnapshotWithProfilesFixed(tool.Ifc.Operator, bpy.types.Operator):
 
 
 
+class ScrubSnapshotDate(bpy.types.Operator):
+    """Drag left/right in the viewport to move the snapshot date; only objects that change state are updated"""
+    bl_idname = "bim.scrub_snapshot_date"
+    bl_label = "Scrub Snapshot Date"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        props = tool.Sequence.get_work_schedule_props()
+        return bool(props.active_work_schedule_id and props.visualisation_start)
+
+    def invoke(self, context, event):
+        try:
+            tool.Sequence.sync_active_group_to_json()
+        except Exception as e:
+            print(f"Error syncing profiles for snapshot: {e}")
+
+        ws_props = tool.Sequence.get_work_schedule_props()
+        work_schedule = tool.Ifc.get().by_id(ws_props.active_work_schedule_id)
+        viz_start, viz_finish = tool.Sequence.get_visualization_date_range()
+        if not work_schedule or not viz_start:
+            self.report({'ERROR'}, "No active Work Schedule or start date configured for visualization")
+            return {'CANCELLED'}
+
+        # El snapshot borra los keyframes 4D: guardar la animación para poder
+        # restaurarla al cancelar (un modal cancelado no deja paso de deshacer)
+        self._saved_animation = tool.Sequence.snapshot_animation_state()
+        try:
+            tool.Sequence.begin_snapshot_scrub(work_schedule, viz_start, viz_start, viz_finish)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            tool.Sequence.end_snapshot_scrub()
+            tool.Sequence.restore_animation_state(self._saved_animation)
+            self.report({'ERROR'}, f"Snapshot failed: {str(e)}")
+            return {'CANCELLED'}
+
+        # Sin fecha de fin: recorrer hasta el último fin del cronograma
+        if not viz_finish:
+            finishes = tool.Sequence.snapshot_scrub_state["table"].finishes
+            # Las fechas del índice son segundos epoch de datetimes sin zona
+            viz_finish = datetime.utcfromtimestamp(int(finishes.max())) if len(finishes) else viz_start
+        self._range = (viz_start, viz_finish)
+        self._date = viz_start
+        self._mouse_x = event.mouse_x
+        self._width = max(1, context.region.width if context.region else 1000)
+        self._offset = 0.0
+        self._show_status(context, 0)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type in {'ESC', 'RIGHTMOUSE'} and event.value == 'PRESS':
+            self._end(context)
+            tool.Sequence.restore_animation_state(self._saved_animation)
+            return {'CANCELLED'}
+        # Solo PRESS: el RELEASE del clic que lanzó el operador no debe confirmar
+        if event.type in {'LEFTMOUSE', 'RET', 'NUMPAD_ENTER'} and event.value == 'PRESS':
+            self._end(context)
+            self.report({'INFO'}, f"Snapshot at {self._date.strftime('%Y-%m-%d')}")
+            return {'FINISHED'}
+
+        start, finish = self._range
+        span = finish - start
+        if event.type == 'MOUSEMOVE':
+            fraction = (event.mouse_x - self._mouse_x) / self._width + self._offset
+        elif event.type in {'LEFT_ARROW', 'RIGHT_ARROW'} and event.value == 'PRESS' and span.total_seconds() > 0:
+            # Paso de un día con las flechas
+            step = 86400.0 / span.total_seconds()
+            self._offset += step if event.type == 'RIGHT_ARROW' else -step
+            fraction = (event.mouse_x - self._mouse_x) / self._width + self._offset
+        else:
+            return {'RUNNING_MODAL'}
+
+        fraction = min(1.0, max(0.0, fraction))
+        date = start + span * fraction
+        if date != self._date:
+            self._date = date
+            changed = tool.Sequence.update_snapshot_scrub(date)
+            self._show_status(context, changed)
+        return {'RUNNING_MODAL'}
+
+    def _show_status(self, context, changed):
+        if context.area:
+            context.area.header_text_set(
+                f"Snapshot: {self._date.strftime('%Y-%m-%d')} ({changed} objects updated) - "
+                "Move mouse / arrows to scrub, LMB confirm, Esc cancel (restores the animation)"
+            )
+
+    def _end(self, context):
+        if context.area:
+            context.area.header_text_set(None)
+        tool.Sequence.end_snapshot_scrub()
+
+
+class ExportSnapshotSeries(bpy.types.Operator):
+    """Render one snapshot image per date (explicit list or recurrence) using a single schedule state index"""
+    bl_idname = "bim.export_snapshot_series"
+    bl_label = "Export Snapshot Series"
+    bl_options = {"REGISTER"}
+    directory: bpy.props.StringProperty(name="Output Folder", subtype="DIR_PATH", default="//snapshots/")
+    prefix: bpy.props.StringProperty(name="File Prefix", default="snapshot_")
+    dates: bpy.props.StringProperty(
+        name="Dates", description="Comma-separated dates (YYYY-MM-DD). If set, overrides the recurrence"
+    )
+    frequency: bpy.props.EnumProperty(
+        name="Every",
+        items=[("DAILY", "Day", ""), ("WEEKLY", "Week", ""), ("MONTHLY", "Month", "")],
+        default="WEEKLY",
+    )
+    interval: bpy.props.IntProperty(name="Interval", default=1, min=1)
+    weekday: bpy.props.EnumProperty(
+        name="Weekday",
+        items=[
+            ("MO", "Monday", ""), ("TU", "Tuesday", ""), ("WE", "Wednesday", ""), ("TH", "Thursday", ""),
+            ("FR", "Friday", ""), ("SA", "Saturday", ""), ("SU", "Sunday", ""),
+        ],
+        default="MO",
+    )
+    camera: bpy.props.StringProperty(name="Camera", description="Camera object name (empty: scene camera)")
+
+    @classmethod
+    def poll(cls, context):
+        props = tool.Sequence.get_work_schedule_props()
+        return bool(props.active_work_schedule_id)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "directory")
+        layout.prop(self, "prefix")
+        layout.prop_search(self, "camera", bpy.data, "objects")
+        layout.prop(self, "dates")
+        col = layout.column()
+        col.active = not self.dates.strip()
+        row = col.row(align=True)
+        row.prop(self, "interval")
+        row.prop(self, "frequency", text="")
+        if self.frequency == "WEEKLY":
+            col.prop(self, "weekday")
+
+    def execute(self, context):
+        ws_props = tool.Sequence.get_work_schedule_props()
+        work_schedule = tool.Ifc.get().by_id(ws_props.active_work_schedule_id)
+        if self.dates.strip():
+            try:
+                dates = [parser.isoparse(d.strip()) for d in self.dates.split(",") if d.strip()]
+            except ValueError as e:
+                self.report({'ERROR'}, f"Invalid date list: {e}")
+                return {'CANCELLED'}
+        else:
+            viz_start, viz_finish = tool.Sequence.get_visualization_date_range()
+            if not viz_start or not viz_finish:
+                self.report({'ERROR'}, "Set the visualization start and finish dates or give a date list")
+                return {'CANCELLED'}
+            dates = tool.Sequence.get_snapshot_series_dates(
+                viz_start, viz_finish, self.frequency, self.interval, self.weekday
+            )
+        if not dates:
+            self.report({'ERROR'}, "No dates to export")
+            return {'CANCELLED'}
+
+        camera = bpy.data.objects.get(self.camera) if self.camera else None
+        if self.camera and (not camera or camera.type != 'CAMERA'):
+            self.report({'ERROR'}, f"'{self.camera}' is not a camera")
+            return {'CANCELLED'}
+
+        try:
+            tool.Sequence.sync_active_group_to_json()
+        except Exception as e:
+            print(f"Error syncing profiles for snapshot: {e}")
+        try:
+            written = tool.Sequence.export_snapshot_series(work_schedule, dates, self.directory, camera, self.prefix)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.report({'ERROR'}, f"Snapshot export failed: {str(e)}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Exported {len(written)} snapshots to {bpy.path.abspath(self.directory)}")
+        return {'FINISHED'}
+
+
 class RefreshTaskOutputCounts(bpy.types.Operator):
     """Recalcula el número de 'Outputs' para todas las tareas en la lista."""
     bl_idname = "bim.refresh_task_output_counts"
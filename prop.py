@@ -18,7 +18,6 @@
 
 import bpy
 from bonsai.bim.module.sequence import helper
-import json
 import isodate
 import ifcopenshell.api
 import ifcopenshell.api.sequence
@@ -26,7 +25,7 @@ import ifcopenshell.util.attribute
 import ifcopenshell.util.date
 import bonsai.tool as tool
 import bonsai.core.sequence as core
-from bonsai.bim.module.sequence.data import SequenceData, AnimationColorSchemeData, refresh as refresh_sequence_data
+from bonsai.bim.module.sequence.data import SequenceData, AnimationColorSchemeData, DerivedDateIndex, ProfileStore, refresh as refresh_sequence_data
 import bonsai.bim.module.resource.data
 import bonsai.bim.module.pset.data
 from mathutils import Color
@@ -127,20 +126,21 @@ def update_task_checkbox_selection(self, context):
 # UNIFIED PROFILE MANAGER - CLASE CENTRAL PARA GESTIONAR PERFILES
 # ============================================================================
 class UnifiedProfileManager:
+    @staticmethod
+    def batch(context):
+        """Transacción sobre el JSON de perfiles: una lectura, muchas mutaciones, una escritura.
+
+        Uso: ``with UnifiedProfileManager.batch(context) as data: ...``. Las
+        rutinas de mantenimiento anidadas reutilizan la misma copia de trabajo.
+        """
+        return ProfileStore.transaction(context.scene)
+
     @staticmethod
     def ensure_default_group(context):
         """Asegura que el grupo DEFAULT existe con 13 perfiles predefinidos y propiedades completas."""
-        scene = context.scene
-        key = "BIM_AppearanceProfileSets"
-        raw = scene.get(key, "{}")
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-            if not isinstance(data, dict):
-                data = {}
-        except Exception:
-            data = {}
-        # Crear DEFAULT si no existe
-        if "DEFAULT" not in data:
+        if "DEFAULT" in ProfileStore.load(context.scene):
+            return ProfileStore.load(context.scene, copy=True)
+        with UnifiedProfileManager.batch(context) as data:
             default_profiles = [
                 {"name": "CONSTRUCTION", "start_color": [1,1,1,0], "in_progress_color": [0,1,0,1], "end_color": [0.3,1,0.3,1]},
                 {"name": "INSTALLATION", "start_color": [1,1,1,0], "in_progress_color": [0,0.8,0.5,1], "end_color": [0.3,0.8,0.5,1]},
@@ -172,32 +172,17 @@ class UnifiedProfileManager:
                     "end_transparency": 0.0
                 })
             data["DEFAULT"] = {"profiles": default_profiles}
-            scene[key] = json.dumps(data)
             print("✅ DEFAULT group created with 13 predefined profiles")
-        return data
+        return ProfileStore.load(context.scene, copy=True)
     
     @staticmethod
     def _read_sets_json(context):
-        """Lee de forma segura el JSON de perfiles desde la escena."""
-        import json
+        """Lee de forma segura el JSON de perfiles desde la escena (copia modificable)."""
         try:
-            scene = context.scene
-            key = "BIM_AppearanceProfileSets"
-            raw = scene.get(key, "{}")
-            data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-            return data if isinstance(data, dict) else {}
+            return ProfileStore.load(context.scene, copy=True)
         except Exception:
             return {}
 
-    @staticmethod
-    def _write_sets_json(context, data):
-        """Escribe de forma segura el JSON de perfiles en la escena."""
-        import json
-        try:
-            context.scene["BIM_AppearanceProfileSets"] = json.dumps(data)
-        except Exception:
-            pass
-
     @staticmethod
     def get_all_predefined_types(context) -> list:
         """Obtiene todos los PredefinedTypes de las tareas cargadas para asegurar que existan perfiles para ellos."""
@@ -225,13 +210,15 @@ class UnifiedProfileManager:
         """Asegura que un perfil especÃ­fico exista dentro de un grupo en el JSON."""
         if not group_name or not profile_name:
             return
-        data = UnifiedProfileManager._read_sets_json(context)
-        group = data.setdefault(group_name, {"profiles": []})
-        
-        # Usa un set para bÃºsqueda rÃ¡pida y evitar duplicados
-        existing_profiles = {p.get("name") for p in group.get("profiles", [])}
-
-        if profile_name not in existing_profiles:
+        # Camino rápido de solo lectura: no abrir transacción si el perfil ya existe
+        ProfileStore.load(context.scene)
+        if ProfileStore.get_profile_data(group_name, profile_name) is not None:
+            return
+        with UnifiedProfileManager.batch(context) as data:
+            group = data.setdefault(group_name, {"profiles": []})
+            profiles = group.setdefault("profiles", [])
+            if any(p.get("name") == profile_name for p in profiles):
+                return
             profile_payload = {
                 "name": profile_name, "start_color": [1,1,1,0], "in_progress_color": [0,1,0,1], 
                 "end_color": [0.7,0.7,0.7,1], "use_end_original_color": True,
@@ -241,16 +228,16 @@ class UnifiedProfileManager:
                 "start_transparency": 0.0, "active_start_transparency": 0.0, "active_finish_transparency": 0.0,
                 "active_transparency_interpol": 1.0, "end_transparency": 0.0
             }
-            group["profiles"].append(profile_payload)
-            UnifiedProfileManager._write_sets_json(context, data)
+            profiles.append(profile_payload)
             print(f"âœ… Perfil '{profile_name}' aÃ±adido al grupo '{group_name}'.")
 
     @staticmethod
     def ensure_default_group_has_predefined_types(context):
         """Garantiza que el grupo DEFAULT contenga un perfil para cada PredefinedType existente."""
         all_types = UnifiedProfileManager.get_all_predefined_types(context)
-        for p_type in all_types:
-            UnifiedProfileManager.ensure_profile_in_group(context, "DEFAULT", p_type)
+        with UnifiedProfileManager.batch(context):
+            for p_type in all_types:
+                UnifiedProfileManager.ensure_profile_in_group(context, "DEFAULT", p_type)
 
     @staticmethod
     def sync_default_group_to_predefinedtype(context, task_pg):
@@ -298,13 +285,17 @@ class UnifiedProfileManager:
             if not tprops or not hasattr(tprops, 'tasks'):
                 return False
             
-            # Asegurar primero que todos los perfiles necesarios existan.
-            UnifiedProfileManager.ensure_default_group_has_predefined_types(context)
-
-            for task in tprops.tasks:
-                UnifiedProfileManager.sync_default_group_to_predefinedtype(context, task)
+            synced = 0
+            with UnifiedProfileManager.batch(context):
+                # Asegurar primero que todos los perfiles necesarios existan.
+                UnifiedProfileManager.ensure_default_group_has_predefined_types(context)
+
+                # Todas las filas del árbol, no solo la ventana materializada
+                for task in tool.Sequence.iter_all_task_items(include_unloaded=True):
+                    UnifiedProfileManager.sync_default_group_to_predefinedtype(context, task)
+                    synced += 1
             
-            print(f"âœ… Sincronizados {len(tprops.tasks)} tareas con el perfil DEFAULT.")
+            print(f"âœ… Sincronizados {synced} tareas con el perfil DEFAULT.")
             return True
         except Exception as e:
             print(f"â Œ Error al inicializar perfiles DEFAULT para todas las tareas: {e}")
@@ -457,11 +448,13 @@ class UnifiedProfileManager:
     @staticmethod
     def cleanup_invalid_mappings(context):
         """Cleans up all invalid profile mappings"""
-        valid_groups = set(UnifiedProfileManager._read_sets_json(context).keys())
+        valid_groups = set(ProfileStore.load(context.scene))
+        # Perfiles válidos por grupo, calculados una sola vez y no por tarea
+        valid_profiles: Dict[str, Set[str]] = {}
     
         try:
-            tprops = tool.Sequence.get_task_tree_props()
-            for task in getattr(tprops, "tasks", []):
+            # Incluye las tareas fuera de la ventana materializada del árbol
+            for task in tool.Sequence.iter_all_task_items():
                 if hasattr(task, 'profile_group_choices'):
                     # Collect indices to remove
                     to_remove = []
@@ -470,7 +463,10 @@ class UnifiedProfileManager:
                             to_remove.append(idx)
                         else:
                             # Validate profile within the group
-                            profiles = UnifiedProfileManager.get_group_profiles(context, choice.group_name)
+                            profiles = valid_profiles.get(choice.group_name)
+                            if profiles is None:
+                                profiles = set(UnifiedProfileManager.get_group_profiles(context, choice.group_name))
+                                valid_profiles[choice.group_name] = profiles
                             if choice.selected_profile and choice.selected_profile not in profiles:
                                 choice.selected_profile = ""
                 
@@ -564,48 +560,47 @@ def get_custom_group_profile_items(self, context):
     """
     Gets profile items ONLY from the selected custom group (excludes DEFAULT).
     This version reads directly from the JSON and is more lenient to allow UI selection
-    even if profile data is incomplete.
+    even if profile data is incomplete. Items are cached per group and profile-store version.
     """
-    items = []
-    try:
-        anim_props = tool.Sequence.get_animation_props()
-        selected_group = getattr(anim_props, "task_profile_group_selector", "")
-        
+    anim_props = tool.Sequence.get_animation_props()
+    selected_group = getattr(anim_props, "task_profile_group_selector", "")
+
+    def build(all_sets):
+        items = []
         if selected_group and selected_group != "DEFAULT":
             # Lectura directa y flexible desde el JSON
-            all_sets = UnifiedProfileManager._read_sets_json(context)
             group_data = all_sets.get(selected_group, {})
-            profiles_list = group_data.get("profiles", [])
-            
-            profile_names = []
-            for profile in profiles_list:
-                if isinstance(profile, dict) and "name" in profile:
-                    profile_names.append(profile["name"])
-            
+            profiles_list = group_data.get("profiles", []) if isinstance(group_data, dict) else []
+            profile_names = [p["name"] for p in profiles_list if isinstance(p, dict) and "name" in p]
             for i, name in enumerate(sorted(profile_names)):
                 items.append((name, name, f"Profile from {selected_group}", i))
-    
-    except Exception as e:
-        print(f"Error getting custom group profiles: {e}")
-        items.append(("", "<error loading profiles>", "", 0))
 
-    if not items:
-        anim_props = tool.Sequence.get_animation_props()
-        selected_group = getattr(anim_props, "task_profile_group_selector", "")
-        if not selected_group:
-            items.append(("", "<select custom group first>", "", 0))
-        elif selected_group == "DEFAULT":
-            items.append(("", "<DEFAULT not allowed here>", "", 0))
-        else:
-            items.append(("", f"<no profiles in {selected_group}>", "", 0))
-            
-    return items
+        if not items:
+            if not selected_group:
+                items.append(("", "<select custom group first>", "", 0))
+            elif selected_group == "DEFAULT":
+                items.append(("", "<DEFAULT not allowed here>", "", 0))
+            else:
+                items.append(("", f"<no profiles in {selected_group}>", "", 0))
+        return items
+
+    try:
+        return ProfileStore.get_enum_items(("custom_group_profiles", selected_group), build, context.scene)
+    except Exception:
+        return _PROFILE_ENUM_ERROR_ITEMS
+
+
+def update_task_window_start(self, context):
+    tool.Sequence.materialize_task_window(self.task_window_start)
+
 
 def update_active_task_index(self, context):
     """
     Updates active task index, synchronizes profiles,
     and selects associated 3D objects in the viewport (for single click).
     """
+    # Si la fila activa está cerca del borde de la ventana materializada, desplazarla
+    tool.Sequence.scroll_task_window_to_active()
     task_ifc = tool.Sequence.get_highlighted_task()
     self.highlighted_task_id = task_ifc.id() if task_ifc else 0
     tool.Sequence.update_task_ICOM(task_ifc)
@@ -804,6 +799,7 @@ def updateTaskTimeDateTime(self: "Task", context: bpy.types.Context, startfinish
         task_time=task_time,
         attributes={startfinish_key: startfinish_datetime},
     )
+    DerivedDateIndex.invalidate()
     SequenceData.load()
     bpy.ops.bim.load_task_properties()
 
@@ -832,6 +828,7 @@ def updateTaskDuration(self: "Task", context: bpy.types.Context) -> None:
         task_time=task_time,
         attributes={"ScheduleDuration": duration},
     )
+    DerivedDateIndex.invalidate()
     core.load_task_properties(tool.Sequence)
     tool.Sequence.refresh_task_resources()
 
@@ -975,50 +972,61 @@ def get_saved_color_schemes(self, context):
     return AnimationColorSchemeData.data.get("saved_color_schemes", [])
 
 
+# Fallbacks a nivel de módulo: Blender necesita que las listas de items sigan referenciadas
+_PROFILE_ENUM_ERROR_ITEMS = [("", "<error loading profiles>", "", 0)]
+_INTERNAL_PROFILE_SETS_FALLBACK = [("", "<no profile groups>", "Create or load profile groups")]
+_ALL_GROUPS_FALLBACK = [("DEFAULT", "DEFAULT", "Auto-managed default group", 0)]
+_USER_GROUPS_FALLBACK = [("", "<no custom groups>", "Create custom groups in the Appearance Profiles panel")]
+
+
+def _build_internal_profile_sets_items(all_sets):
+    all_groups = sorted(all_sets.keys())
+    if not all_groups:
+        return _INTERNAL_PROFILE_SETS_FALLBACK
+    # Ensure "DEFAULT" appears first for convenience
+    if "DEFAULT" in all_groups:
+        all_groups.remove("DEFAULT")
+        all_groups.insert(0, "DEFAULT")
+    return [(name, name, f"Profile group: {name}") for name in all_groups]
+
+
+def _build_all_groups_items(all_sets):
+    items = []
+    for i, group in enumerate(sorted(all_sets.keys())):
+        desc = "Auto-managed profiles by PredefinedType" if group == "DEFAULT" else "Custom profile group"
+        items.append((group, group, desc, i))
+    return items or _ALL_GROUPS_FALLBACK
+
+
+def _build_user_created_groups_items(all_sets):
+    user_groups = sorted(g for g in all_sets.keys() if g != "DEFAULT")
+    if user_groups:
+        return [(name, name, f"Profile group: {name}") for name in user_groups]
+    return _USER_GROUPS_FALLBACK
+
+
 def get_internal_profile_sets_enum(self, context):
-    """Gets enum of ALL available profile groups, including DEFAULT."""
-    from bonsai.bim.module.sequence.prop import UnifiedProfileManager
+    """Gets enum of ALL available profile groups, including DEFAULT (cached per profile-store version)."""
     try:
-        # Get all groups directly from the source
-        all_groups = sorted(list(UnifiedProfileManager._read_sets_json(context).keys()))
-        
-        if all_groups:
-            # Ensure "DEFAULT" appears first for convenience
-            if "DEFAULT" in all_groups:
-                all_groups.remove("DEFAULT")
-                all_groups.insert(0, "DEFAULT")
-            return [(name, name, f"Profile group: {name}") for name in all_groups]
+        return ProfileStore.get_enum_items("internal_profile_sets", _build_internal_profile_sets_items, context.scene)
     except Exception:
-        pass
-    
-    # Fallback if no groups are found
-    return [("", "<no profile groups>", "Create or load profile groups")]
-
+        return _INTERNAL_PROFILE_SETS_FALLBACK
 
 
 def get_all_groups_enum(self, context):
-    """Enum para todos los grupos (incluyendo DEFAULT)."""
+    """Enum para todos los grupos (incluyendo DEFAULT), cacheado por versión del ProfileStore."""
     try:
-        groups = UnifiedProfileManager.get_all_groups(context)
-        items = []
-        for i, group in enumerate(sorted(groups)):
-            desc = "Auto-managed profiles by PredefinedType" if group == "DEFAULT" else "Custom profile group"
-            items.append((group, group, desc, i))
-        return items if items else [("DEFAULT", "DEFAULT", "Auto-managed default group", 0)]
+        return ProfileStore.get_enum_items("all_groups", _build_all_groups_items, context.scene)
     except Exception:
-        return [("DEFAULT", "DEFAULT", "Auto-managed default group", 0)]
+        return _ALL_GROUPS_FALLBACK
 
 
 def get_user_created_groups_enum(self, context):
-    """Returns EnumProperty items for user-created groups, excluding 'DEFAULT'."""
-    from bonsai.bim.module.sequence.prop import UnifiedProfileManager
+    """Returns EnumProperty items for user-created groups, excluding 'DEFAULT' (cached per profile-store version)."""
     try:
-        user_groups = UnifiedProfileManager.get_user_created_groups(context)
-        if user_groups:
-            return [(name, name, f"Profile group: {name}") for name in user_groups]
+        return ProfileStore.get_enum_items("user_created_groups", _build_user_created_groups_items, context.scene)
     except Exception:
-        pass
-    return [("", "<no custom groups>", "Create custom groups in the Appearance Profiles panel")]
+        return _USER_GROUPS_FALLBACK
 
 
 def update_task_profile_group_selector(self, context):
@@ -1182,20 +1190,17 @@ def cleanup_all_tasks_profile_mappings(context):
     between Bonsai versions, it silently returns.
     """
     try:
-        # Reuse our UPM persistence hooks; if no data, nothing to do
-        data = UnifiedProfileManager._read_sets_json(context)
-        if not isinstance(data, dict):
-            return
-        # Optionally prune obviously empty groups/entries if they appear as None/[]
-        for gkey, gval in list(data.items()):
-            if gval is None or gval == {}:
-                del data[gkey]
-                continue
-            if isinstance(gval, dict):
-                for pkey, plist in list(gval.items()):
-                    if plist in (None, [], {}, "null"):
-                        del gval[pkey]
-        UnifiedProfileManager._write_sets_json(context, data)
+        # Single read/write; the transaction skips the write if nothing was pruned
+        with UnifiedProfileManager.batch(context) as data:
+            # Optionally prune obviously empty groups/entries if they appear as None/[]
+            for gkey, gval in list(data.items()):
+                if gval is None or gval == {}:
+                    del data[gkey]
+                    continue
+                if isinstance(gval, dict):
+                    for pkey, plist in list(gval.items()):
+                        if plist in (None, [], {}, "null"):
+                            del gval[pkey]
     except Exception:
         # Do not raise; operators call this after user actions and must not crash
         pass
@@ -1968,6 +1973,8 @@ class BIMWorkScheduleProperties(PropertyGroup):
     active_work_schedule_index: IntProperty(name="Active Work Schedules Index")
     active_work_schedule_id: IntProperty(name="Active Work Schedules Id")
     active_task_index: IntProperty(name="Active Task Index", update=update_active_task_index)
+    task_window_start: IntProperty(name="First Row", min=0, update=update_task_window_start)
+    task_search: StringProperty(name="Search Tasks", options={"TEXTEDIT_UPDATE"})
     active_task_id: IntProperty(name="Active Task Id")
     highlighted_task_id: IntProperty(name="Highlited Task Id")
     task_attributes: CollectionProperty(name="Task Attributes", type=Attribute)
@@ -2065,6 +2072,8 @@ class BIMWorkScheduleProperties(PropertyGroup):
         active_work_schedule_index: int
         active_work_schedule_id: int
         active_task_index: int
+        task_window_start: int
+        task_search: str
         active_task_id: int
         highlighted_task_id: int
         task_attributes: bpy.types.bpy_prop_collection_idprop[Attribute]
@@ -2328,6 +2337,12 @@ class AnimationProfileGroupItem(PropertyGroup):
     """Item for animation group stack"""
     group: EnumProperty(name="Group", items=get_internal_profile_sets_enum)
     enabled: BoolProperty(name="Use", default=True)
+    # Canales que esta capa aporta al perfil compuesto del stack
+    use_color: BoolProperty(name="Color", description="This layer provides the profile colors", default=True)
+    use_alpha: BoolProperty(name="Alpha", description="This layer provides the profile transparency", default=True)
+    use_visibility: BoolProperty(
+        name="Visibility", description="This layer provides which states are shown and hide at end", default=True
+    )
 
 
 class BIMAnimationProperties(PropertyGroup):
@@ -2342,6 +2357,16 @@ class BIMAnimationProperties(PropertyGroup):
         default="PROFILES"
     )
     
+    # Cómo se escribe la animación de los productos
+    appearance_mode: EnumProperty(
+        name="Appearance Mode",
+        items=[
+            ("KEYFRAMES", "Keyframes", "Bake visibility and color keyframes for every product"),
+            ("ATTRIBUTES", "Attribute Driven", "Store task dates and profile per product and resolve the appearance on frame change (no keyframes)"),
+        ],
+        default="KEYFRAMES",
+    )
+
     # Animation group stack
     animation_group_stack: CollectionProperty(name="Animation Group Stack", type=AnimationProfileGroupItem)
     animation_group_stack_index: IntProperty(name="Animation Group Stack Index", default=-1)
@@ -2392,6 +2417,7 @@ class BIMAnimationProperties(PropertyGroup):
     active_color_component_inputs_index: IntProperty(name="Active Color Component Index")
     if TYPE_CHECKING:
         active_profile_system: str
+        appearance_mode: str
         animation_group_stack: bpy.types.bpy_prop_collection_idprop[AnimationProfileGroupItem]
         animation_group_stack_index: int
         is_editing: bool
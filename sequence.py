@@ -18,10 +18,12 @@
 
 from __future__ import annotations
 import os
-import re
 import bpy
+from bpy.app.handlers import persistent
 from bonsai.bim.module.sequence import data as _seq_data
+from bonsai.bim.module.sequence import frames as _seq_frames
 import json
+import numpy as np
 import base64
 import ifcopenshell.api.sequence
 import pystache
@@ -58,7 +60,10 @@ if TYPE_CHECKING:
 
 
 class Sequence(bonsai.core.tool.Sequence):
-
+    # Estado de la última animación (firmas por producto) para reconstrucciones incrementales
+    last_animation_state: Optional[dict] = None
+    # Tareas contraídas del árbol (copia en memoria de ``contracted_tasks``)
+    contracted_tasks: set[int] = set()
 
     # === INICIO DE CÓDIGO AÑADIDO ===
     @classmethod
@@ -73,19 +78,21 @@ class Sequence(bonsai.core.tool.Sequence):
                 return
 
             # 1. Obtener todas las tareas que están marcadas con el checkbox
-            selected_tasks_pg = [task_pg for task_pg in tprops.tasks if getattr(task_pg, 'is_selected', False)]
+            # (también las que están fuera de la ventana materializada del árbol)
+            selected_task_ids = [task_pg.ifc_definition_id for task_pg in tprops.tasks if getattr(task_pg, 'is_selected', False)]
+            selected_task_ids.extend(_seq_data.TaskTreeWindow.checked_task_ids())
 
             # 2. Deseleccionar todo en la escena
             bpy.ops.object.select_all(action='DESELECT')
 
             # 3. Si no hay tareas marcadas, terminar
-            if not selected_tasks_pg:
+            if not selected_task_ids:
                 return
 
             # 4. Recopilar todos los objetos a seleccionar
             objects_to_select = []
-            for task_pg in selected_tasks_pg:
-                task_ifc = tool.Ifc.get().by_id(task_pg.ifc_definition_id)
+            for task_id in selected_task_ids:
+                task_ifc = tool.Ifc.get().by_id(task_id)
                 if not task_ifc:
                     continue
                 
@@ -174,14 +181,7 @@ class Sequence(bonsai.core.tool.Sequence):
     @classmethod
     def load_profile_group_data(cls, group_name):
         """Carga datos de un grupo de perfiles específico"""
-        import bpy, json
-        scene = bpy.context.scene
-        raw = scene.get("BIM_AppearanceProfileSets", "{}")
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-            return data.get(group_name, {})
-        except Exception:
-            return {}
+        return _seq_data.ProfileStore.get_group(group_name)
 
     @classmethod
     def get_all_profile_groups(cls):
@@ -935,8 +935,9 @@ class Sequence(bonsai.core.tool.Sequence):
     def load_task_tree(cls, work_schedule: ifcopenshell.entity_instance) -> None:
         props = cls.get_task_tree_props()
         props.tasks.clear()
-        schedule_props = cls.get_work_schedule_props()
-        cls.contracted_tasks = json.loads(schedule_props.contracted_tasks)
+        cls.contracted_tasks = cls.get_contracted_tasks()
+        window = _seq_data.TaskTreeWindow
+        window.stash = {}
 
         # 1. Obtener TODAS las tareas raíz, como antes
         root_tasks = ifcopenshell.util.sequence.get_root_tasks(work_schedule)
@@ -947,156 +948,162 @@ class Sequence(bonsai.core.tool.Sequence):
         # 3. Ordenar solo las tareas que pasaron el filtro
         related_objects_ids = cls.get_sorted_tasks_ids(filtered_root_tasks)
         
-        # 4. Crear los elementos de la UI solo para las tareas filtradas y ordenadas
-        for related_object_id in related_objects_ids:
-            cls.create_new_task_li(related_object_id, 0)
+        # 4. Aplanar el árbol visible y materializar solo la ventana actual en la UI
+        window.set_rows(cls.get_task_tree_rows(related_objects_ids))
+        cls.materialize_task_window(window.offset, load_properties=False, keep_active=False)
+
+    @classmethod
+    def get_task_tree_rows(cls, root_ids: list[int], level: int = 0) -> list[tuple[int, int, bool, bool]]:
+        """Filas visibles del árbol en orden: (task_id, nivel, tiene hijos, expandida).
+
+        Mismo recorrido que ``create_new_task_li`` pero iterativo y sin crear
+        elementos de UI.
+        """
+        ifc_file = tool.Ifc.get()
+        contracted = cls.contracted_tasks
+        rows = []
+        stack = [(task_id, level) for task_id in reversed(root_ids)]
+        while stack:
+            task_id, level = stack.pop()
+            task = ifc_file.by_id(task_id)
+            has_children = bool(task.IsNestedBy)
+            is_expanded = task_id not in contracted
+            rows.append((task_id, level, has_children, is_expanded))
+            if has_children and is_expanded:
+                child_ids = cls.get_sorted_tasks_ids(ifcopenshell.util.sequence.get_nested_tasks(task))
+                stack.extend((child_id, level + 1) for child_id in reversed(child_ids))
+        return rows
+
+    @classmethod
+    def materialize_task_window(cls, offset: int, load_properties: bool = True, keep_active: bool = True) -> None:
+        """Reconstruye ``tasks`` con las filas de la ventana que empieza en ``offset``.
+
+        El estado editable de las filas que salen se guarda en ``TaskTreeWindow.stash``.
+        Con ``keep_active`` el índice activo sigue apuntando a la misma tarea si
+        continúa dentro de la ventana.
+        """
+        window = _seq_data.TaskTreeWindow
+        props = cls.get_task_tree_props()
+        ws_props = cls.get_work_schedule_props()
+        active_task_id = None
+        if keep_active and 0 <= ws_props.active_task_index < len(props.tasks):
+            active_task_id = props.tasks[ws_props.active_task_index].ifc_definition_id
+        for item in props.tasks:
+            window.stash_item(item)
+        props.tasks.clear()
+
+        window.offset = window.clamp(offset)
+        rows = window.window()
+        task_ids = window.task_ids[rows.start : rows.stop].tolist()
+        levels = window.levels[rows.start : rows.stop].tolist()
+        has_children = window.has_children[rows.start : rows.stop].tolist()
+        is_expanded = window.is_expanded[rows.start : rows.stop].tolist()
+        for i, task_id in enumerate(task_ids):
+            new = props.tasks.add()
+            new.ifc_definition_id = task_id
+            new.is_expanded = is_expanded[i]
+            new.level_index = levels[i]
+            new.has_children = has_children[i]
+            window.restore_item(new)
+
+        # Escritura directa: no disparar los callbacks de actualización
+        ws_props["task_window_start"] = window.offset
+        if active_task_id is not None:
+            row = window.rows.get(active_task_id)
+            if row is not None and row in rows:
+                ws_props["active_task_index"] = row - window.offset
+        if load_properties:
+            cls.load_task_properties()
+
+    @classmethod
+    def iter_all_task_items(cls, include_unloaded: bool = False):
+        """Recorre los ``Task`` de las filas materializadas y de las guardadas en el stash.
+
+        Las filas fuera de la ventana solo existen en ``TaskTreeWindow.stash``; para
+        que los llamadores puedan leerlas y editarlas como elementos normales se
+        materializan por bloques de ``TaskTreeWindow.size`` y se vuelven a guardar.
+        Con ``include_unloaded`` se recorren además todas las filas visibles del
+        árbol (p. ej. para inicializar perfiles de todas las tareas). Al terminar se
+        restaura la ventana y el índice activo.
+        """
+        window = _seq_data.TaskTreeWindow
+        props = cls.get_task_tree_props()
+        ws_props = cls.get_work_schedule_props()
+        if not window.stash and len(props.tasks) >= window.total():
+            # Todo el árbol está materializado
+            yield from list(props.tasks)
+            return
+
+        offset, active_index = window.offset, ws_props.active_task_index
+        for item in props.tasks:
+            window.stash_item(item)
+        props.tasks.clear()
+        task_ids = list(window.stash)
+        if include_unloaded:
+            stashed = set(task_ids)
+            task_ids.extend(task_id for task_id in window.task_ids.tolist() if task_id not in stashed)
+        try:
+            for start in range(0, len(task_ids), window.size):
+                for task_id in task_ids[start : start + window.size]:
+                    item = props.tasks.add()
+                    item.ifc_definition_id = task_id
+                    window.restore_item(item)
+                yield from list(props.tasks)
+                for item in props.tasks:
+                    window.stash_item(item)
+                props.tasks.clear()
+        finally:
+            cls.materialize_task_window(offset, keep_active=False)
+            ws_props["active_task_index"] = active_index
+
+    @classmethod
+    def scroll_task_window_to_active(cls) -> bool:
+        """Desplaza la ventana si la fila activa está cerca de su borde.
+
+        Devuelve True si la ventana se ha movido.
+        """
+        window = _seq_data.TaskTreeWindow
+        if window.total() <= window.size:
+            return False
+        ws_props = cls.get_work_schedule_props()
+        row = window.offset + ws_props.active_task_index
+        offset = window.offset_for_row(row)
+        if offset == window.offset:
+            return False
+        cls.materialize_task_window(offset)
+        return True
 
     @classmethod
     def get_sorted_tasks_ids(cls, tasks: list[ifcopenshell.entity_instance]) -> list[int]:
         props = cls.get_work_schedule_props()
+        related_object_ids = [task.id() for task in tasks]
 
-        def get_sort_key(task):
-            # Sorting only applies to actual tasks, not the WBS
-            # for rel in task.IsNestedBy:
-            #     for object in rel.RelatedObjects:
-            #         if object.is_a("IfcTask"):
-            #             return "0000000000" + (task.Identification or "")
-            column_type, name = props.sort_column.split(".")
-            if column_type == "IfcTask":
-                return task.get_info(task)[name] or ""
-            elif column_type == "IfcTaskTime" and task.TaskTime:
-                return task.TaskTime.get_info(task)[name] if task.TaskTime.get_info(task)[name] else ""
-            return task.Identification or ""
-
-        def natural_sort_key(i, _nsre=re.compile("([0-9]+)")):
-            s = sort_keys[i]
-            return [int(text) if text.isdigit() else text.lower() for text in _nsre.split(s)]
-
-        if props.sort_column:
-            sort_keys = {task.id(): get_sort_key(task) for task in tasks}
-            related_object_ids = sorted(sort_keys, key=natural_sort_key)
-        else:
-            related_object_ids = [task.id() for task in tasks]
+        # Varias columnas separadas por comas: la primera manda, las siguientes desempatan
+        columns = tuple(column for column in props.sort_column.split(",") if column)
+        if columns:
+            ranks = _seq_data.TaskSortKeyIndex.get_ranks(columns, related_object_ids)
+            related_object_ids.sort(key=ranks.__getitem__)
         if props.is_sort_reversed:
             related_object_ids.reverse()
         return related_object_ids
 
-    
-
     @classmethod
     def get_filtered_tasks(cls, tasks: list[ifcopenshell.entity_instance]) -> list[ifcopenshell.entity_instance]:
         """
         Filtra una lista de tareas (y sus hijos) basándose en las reglas activas.
         Si una tarea padre no cumple el filtro, sus hijos tampoco se mostrarán.
+        Las reglas se compilan una vez y se evalúan sobre todo el subárbol a la vez
+        (ver ``TaskFilterEngine``).
         """
         props = cls.get_work_schedule_props()
         try:
-            filter_rules = [r for r in getattr(props, "filters").rules if r.is_active]
+            engine = _seq_data.TaskFilterEngine.from_props(getattr(props, "filters"))
         except Exception:
             return tasks
 
-        if not filter_rules:
+        if engine is None:
             return tasks
-
-        filter_logic_is_and = getattr(props.filters, "logic", 'AND') == 'AND'
-        
-        def get_task_value(task, column_identifier):
-            """Función auxiliar mejorada para obtener el valor de una columna para una tarea."""
-            if not task or not column_identifier:
-                return None
-            
-            column_name = column_identifier.split('||')[0]
-
-            if column_name == "Special.OutputsCount":
-                try:
-                    # Usa la función de utilidad de ifcopenshell para obtener los outputs
-                    return len(ifcopenshell.util.sequence.get_task_outputs(task, is_deep=False))
-                except Exception:
-                    return 0
-            
-            try:
-                ifc_class, attr_name = column_name.split('.', 1)
-                if ifc_class == "IfcTask":
-                    return getattr(task, attr_name, None)
-                elif ifc_class == "IfcTaskTime":
-                    task_time = getattr(task, "TaskTime", None)
-                    return getattr(task_time, attr_name, None) if task_time else None
-            except Exception:
-                return None
-            return None
-
-        def task_matches_filters(task):
-            """Comprueba si una única tarea cumple con el conjunto de filtros."""
-            results = []
-            for rule in filter_rules:
-                task_value = get_task_value(task, rule.column)
-                data_type = getattr(rule, 'data_type', 'string')
-                op = rule.operator
-                match = False
-
-                if op == 'EMPTY':
-                    match = task_value is None or str(task_value).strip() == ""
-                elif op == 'NOT_EMPTY':
-                    match = task_value is not None and str(task_value).strip() != ""
-                else:
-                    try:
-                        if data_type == 'integer':
-                            rule_value = rule.value_integer
-                            task_value_num = int(task_value)
-                            if op == 'EQUALS': match = task_value_num == rule_value
-                            elif op == 'NOT_EQUALS': match = task_value_num != rule_value
-                            elif op == 'GREATER': match = task_value_num > rule_value
-                            elif op == 'LESS': match = task_value_num < rule_value
-                            elif op == 'GTE': match = task_value_num >= rule_value
-                            elif op == 'LTE': match = task_value_num <= rule_value
-                        elif data_type in ('float', 'real'):
-                            rule_value = rule.value_float
-                            task_value_num = float(task_value)
-                            if op == 'EQUALS': match = task_value_num == rule_value
-                            elif op == 'NOT_EQUALS': match = task_value_num != rule_value
-                            elif op == 'GREATER': match = task_value_num > rule_value
-                            elif op == 'LESS': match = task_value_num < rule_value
-                            elif op == 'GTE': match = task_value_num >= rule_value
-                            elif op == 'LTE': match = task_value_num <= rule_value
-                        elif data_type == 'boolean':
-                            rule_value = bool(rule.value_boolean)
-                            task_value_bool = bool(task_value)
-                            if op == 'EQUALS': match = task_value_bool == rule_value
-                            elif op == 'NOT_EQUALS': match = task_value_bool != rule_value
-                        elif data_type == 'date':
-                            task_date = bonsai.bim.module.sequence.helper.parse_datetime(str(task_value))
-                            rule_date = bonsai.bim.module.sequence.helper.parse_datetime(rule.value_string)
-                            if task_date and rule_date:
-                                if op == 'EQUALS': match = task_date.date() == rule_date.date()
-                                elif op == 'NOT_EQUALS': match = task_date.date() != rule_date.date()
-                                elif op == 'GREATER': match = task_date > rule_date
-                                elif op == 'LESS': match = task_date < rule_date
-                                elif op == 'GTE': match = task_date >= rule_date
-                                elif op == 'LTE': match = task_date <= rule_date
-                        else: # string, enums, etc.
-                            rule_value = (rule.value_string or "").lower()
-                            task_value_str = (str(task_value) if task_value is not None else "").lower()
-                            if op == 'CONTAINS': match = rule_value in task_value_str
-                            elif op == 'NOT_CONTAINS': match = rule_value not in task_value_str
-                            elif op == 'EQUALS': match = rule_value == task_value_str
-                            elif op == 'NOT_EQUALS': match = rule_value != task_value_str
-                    except (ValueError, TypeError, AttributeError):
-                        match = False
-                results.append(match)
-
-            if not results: 
-                return True
-            return all(results) if filter_logic_is_and else any(results)
-
-        filtered_list = []
-        for task in tasks:
-            nested_tasks = ifcopenshell.util.sequence.get_nested_tasks(task)
-            filtered_children = cls.get_filtered_tasks(nested_tasks) if nested_tasks else []
-
-            if task_matches_filters(task) or len(filtered_children) > 0:
-                filtered_list.append(task)
-                
-        return filtered_list
+        return engine.filter_roots(tasks)
 
     @classmethod
     def create_new_task_li(cls, related_object_id: int, level_index: int) -> None:
@@ -1119,59 +1126,63 @@ class Sequence(bonsai.core.tool.Sequence):
         task_props = cls.get_task_tree_props()
         tasks_with_visual_bar = cls.get_task_bar_list()
         props.is_task_update_enabled = False
+        ifc_file = tool.Ifc.get()
+        calendars = _seq_data.TaskCalendarIndex
+        calendars.check_file()
+
+        # Adyacencias de la tarea resaltada: una sola consulta en lugar de una lista por fila
+        predecessor_ids = successor_ids = set()
+        if props.highlighted_task_id:
+            try:
+                highlighted = ifc_file.by_id(props.highlighted_task_id)
+                predecessor_ids = {rel.RelatingProcess.id() for rel in highlighted.IsSuccessorFrom}
+                successor_ids = {rel.RelatedProcess.id() for rel in highlighted.IsPredecessorTo}
+            except RuntimeError:
+                # La tarea resaltada ya no existe
+                pass
+
+        # Fechas y duraciones ya formateadas, compartidas entre filas
+        dates: dict[str, str] = {}
+        durations: dict[str, str] = {}
+
+        def canonical_date(value) -> str:
+            if value not in dates:
+                dates[value] = ifcopenshell.util.date.canonicalise_time(ifcopenshell.util.date.ifc2datetime(value))
+            return dates[value]
+
+        def readable_duration(value) -> str:
+            if value not in durations:
+                durations[value] = str(ifcopenshell.util.date.readable_ifc_duration(value))
+            return durations[value]
 
         for item in task_props.tasks:
-            task = tool.Ifc.get().by_id(item.ifc_definition_id)
+            task_id = item.ifc_definition_id
+            task = ifc_file.by_id(task_id)
             item.name = task.Name or "Unnamed"
             item.identification = task.Identification or "XXX"
-            item.has_bar_visual = item.ifc_definition_id in tasks_with_visual_bar
+            item.has_bar_visual = task_id in tasks_with_visual_bar
             if props.highlighted_task_id:
-                item.is_predecessor = props.highlighted_task_id in [
-                    rel.RelatedProcess.id() for rel in task.IsPredecessorTo
-                ]
-                item.is_successor = props.highlighted_task_id in [
-                    rel.RelatingProcess.id() for rel in task.IsSuccessorFrom
-                ]
-            calendar = ifcopenshell.util.sequence.derive_calendar(task)
-            if ifcopenshell.util.sequence.get_calendar(task):
+                item.is_predecessor = task_id in predecessor_ids
+                item.is_successor = task_id in successor_ids
+            calendar = calendars.derive_calendar(task)
+            if calendars.get_calendar(task):
                 item.calendar = calendar.Name or "Unnamed" if calendar else ""
             else:
                 item.calendar = ""
                 item.derived_calendar = calendar.Name or "Unnamed" if calendar else ""
 
-            if task.TaskTime and (
-                task.TaskTime.ScheduleStart or task.TaskTime.ScheduleFinish or task.TaskTime.ScheduleDuration
-            ):
-                task_time = task.TaskTime
-                item.start = (
-                    ifcopenshell.util.date.canonicalise_time(
-                        ifcopenshell.util.date.ifc2datetime(task_time.ScheduleStart)
-                    )
-                    if task_time.ScheduleStart
-                    else "-"
-                )
-                item.finish = (
-                    ifcopenshell.util.date.canonicalise_time(
-                        ifcopenshell.util.date.ifc2datetime(task_time.ScheduleFinish)
-                    )
-                    if task_time.ScheduleFinish
-                    else "-"
-                )
-                item.duration = (
-                    str(ifcopenshell.util.date.readable_ifc_duration(task_time.ScheduleDuration))
-                    if task_time.ScheduleDuration
-                    else "-"
-                )
+            task_time = task.TaskTime
+            if task_time and (task_time.ScheduleStart or task_time.ScheduleFinish or task_time.ScheduleDuration):
+                item.start = canonical_date(task_time.ScheduleStart) if task_time.ScheduleStart else "-"
+                item.finish = canonical_date(task_time.ScheduleFinish) if task_time.ScheduleFinish else "-"
+                item.duration = readable_duration(task_time.ScheduleDuration) if task_time.ScheduleDuration else "-"
             else:
-                derived_start = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-                derived_finish = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
+                derived_start, derived_finish = _seq_data.DerivedDateIndex.get(task)
                 item.derived_start = ifcopenshell.util.date.canonicalise_time(derived_start) if derived_start else ""
                 item.derived_finish = ifcopenshell.util.date.canonicalise_time(derived_finish) if derived_finish else ""
                 if derived_start and derived_finish:
-                    derived_duration = ifcopenshell.util.sequence.count_working_days(
-                        derived_start, derived_finish, calendar
-                    )
-                    item.derived_duration = str(ifcopenshell.util.date.readable_ifc_duration(f"P{derived_duration}D"))
+                    derived_duration = calendars.count_working_days(derived_start, derived_finish, calendar)
+                    item.derived_duration = readable_duration(f"P{derived_duration}D")
                 item.start = "-"
                 item.finish = "-"
                 item.duration = "-"
@@ -1195,16 +1206,9 @@ class Sequence(bonsai.core.tool.Sequence):
             tprops = cls.get_task_tree_props()
         except Exception:
             return
-        try:
-            from bonsai import tool as _tool
-            import ifcopenshell  # type: ignore
-        except Exception:
-            # Si los módulos no están disponibles en este contexto, salimos silenciosamente.
-            return
         for item in getattr(tprops, "tasks", []):
             try:
-                task = _tool.Ifc.get().by_id(item.ifc_definition_id)
-                count = len(ifcopenshell.util.sequence.get_task_outputs(task, is_deep=False)) if task else 0
+                count = len(_seq_data.ScheduleGraphIndex.neighbours("task_outputs", item.ifc_definition_id))
                 if hasattr(item, "outputs_count"):
                     # Algunas builds definen este atributo en el item del árbol
                     setattr(item, "outputs_count", count)
@@ -1222,34 +1226,92 @@ class Sequence(bonsai.core.tool.Sequence):
             return None
         return tool.Ifc.get().by_id(props.active_work_schedule_id)
 
+    @classmethod
+    def get_contracted_tasks(cls) -> set[int]:
+        return set(json.loads(cls.get_work_schedule_props().contracted_tasks))
+
+    @classmethod
+    def set_contracted_tasks(cls, task_ids: set[int]) -> None:
+        cls.contracted_tasks = set(task_ids)
+        cls.get_work_schedule_props().contracted_tasks = json.dumps(sorted(cls.contracted_tasks))
+
     @classmethod
     def expand_task(cls, task: ifcopenshell.entity_instance) -> None:
-        props = cls.get_work_schedule_props()
-        contracted_tasks = json.loads(props.contracted_tasks)
-        contracted_tasks.remove(task.id())
-        props.contracted_tasks = json.dumps(contracted_tasks)
+        contracted_tasks = cls.get_contracted_tasks()
+        contracted_tasks.discard(task.id())
+        cls.set_contracted_tasks(contracted_tasks)
 
     @classmethod
     def expand_all_tasks(cls) -> None:
-        props = cls.get_work_schedule_props()
-        props.contracted_tasks = json.dumps([])
+        cls.set_contracted_tasks(set())
 
     @classmethod
     def contract_all_tasks(cls) -> None:
-        props = cls.get_work_schedule_props()
-        tprops = cls.get_task_tree_props()
-        contracted_tasks = json.loads(props.contracted_tasks)
-        for task_item in tprops.tasks:
-            if task_item.is_expanded:
-                contracted_tasks.append(task_item.ifc_definition_id)
-        props.contracted_tasks = json.dumps(contracted_tasks)
+        window = _seq_data.TaskTreeWindow
+        contracted_tasks = cls.get_contracted_tasks()
+        contracted_tasks.update(window.task_ids[window.is_expanded].tolist())
+        cls.set_contracted_tasks(contracted_tasks)
 
     @classmethod
     def contract_task(cls, task: ifcopenshell.entity_instance) -> None:
-        props = cls.get_work_schedule_props()
-        contracted_tasks = json.loads(props.contracted_tasks)
-        contracted_tasks.append(task.id())
-        props.contracted_tasks = json.dumps(contracted_tasks)
+        contracted_tasks = cls.get_contracted_tasks()
+        contracted_tasks.add(task.id())
+        cls.set_contracted_tasks(contracted_tasks)
+
+    # Variantes incrementales: solo se insertan o eliminan las filas del subárbol
+    # afectado en ``TaskTreeWindow`` y se rematerializa la ventana visible. Devuelven
+    # False (sin tocar nada) si hace falta reconstruir el árbol completo.
+    @classmethod
+    def expand_task_rows(cls, task: ifcopenshell.entity_instance) -> bool:
+        window = _seq_data.TaskTreeWindow
+        row = window.rows.get(task.id())
+        if row is None:
+            return False
+        cls.expand_task(task)
+        if window.has_children[row] and not window.is_expanded[row]:
+            window.is_expanded[row] = True
+            child_ids = cls.get_sorted_tasks_ids(ifcopenshell.util.sequence.get_nested_tasks(task))
+            window.insert_rows(row + 1, cls.get_task_tree_rows(child_ids, int(window.levels[row]) + 1))
+        cls.materialize_task_window(window.offset)
+        return True
+
+    @classmethod
+    def contract_task_rows(cls, task: ifcopenshell.entity_instance) -> bool:
+        window = _seq_data.TaskTreeWindow
+        row = window.rows.get(task.id())
+        if row is None:
+            return False
+        cls.contract_task(task)
+        window.is_expanded[row] = False
+        window.remove_rows(row + 1, window.subtree_end(row))
+        cls.materialize_task_window(window.offset)
+        return True
+
+    @classmethod
+    def expand_all_task_rows(cls) -> bool:
+        window = _seq_data.TaskTreeWindow
+        if not window.total():
+            return False
+        cls.expand_all_tasks()
+        # Las raíces ya están filtradas y ordenadas: solo se recorre de nuevo el árbol
+        window.set_rows(cls.get_task_tree_rows(window.task_ids[window.levels == 0].tolist()))
+        cls.materialize_task_window(window.offset)
+        return True
+
+    @classmethod
+    def contract_all_task_rows(cls) -> bool:
+        window = _seq_data.TaskTreeWindow
+        if not window.total():
+            return False
+        cls.contract_all_tasks()
+        roots = window.levels == 0
+        window.set_rows(
+            [(task_id, 0, has_children, False) for task_id, has_children in zip(
+                window.task_ids[roots].tolist(), window.has_children[roots].tolist()
+            )]
+        )
+        cls.materialize_task_window(window.offset)
+        return True
 
     @classmethod
     def disable_work_schedule(cls) -> None:
@@ -1259,17 +1321,15 @@ class Sequence(bonsai.core.tool.Sequence):
     @classmethod
     def disable_selecting_deleted_task(cls) -> None:
         props = cls.get_work_schedule_props()
-        if props.active_task_id not in [
-            task.ifc_definition_id for task in cls.get_task_tree_props().tasks
-        ]:  # Task was deleted
+        if props.active_task_id not in _seq_data.TaskTreeWindow.rows:  # Task was deleted
             props.active_task_id = 0
             props.active_task_time_id = 0
 
     @classmethod
     def get_checked_tasks(cls) -> list[ifcopenshell.entity_instance]:
-        return [
-            tool.Ifc.get().by_id(task.ifc_definition_id) for task in cls.get_task_tree_props().tasks if task.is_selected
-        ] or []
+        task_ids = [task.ifc_definition_id for task in cls.get_task_tree_props().tasks if task.is_selected]
+        task_ids.extend(_seq_data.TaskTreeWindow.checked_task_ids())
+        return [tool.Ifc.get().by_id(task_id) for task_id in task_ids]
 
     @classmethod
     def get_task_attribute_value(cls, attribute_name: str) -> Any:
@@ -1378,13 +1438,15 @@ class Sequence(bonsai.core.tool.Sequence):
     def get_task_inputs(cls, task: ifcopenshell.entity_instance) -> list[ifcopenshell.entity_instance]:
         props = cls.get_work_schedule_props()
         is_deep = props.show_nested_inputs
-        return ifcopenshell.util.sequence.get_task_inputs(task, is_deep)
+        graph = _seq_data.ScheduleGraphIndex
+        return graph.entities(graph.task_products("task_inputs", task.id(), is_deep))
 
     @classmethod
     def get_task_outputs(cls, task: ifcopenshell.entity_instance) -> list[ifcopenshell.entity_instance]:
         props = cls.get_work_schedule_props()
         is_deep = props.show_nested_outputs
-        return ifcopenshell.util.sequence.get_task_outputs(task, is_deep)
+        graph = _seq_data.ScheduleGraphIndex
+        return graph.entities(graph.task_products("task_outputs", task.id(), is_deep))
 
     @classmethod
     def are_entities_same_class(cls, entities: list[ifcopenshell.entity_instance]) -> bool:
@@ -1685,8 +1747,9 @@ class Sequence(bonsai.core.tool.Sequence):
     def remove_task_column(cls, name: str) -> None:
         props = cls.get_work_schedule_props()
         props.columns.remove(props.columns.find(name))
-        if props.sort_column == name:
-            props.sort_column = ""
+        columns = props.sort_column.split(",")
+        if name in columns:
+            props.sort_column = ",".join(column for column in columns if column != name)
 
     @classmethod
     def set_task_sort_column(cls, column: str) -> None:
@@ -1695,19 +1758,13 @@ class Sequence(bonsai.core.tool.Sequence):
 
     @classmethod
     def find_related_input_tasks(cls, product):
-        related_tasks = []
-        for assignment in product.HasAssignments:
-            if assignment.is_a("IfcRelAssignsToProcess") and assignment.RelatingProcess.is_a("IfcTask"):
-                related_tasks.append(assignment.RelatingProcess)
-        return related_tasks
+        graph = _seq_data.ScheduleGraphIndex
+        return graph.entities(graph.neighbours("product_input_tasks", product.id()).tolist())
 
     @classmethod
     def find_related_output_tasks(cls, product):
-        related_tasks = []
-        for reference in product.ReferencedBy:
-            if reference.is_a("IfcRelAssignsToProduct") and reference.RelatedObjects[0].is_a("IfcTask"):
-                related_tasks.append(reference.RelatedObjects[0])
-        return related_tasks
+        graph = _seq_data.ScheduleGraphIndex
+        return graph.entities(graph.neighbours("product_output_tasks", product.id()).tolist())
 
     @classmethod
     def get_work_schedule(cls, task: ifcopenshell.entity_instance) -> Union[ifcopenshell.entity_instance, None]:
@@ -1733,19 +1790,18 @@ class Sequence(bonsai.core.tool.Sequence):
                 ids.extend(get_ancestor_ids(rel.RelatingObject))
             return ids
 
-        contracted_tasks = json.loads(props.contracted_tasks)
-        for ancestor_id in get_ancestor_ids(task):
-            if ancestor_id in contracted_tasks:
-                contracted_tasks.remove(ancestor_id)
-        props.contracted_tasks = json.dumps(contracted_tasks)
+        cls.set_contracted_tasks(cls.get_contracted_tasks().difference(get_ancestor_ids(task)))
 
         work_schedule = cls.get_active_work_schedule()
         cls.load_task_tree(work_schedule)
-        cls.load_task_properties()
 
-        task_props = cls.get_task_tree_props()
-        expanded_tasks = [item.ifc_definition_id for item in task_props.tasks]
-        props.active_task_index = expanded_tasks.index(task.id()) or 0
+        window = _seq_data.TaskTreeWindow
+        row = window.rows.get(task.id())
+        if row is None:  # Tarea de otro cronograma o excluida por el filtro
+            cls.load_task_properties()
+            return
+        cls.materialize_task_window(window.offset_for_row(row), keep_active=False)
+        props.active_task_index = row - window.offset
 
     # TODO: proper typing
     @classmethod
@@ -1837,8 +1893,7 @@ class Sequence(bonsai.core.tool.Sequence):
                 return None
 
             try:
-                task_start_date = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-                finish_date = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
+                task_start_date, finish_date = _seq_data.DerivedDateIndex.get(task)
             except Exception as e:
                 print(f"⚠️ Error deriving dates for task {getattr(task, 'Name', 'Unknown')}: {e}")
                 return None
@@ -1857,19 +1912,11 @@ class Sequence(bonsai.core.tool.Sequence):
                     print(f"⚠️ Invalid schedule duration: {schedule_duration}")
                     return None
 
-                total_frames = settings["end_frame"] - settings["start_frame"]
-
-                # Calcular posición de la tarea dentro del cronograma completo
-                task_start_progress = (task_start_date - schedule_start).total_seconds() / schedule_duration.total_seconds()
-                task_finish_progress = (finish_date - schedule_start).total_seconds() / schedule_duration.total_seconds()
-
-                # Convertir a frames
-                task_start_frame = round(settings["start_frame"] + (task_start_progress * total_frames))
-                task_finish_frame = round(settings["start_frame"] + (task_finish_progress * total_frames))
-
-                # Validar que los frames estén en rango válido
-                task_start_frame = max(settings["start_frame"], min(settings["end_frame"], task_start_frame))
-                task_finish_frame = max(settings["start_frame"], min(settings["end_frame"], task_finish_frame))
+                # Frames ya calculados (y recortados al rango) para todas las tareas a la vez
+                task_frames = settings.get("task_frames") or {}
+                if task.id() not in task_frames:
+                    task_frames.update(compute_task_frames([task], settings))
+                task_start_frame, task_finish_frame = task_frames[task.id()]
 
                 return {
                     "name": getattr(task, "Name", "Unnamed"),
@@ -1881,6 +1928,29 @@ class Sequence(bonsai.core.tool.Sequence):
             except Exception as e:
                 print(f"⚠️ Error calculating frames for task {getattr(task, 'Name', 'Unknown')}: {e}")
                 return None
+        def compute_task_frames(tasks, settings):
+            """Frames de inicio/fin (recortados) de todas las tareas en un cálculo NumPy."""
+            task_dates = []
+            for task in tasks:
+                try:
+                    task_dates.append((task.id(), *_seq_data.DerivedDateIndex.get(task)))
+                except Exception:
+                    continue
+            start_frames, finish_frames, valid = _seq_frames.dates_to_frames(
+                [start for _, start, _ in task_dates],
+                [finish for _, _, finish in task_dates],
+                settings["viz_start"],
+                settings["viz_finish"],
+                settings["start_frame"],
+                settings["end_frame"] - settings["start_frame"],
+                clamp=True,
+            )
+            return {
+                task_id: (sf, ff)
+                for (task_id, _, _), sf, ff, ok in zip(task_dates, start_frames.tolist(), finish_frames.tolist(), valid.tolist())
+                if ok
+            }
+
         def create_task_bar_data(tasks, vertical_increment, collection):
             # CORRECCIÓN: Usar fechas del cronograma activo, NO las de visualización
             schedule_start, schedule_finish = cls.get_schedule_date_range()
@@ -1897,6 +1967,7 @@ class Sequence(bonsai.core.tool.Sequence):
                 "start_frame": bpy.context.scene.frame_start,
                 "end_frame": bpy.context.scene.frame_end,
             }
+            settings["task_frames"] = compute_task_frames(tasks, settings)
 
             print(f"🎯 Task Bars usando fechas del cronograma:")
             print(f"   Schedule Start: {schedule_start.strftime('%Y-%m-%d')}")
@@ -2243,18 +2314,24 @@ class Sequence(bonsai.core.tool.Sequence):
             date: Fecha actual del snapshot
             viz_start: Fecha de inicio de visualización (opcional)
             viz_finish: Fecha de fin de visualización (opcional)
+
+        Los estados se consultan en ScheduleStateIndex (construido una vez por
+        cronograma), sin volver a recorrer las tareas en cada snapshot.
         """
-        cls.to_build = set()
-        cls.in_construction = set()
-        cls.completed = set()
-        cls.to_demolish = set()
-        cls.in_demolition = set()
-        cls.demolished = set()
-
-        for rel in work_schedule.Controls or []:
-            for related_object in rel.RelatedObjects:
-                if related_object.is_a("IfcTask"):
-                    cls.process_task_status(related_object, date, viz_start, viz_finish)
+        nested_inputs = cls.get_work_schedule_props().show_nested_inputs
+        table = _seq_data.ScheduleStateIndex.load(work_schedule, nested_inputs)
+        states = table.states_at(date, viz_start, viz_finish)
+        ifc_file = tool.Ifc.get()
+
+        def objects(name):
+            return {tool.Ifc.get_object(ifc_file.by_id(product_id)) for product_id in states[name].tolist()}
+
+        cls.to_build = objects("TO_BUILD")
+        cls.in_construction = objects("IN_CONSTRUCTION")
+        cls.completed = objects("COMPLETED")
+        cls.to_demolish = objects("TO_DEMOLISH")
+        cls.in_demolition = objects("IN_DEMOLITION")
+        cls.demolished = objects("DEMOLISHED")
 
         return {
             "TO_BUILD": cls.to_build,
@@ -2279,13 +2356,13 @@ class Sequence(bonsai.core.tool.Sequence):
         for rel in task.IsNestedBy or []:
             [cls.process_task_status(related_object, date, viz_start, viz_finish) for related_object in rel.RelatedObjects]
 
-        start = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-        finish = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
+        start, finish = _seq_data.DerivedDateIndex.get(task)
 
         if not start or not finish:
             return
 
-        outputs = ifcopenshell.util.sequence.get_task_outputs(task) or []
+        graph = _seq_data.ScheduleGraphIndex
+        outputs = graph.entities(graph.task_products("task_outputs", task.id()))
         inputs = cls.get_task_inputs(task) or []
 
         # NUEVA LÓGICA: Considerar rango de visualización
@@ -2318,23 +2395,71 @@ class Sequence(bonsai.core.tool.Sequence):
             [cls.completed.add(tool.Ifc.get_object(output)) for output in outputs]
             [cls.demolished.add(tool.Ifc.get_object(input)) for input in inputs]
 
+    # Estado de snapshot -> estado de perfil, tipo por defecto y visibilidad
+    SNAPSHOT_STATE_CONFIGS = {
+        "TO_BUILD": {"state": "start", "default_type": "CONSTRUCTION", "visibility": "hidden"},
+        "IN_CONSTRUCTION": {"state": "in_progress", "default_type": "CONSTRUCTION", "visibility": "visible"},
+        "COMPLETED": {"state": "end", "default_type": "CONSTRUCTION", "visibility": "visible"},
+        "TO_DEMOLISH": {"state": "start", "default_type": "DEMOLITION", "visibility": "visible"},
+        "IN_DEMOLITION": {"state": "in_progress", "default_type": "DEMOLITION", "visibility": "visible"},
+        "DEMOLISHED": {"state": "end", "default_type": "DEMOLITION", "visibility": "hidden"},
+    }
+
     @classmethod
     def show_snapshot(cls, product_states):
         """CORRECCIÓN: Respetar consider_start en snapshots"""
 
-        # 1. Limpiar keyframes previos y guardar propiedades originales
-        original_properties = {}
+        # Los keyframes se eliminan: la siguiente animación no puede ser incremental
+        cls.last_animation_state = None
+
+        # 1. Limpiar keyframes previos y guardar colores originales
+        original_colors = {}
+        ifc_objects = set()
         for obj in bpy.data.objects:
             if obj.type == 'MESH':
-                original_properties[obj.name] = {
-                    "color": list(obj.color),
-                    "hide": obj.hide_get()
-                }
+                original_colors[obj.name] = list(obj.color)
+                if tool.Ifc.get_entity(obj):
+                    ifc_objects.add(obj)
             if obj.animation_data:
                 obj.animation_data_clear()
 
         # 2. Determinar el grupo de perfiles correcto DESDE EL ANIMATION STACK
         anim_props = cls.get_animation_props()
+        active_group_name = cls.get_snapshot_group_name(anim_props)
+
+        # Perfil por tarea compuesto a partir del Animation Stack, una vez por tarea
+        profile_resolver = _seq_data.TaskProfileResolver.for_animation(anim_props)
+
+        # 3. Estado final de cada objeto (si aparece en varios conjuntos gana el último)
+        object_states = {}
+        for state_name, products in product_states.items():
+            if state_name not in cls.SNAPSHOT_STATE_CONFIGS:
+                continue
+            for obj in products or []:
+                if obj and tool.Ifc.get_entity(obj):
+                    object_states[obj] = state_name
+
+        # 4. Aplicar estados visuales; los objetos IFC sin estado quedan ocultos
+        task_cache = {}
+        applied_count = 0
+        for obj in ifc_objects | object_states.keys():
+            state_name = object_states.get(obj)
+            original_color = original_colors.get(obj.name, [1, 1, 1, 1])
+            hidden, color = cls.get_snapshot_object_appearance(
+                obj, state_name, profile_resolver, active_group_name, original_color, task_cache
+            )
+            cls.apply_object_appearance(obj, hidden, color)
+            if state_name:
+                applied_count += 1
+
+        # 5. Configurar la vista 3D
+        cls.set_object_shading()
+        print(f"✅ Snapshot aplicado a {applied_count} objetos usando el grupo '{active_group_name}'")
+
+    @classmethod
+    def get_snapshot_group_name(cls, anim_props=None):
+        """Grupo de mayor prioridad del Animation Stack para snapshots (DEFAULT si no hay ninguno)."""
+        anim_props = anim_props or cls.get_animation_props()
         active_group_name = None
 
         # Iterar sobre el stack de animación para encontrar el primer grupo habilitado
@@ -2352,128 +2477,351 @@ class Sequence(bonsai.core.tool.Sequence):
         # Sincronizar el grupo de la UI si coincide con el que vamos a usar, para capturar cambios no guardados.
         if active_group_name == getattr(anim_props, "profile_groups", None):
             cls.sync_active_group_to_json()
+        return active_group_name
 
-        # 3. Resetear todos los objetos IFC (ocultar por defecto)
-        for obj in bpy.data.objects:
-            if obj.type == 'MESH' and tool.Ifc.get_entity(obj):
-                obj.hide_viewport = True
-                obj.hide_render = True
-                obj.color = (0.5, 0.5, 0.5, 0.2)
+    @classmethod
+    def show_snapshot_at(cls, work_schedule, date, viz_start=None, viz_finish=None) -> int:
+        """Aplica el snapshot de ``date`` a todos los objetos IFC en bloque.
 
-        # 4. Mapeo de estados a perfiles del grupo activo
-        def get_task_profile(task_type):
-            """Obtiene el perfil correcto del grupo activo para el tipo de tarea."""
-            # Buscar perfil por nombre específico (ej: "CONSTRUCTION")
-            profile = cls.load_profile_from_group(active_group_name, task_type)
-            if profile:
-                return profile
+        Los estados salen de ScheduleStateIndex, la apariencia se calcula en NumPy
+        (``frames.snapshot_appearance``) y el estado actual se lee con
+        ``foreach_get``; solo se escriben los objetos cuyo valor cambia.
+        Devuelve el número de objetos con estado.
+        """
+        anim_props = cls.get_animation_props()
+        group_name = cls.get_snapshot_group_name(anim_props)
+        profile_resolver = _seq_data.TaskProfileResolver.for_animation(anim_props)
 
-            # Si no, buscar el perfil "NOTDEFINED" dentro del mismo grupo
-            profile = cls.load_profile_from_group(active_group_name, "NOTDEFINED")
-            if profile:
-                return profile
+        # Los keyframes de una animación previa pisarían el snapshot; sin ellos la
+        # siguiente animación no puede ser incremental
+        cls.last_animation_state = None
+        if bpy.data.actions:
+            for obj in bpy.data.objects:
+                if obj.animation_data:
+                    obj.animation_data_clear()
+
+        index = cls.get_snapshot_object_index()
+        product_ids = index["product_ids"]
+        targets = np.flatnonzero(product_ids >= 0)
+
+        table = _seq_data.ScheduleStateIndex.load(work_schedule, cls.get_work_schedule_props().show_nested_inputs)
+        product_ranks = table.product_states(table.state_codes(date, viz_start, viz_finish))
+        ranks = np.full(len(targets), -1, dtype=np.int64)
+        if len(table.products):
+            pos = np.minimum(np.searchsorted(table.products, product_ids[targets]), len(table.products) - 1)
+            found = table.products[pos] == product_ids[targets]
+            ranks[found] = product_ranks[pos[found]]
+
+        task_ids = np.where(ranks >= 0, cls.get_snapshot_task_ids(index)[targets], 0)
+        profile_index, profiles = cls.get_snapshot_profile_index(task_ids, ranks, profile_resolver, group_name)
+        hidden, colors = _seq_frames.snapshot_appearance(ranks, profile_index, profiles, index["original_colors"][targets])
+        written = cls.write_objects_appearance(targets, hidden, colors)
+
+        cls.set_object_shading()
+        applied_count = int((ranks >= 0).sum())
+        print(f"✅ Snapshot aplicado a {applied_count} objetos ({written} modificados) usando el grupo '{group_name}'")
+        return applied_count
+
+    # Índice de objetos para snapshots en bloque (ver get_snapshot_object_index)
+    _snapshot_object_index: Optional[dict] = None
 
-            # Como último recurso, crear un perfil genérico
-            return cls.create_generic_profile(task_type)
-
-        # 5. Configuración de estados
-        state_configs = {
-            "TO_BUILD": {"state": "start", "default_type": "CONSTRUCTION", "visibility": "hidden"},
-            "IN_CONSTRUCTION": {"state": "in_progress", "default_type": "CONSTRUCTION", "visibility": "visible"},
-            "COMPLETED": {"state": "end", "default_type": "CONSTRUCTION", "visibility": "visible"},
-            "TO_DEMOLISH": {"state": "start", "default_type": "DEMOLITION", "visibility": "visible"},
-            "IN_DEMOLITION": {"state": "in_progress", "default_type": "DEMOLITION", "visibility": "visible"},
-            "DEMOLISHED": {"state": "end", "default_type": "DEMOLITION", "visibility": "hidden"}
+    @classmethod
+    def get_snapshot_object_index(cls) -> dict:
+        """Producto IFC de cada objeto de ``bpy.data.objects`` y su color original.
+
+        Los colores se leen con un único ``foreach_get`` y se conservan entre
+        snapshots, de modo que el color "original" no es el del snapshot anterior.
+        ``bpy.data.objects`` se mantiene ordenado por nombre, así que el índice se
+        valida con el (nombre, puntero) de cada fila: se reconstruye si cambia el
+        archivo IFC o cualquier objeto (renombrado, eliminado o añadido),
+        conservando los colores ya capturados de los objetos que siguen existiendo.
+        """
+        objects = bpy.data.objects
+        ifc_file = tool.Ifc.get()
+        index = cls._snapshot_object_index
+        keys = [(obj.name, obj.as_pointer()) for obj in objects]
+        if index and index["ifc_file"] is ifc_file and index["keys"] == keys:
+            return index
+
+        count = len(objects)
+        colors = np.empty(count * 4, dtype=np.float32)
+        objects.foreach_get("color", colors)
+        colors = colors.reshape(count, 4)
+        previous = dict(zip(index["keys"], index["original_colors"])) if index and index["ifc_file"] is ifc_file else {}
+        product_ids = np.full(count, -1, dtype=np.int64)
+        for i, obj in enumerate(objects):
+            if keys[i] in previous:
+                colors[i] = previous[keys[i]]
+            if obj.type == 'MESH':
+                entity = tool.Ifc.get_entity(obj)
+                if entity:
+                    product_ids[i] = entity.id()
+        cls._snapshot_object_index = {
+            "ifc_file": ifc_file,
+            "keys": keys,
+            "product_ids": product_ids,
+            "original_colors": colors,
+            "task_ids": None,
+            "graph": None,
         }
+        return cls._snapshot_object_index
 
-        task_type_cache = {}
-        applied_count = 0
+    @classmethod
+    def get_snapshot_task_ids(cls, index) -> np.ndarray:
+        """Tarea de cada objeto del índice (primer output, si no primer input; 0 si ninguna)."""
+        graph = _seq_data.ScheduleGraphIndex
+        if not graph.is_loaded or tool.Ifc.get() is not graph.ifc_file:
+            graph.load()
+        if index["graph"] is not graph.data:
+            outputs = graph.first_neighbours("product_output_tasks", index["product_ids"])
+            inputs = graph.first_neighbours("product_input_tasks", index["product_ids"])
+            index["task_ids"] = np.where(outputs > 0, outputs, inputs)
+            index["graph"] = graph.data
+        return index["task_ids"]
 
-        # 6. Aplicar estados visuales
-        for state_name, products in product_states.items():
-            if not products:
-                continue
+    @classmethod
+    def get_snapshot_profile_index(cls, task_ids, ranks, profile_resolver, group_name):
+        """Perfil de cada objeto como índice en una lista de perfiles únicos.
 
-            config = state_configs.get(state_name)
-            if not config:
-                continue
+        Se resuelve una vez por tarea; los objetos sin tarea usan el perfil de
+        reserva del grupo según construyan (CONSTRUCTION) o demuelan (DEMOLITION).
+        """
+        ifc_file = tool.Ifc.get()
+        profiles = []
+        positions = {}
+
+        def position(profile):
+            if profile not in positions:
+                positions[profile] = len(profiles)
+                profiles.append(profile)
+            return positions[profile]
+
+        unique_tasks, inverse = np.unique(task_ids, return_inverse=True)
+        task_profiles = np.array(
+            [position(profile_resolver.get(ifc_file.by_id(t))) if t else -1 for t in unique_tasks.tolist()],
+            dtype=np.int64,
+        )
+        profile_index = task_profiles[inverse.reshape(-1)] if len(task_ids) else np.zeros(0, dtype=np.int64)
+        no_task = profile_index < 0
+        for default_type, mask in (("CONSTRUCTION", ranks < 3), ("DEMOLITION", ranks >= 3)):
+            selected = no_task & mask
+            if selected.any():
+                profile_index[selected] = position(cls.get_snapshot_fallback_profile(group_name, default_type))
+        return profile_index, profiles
+
+    @staticmethod
+    def write_objects_appearance(indices, hidden, colors) -> int:
+        """Escribe visibilidad y color en ``bpy.data.objects[indices]`` solo donde cambian.
+
+        El estado actual se lee en tres ``foreach_get``; las escrituras pasan por
+        la propiedad de cada objeto para que Blender actualice la vista.
+        """
+        objects = bpy.data.objects
+        count = len(objects)
+        hide_viewport = np.empty(count, dtype=bool)
+        hide_render = np.empty(count, dtype=bool)
+        current_colors = np.empty(count * 4, dtype=np.float32)
+        objects.foreach_get("hide_viewport", hide_viewport)
+        objects.foreach_get("hide_render", hide_render)
+        objects.foreach_get("color", current_colors)
+
+        colors = np.asarray(colors, dtype=np.float32)
+        changed_hide = (hide_viewport[indices] != hidden) | (hide_render[indices] != hidden)
+        changed_color = ~hidden & np.any(np.abs(current_colors.reshape(count, 4)[indices] - colors) > 1e-6, axis=1)
+        changed = np.flatnonzero(changed_hide | changed_color)
+        for k in changed.tolist():
+            obj = objects[int(indices[k])]
+            if changed_hide[k]:
+                obj.hide_viewport = obj.hide_render = bool(hidden[k])
+            if changed_color[k]:
+                obj.color = colors[k].tolist()
+        return len(changed)
+
+    @classmethod
+    def get_snapshot_fallback_profile(cls, group_name, task_type):
+        """Perfil para productos sin tarea: el del tipo, el NOTDEFINED del grupo o uno genérico."""
+        return (
+            cls.load_profile_from_group(group_name, task_type)
+            or cls.load_profile_from_group(group_name, "NOTDEFINED")
+            or cls.create_generic_profile(task_type)
+        )
 
-            for obj in products:
-                if not obj: continue
+    @classmethod
+    def get_snapshot_appearance(cls, state_name, profile, original_color):
+        """Devuelve (oculto, color RGBA) de un estado de snapshot; color None si está oculto."""
+        config = cls.SNAPSHOT_STATE_CONFIGS.get(state_name)
+        if config is None:
+            return True, None
 
-                element = tool.Ifc.get_entity(obj)
-                if not element: continue
+        # Si consider_start está activo, usar siempre apariencia de start
+        if getattr(profile, 'consider_start', False):
+            state_key = "start"
+        elif config["visibility"] == "hidden":
+            return True, None
+        else:
+            state_key = config["state"]
 
-                task = cls.get_task_for_product(element)
-                task_type = (task.PredefinedType if task else None) or config["default_type"]
+        if state_key == "start":
+            use_original = getattr(profile, 'use_start_original_color', False)
+            color = original_color if use_original else list(profile.start_color)
+            transparency = getattr(profile, 'start_transparency', 0.0)
+        elif state_key == "in_progress":
+            use_original = getattr(profile, 'use_active_original_color', False)
+            color = original_color if use_original else list(profile.in_progress_color)
+            transparency = (getattr(profile, 'active_start_transparency', 0.0) + getattr(profile, 'active_finish_transparency', 0.0)) / 2.0
+        else:
+            use_original = getattr(profile, 'use_end_original_color', True)
+            color = original_color if use_original else list(profile.end_color)
+            transparency = getattr(profile, 'end_transparency', 0.0)
+
+        return False, (color[0], color[1], color[2], 1.0 - transparency)
+
+    @classmethod
+    def get_snapshot_object_appearance(cls, obj, state_name, profile_resolver, group_name, original_color, task_cache=None):
+        """Apariencia de snapshot de un objeto: resuelve su tarea (cacheada) y su perfil."""
+        config = cls.SNAPSHOT_STATE_CONFIGS.get(state_name)
+        if config is None:
+            return True, None
+        task_cache = {} if task_cache is None else task_cache
+        if obj.name not in task_cache:
+            task_cache[obj.name] = cls.get_task_for_product(obj)
+        task = task_cache[obj.name]
+        if task:
+            profile = profile_resolver.get(task)
+        else:
+            profile = cls.get_snapshot_fallback_profile(group_name, config["default_type"])
+        return cls.get_snapshot_appearance(state_name, profile, original_color)
 
-                profile = get_task_profile(task_type)
-                original_color = original_properties.get(obj.name, {}).get("color", [1,1,1,1])
+    @staticmethod
+    def apply_object_appearance(obj, hidden, color=None):
+        obj.hide_viewport = hidden
+        obj.hide_render = hidden
+        if color is not None:
+            obj.color = color
 
-                # NUEVA LÓGICA: Si consider_start está activo, usar siempre apariencia de start
-                if getattr(profile, 'consider_start', False):
-                    # Forzar estado "start" independientemente del estado real del cronograma
-                    obj.hide_viewport = False
-                    obj.hide_render = False
+    # Estado del scrub interactivo de fecha de snapshot (ver begin_snapshot_scrub)
+    snapshot_scrub_state: Optional[dict] = None
 
-                    use_original = getattr(profile, 'use_start_original_color', False)
-                    color = original_color if use_original else list(profile.start_color)
-                    transparency = getattr(profile, 'start_transparency', 0.0)
+    @classmethod
+    def begin_snapshot_scrub(cls, work_schedule, date, viz_start=None, viz_finish=None):
+        """Aplica el snapshot en ``date`` y prepara lo necesario para moverlo de fecha.
 
-                    obj.color = (color[0], color[1], color[2], 1.0 - transparency)
-                    applied_count += 1
-                    print(f"✅ Snapshot: {obj.name} usa consider_start=True, aplicando apariencia de start")
-                    continue
+        Guarda el índice de estados, el objeto y color original de cada producto,
+        el resolvedor de perfiles y el estado actual de cada producto, para que
+        ``update_snapshot_scrub`` solo toque los objetos que cambian de estado.
+        """
+        table = _seq_data.ScheduleStateIndex.load(work_schedule, cls.get_work_schedule_props().show_nested_inputs)
+        index = cls.get_snapshot_object_index()
+        cls.show_snapshot_at(work_schedule, date, viz_start, viz_finish)
+
+        # Objeto y color original (cacheado) de cada producto del índice de estados
+        object_index = np.full(len(table.products), -1, dtype=np.int64)
+        product_ids = index["product_ids"]
+        if len(product_ids) and len(table.products):
+            order = np.argsort(product_ids, kind="stable")
+            sorted_ids = product_ids[order]
+            pos = np.minimum(np.searchsorted(sorted_ids, table.products), len(sorted_ids) - 1)
+            found = sorted_ids[pos] == table.products
+            object_index[found] = order[pos[found]]
+        objects = [bpy.data.objects[i] if i >= 0 else None for i in object_index.tolist()]
+        original_colors = [index["original_colors"][i].tolist() if i >= 0 else [1, 1, 1, 1] for i in object_index.tolist()]
 
-                # Aplicar visibilidad normal solo si consider_start está desactivado
-                if config["visibility"] == "hidden":
-                    obj.hide_viewport = True
-                    obj.hide_render = True
-                    applied_count += 1
-                    continue
-                else:
-                    obj.hide_viewport = False
-                    obj.hide_render = False
-
-                # Aplicar color y transparencia
-                state_key = config["state"]
-                color = [1,1,1,1]
-                transparency = 0.0
-
-                if state_key == "start":
-                    use_original = getattr(profile, 'use_start_original_color', False)
-                    color = original_color if use_original else list(profile.start_color)
-                    transparency = getattr(profile, 'start_transparency', 0.0)
-                elif state_key == "in_progress":
-                    use_original = getattr(profile, 'use_active_original_color', False)
-                    color = original_color if use_original else list(profile.in_progress_color)
-                    transparency = (getattr(profile, 'active_start_transparency', 0.0) + getattr(profile, 'active_finish_transparency', 0.0)) / 2.0
-                elif state_key == "end":
-                    use_original = getattr(profile, 'use_end_original_color', True)
-                    color = original_color if use_original else list(profile.end_color)
-                    transparency = getattr(profile, 'end_transparency', 0.0)
-
-                obj.color = (color[0], color[1], color[2], 1.0 - transparency)
-                applied_count += 1
+        anim_props = cls.get_animation_props()
+        layers = cls.get_animation_profile_layers(anim_props)
+        cls.snapshot_scrub_state = {
+            "table": table,
+            "objects": objects,
+            "original_colors": original_colors,
+            "profile_resolver": _seq_data.TaskProfileResolver.for_animation(anim_props),
+            "group_name": layers[0].group_name if layers else "DEFAULT",
+            "task_cache": {},
+            "viz_start": viz_start,
+            "viz_finish": viz_finish,
+            "date": date,
+            "ranks": table.product_states(table.state_codes(date, viz_start, viz_finish)),
+        }
 
-        # Al final, asegurar que objetos no procesados permanezcan ocultos
-        processed_objects = set()
-        for state_name, products in product_states.items():
-            for obj in products:
-                if obj:
-                    processed_objects.add(obj)
+    @classmethod
+    def update_snapshot_scrub(cls, date) -> int:
+        """Mueve el snapshot a ``date`` tocando solo los productos que cambiaron de estado."""
+        state = cls.snapshot_scrub_state
+        if not state:
+            return 0
+        table = state["table"]
+        ranks = table.product_states(table.state_codes(date, state["viz_start"], state["viz_finish"]))
+        changed = np.flatnonzero(ranks != state["ranks"]).tolist()
+        for i in changed:
+            obj = state["objects"][i]
+            if not obj:
+                continue
+            rank = int(ranks[i])
+            state_name = _seq_frames.SNAPSHOT_STATE_ORDER[rank] if rank >= 0 else None
+            hidden, color = cls.get_snapshot_object_appearance(
+                obj, state_name, state["profile_resolver"], state["group_name"], state["original_colors"][i], state["task_cache"]
+            )
+            cls.apply_object_appearance(obj, hidden, color)
+        state["ranks"] = ranks
+        state["date"] = date
+        return len(changed)
 
-        # Asegurar que objetos no procesados permanezcan ocultos
-        for obj in bpy.data.objects:
-            if (obj.type == 'MESH' and
-                tool.Ifc.get_entity(obj) and
-                obj not in processed_objects):
-                obj.hide_viewport = True
-                obj.hide_render = True
+    @classmethod
+    def end_snapshot_scrub(cls):
+        cls.snapshot_scrub_state = None
 
-        # 7. Configurar la vista 3D
-        cls.set_object_shading()
-        print(f"✅ Snapshot aplicado a {applied_count} objetos usando el grupo '{active_group_name}'")
+    @classmethod
+    def get_snapshot_series_dates(cls, start, finish, frequency="WEEKLY", interval=1, weekday="MO") -> list:
+        """Fechas de una serie recurrente entre ``start`` y ``finish`` (p. ej. todos los lunes)."""
+        from dateutil import rrule
+
+        kwargs = {"dtstart": start, "until": finish, "interval": max(1, int(interval))}
+        if frequency == "WEEKLY" and weekday:
+            kwargs["byweekday"] = getattr(rrule, weekday)
+        return list(rrule.rrule(getattr(rrule, frequency), **kwargs))
+
+    @classmethod
+    def export_snapshot_series(cls, work_schedule, dates, directory, camera=None, prefix="snapshot_") -> list[str]:
+        """Renderiza un still por fecha a ``directory`` con un único índice de estados.
+
+        La primera fecha aplica el snapshot completo y las siguientes solo el
+        delta de objetos que cambian de estado (la misma sesión que el scrub
+        interactivo); nada se reconstruye entre fechas. No usa la interfaz, así
+        que funciona con ``blender -b``. Al terminar se restauran la animación 4D,
+        la cámara y el sombreado. Devuelve las rutas escritas (sin extensión).
+        """
+        dates = sorted(dates)
+        if not dates:
+            return []
+        scene = bpy.context.scene
+        render = scene.render
+        if not (camera or scene.camera):
+            raise ValueError("No camera available for rendering snapshots")
+
+        directory = bpy.path.abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        viz_start, viz_finish = cls.get_visualization_date_range()
+        written = []
+        # Los snapshots borran los keyframes de cada objeto: guardar la animación para restaurarla
+        saved_animation = cls.snapshot_animation_state()
+        previous_camera, previous_filepath = scene.camera, render.filepath
+        previous_color_type = scene.display.shading.color_type
+        try:
+            if camera:
+                scene.camera = camera
+            if render.engine == "BLENDER_WORKBENCH":
+                scene.display.shading.color_type = "OBJECT"
+            cls.begin_snapshot_scrub(work_schedule, dates[0], viz_start, viz_finish)
+            for date in dates:
+                changed = cls.update_snapshot_scrub(date)
+                render.filepath = os.path.join(directory, f"{prefix}{date.strftime('%Y-%m-%d')}")
+                bpy.ops.render.render(write_still=True)
+                written.append(render.filepath)
+                print(f"📸 Snapshot {date.strftime('%Y-%m-%d')}: {changed} objetos actualizados -> {render.filepath}")
+        finally:
+            cls.end_snapshot_scrub()
+            cls.restore_animation_state(saved_animation)
+            scene.camera, render.filepath = previous_camera, previous_filepath
+            scene.display.shading.color_type = previous_color_type
+        return written
 
     @classmethod
     def get_task_for_product(cls, product):
@@ -2482,19 +2830,12 @@ class Sequence(bonsai.core.tool.Sequence):
         if not element:
             return None
 
-        # Buscar en outputs
-        for rel in element.ReferencedBy or []:
-            if rel.is_a("IfcRelAssignsToProduct"):
-                for task in rel.RelatedObjects:
-                    if task.is_a("IfcTask"):
-                        return task
-
-        # Buscar en inputs
-        for rel in element.HasAssignments or []:
-            if rel.is_a("IfcRelAssignsToProcess"):
-                task = rel.RelatingProcess
-                if task.is_a("IfcTask"):
-                    return task
+        # Buscar en outputs y luego en inputs
+        graph = _seq_data.ScheduleGraphIndex
+        for relation in ("product_output_tasks", "product_input_tasks"):
+            task_ids = graph.neighbours(relation, element.id())
+            if len(task_ids):
+                return tool.Ifc.get().by_id(int(task_ids[0]))
 
         return None
     @classmethod
@@ -2661,41 +3002,34 @@ class Sequence(bonsai.core.tool.Sequence):
 
     @classmethod
     def get_animation_product_frames(cls, work_schedule: ifcopenshell.entity_instance, settings: dict[str, Any]):
-
-            def add_product_frame(product_id, type, product_start, product_finish, relationship):
-                product_frames.setdefault(product_id, []).append(
-                    {
-                        "type": type,
-                        "relationship": relationship,
-                        "STARTED": round(
-                            settings["start_frame"]
-                            + (((product_start - settings["start"]) / settings["duration"]) * settings["total_frames"])
-                        ),
-                        "COMPLETED": round(
-                            settings["start_frame"]
-                            + (((product_finish - settings["start"]) / settings["duration"]) * settings["total_frames"])
-                        ),
-                    }
-                )
+            ifc_file = tool.Ifc.get()
+            task_dates = [
+                (task_id, start, finish)
+                for task_id, (start, finish) in _seq_data.DerivedDateIndex.load(work_schedule).items()
+                if start and finish
+            ]
+            start_frames, finish_frames, _ = _seq_frames.frames_from_settings(
+                [start for _, start, _ in task_dates], [finish for _, _, finish in task_dates], settings
+            )
 
             product_frames = {}
-            for root_task in ifcopenshell.util.sequence.get_root_tasks(work_schedule):
-                preprocess_task(root_task)
+            for (task_id, _, _), started, completed in zip(task_dates, start_frames.tolist(), finish_frames.tolist()):
+                task = ifc_file.by_id(task_id)
+                frame = {"type": task.PredefinedType, "STARTED": started, "COMPLETED": completed}
+                for output_id in _seq_data.ScheduleGraphIndex.task_products("task_outputs", task_id):
+                    product_frames.setdefault(output_id, []).append(dict(frame, relationship="output"))
+                for input_prod in cls.get_task_inputs(task):
+                    product_frames.setdefault(input_prod.id(), []).append(dict(frame, relationship="input"))
             return product_frames
+
     @classmethod
     def create_default_profile_group(cls):
             """
             Crea automáticamente el grupo DEFAULT con perfiles para cada PredefinedType.
             Este grupo se usa cuando el usuario no ha configurado ningún perfil.
             """
-            import json
             scene = bpy.context.scene
-            key = "BIM_AppearanceProfileSets"
-            raw = scene.get(key, "{}")
-            try:
-                data = json.loads(raw) if isinstance(raw, str) else {}
-            except Exception:
-                data = {}
+            data = _seq_data.ProfileStore.load(scene, copy=True)
             if "DEFAULT" not in data:
                 default_profiles = {
                     "CONSTRUCTION": {"start": [1, 1, 1, 0], "active": [0, 1, 0, 1], "end": [0.3, 1, 0.3, 1]},
@@ -2730,80 +3064,68 @@ class Sequence(bonsai.core.tool.Sequence):
                         "end_transparency": 0.0
                     })
                 data["DEFAULT"] = {"profiles": profiles}
-                scene[key] = json.dumps(data)
+                _seq_data.ProfileStore.write(data, scene)
 
     # ==================================================================
     # === 1. FUNCIÓN CORREGIDA (PREPARACIÓN DE DATOS) ==================
     # ==================================================================
     @classmethod
     def get_animation_product_frames_enhanced(cls, work_schedule: ifcopenshell.entity_instance, settings: dict[str, Any]):
+        """Calcula los frames por producto como un ProductFrameTable columnar.
+
+        La tabla se comporta como el dict legado {product_id: [frame_data, ...]},
+        pero guarda una fila compacta por par producto-tarea en arrays NumPy.
+        """
         animation_start = int(settings["start_frame"])
         animation_end = int(settings["start_frame"] + settings["total_frames"])
         viz_start = settings["start"]
         viz_finish = settings["finish"]
-        viz_duration = settings["duration"]
-        product_frames: dict[int, list] = {}
+        builder = _seq_frames.ProductFrameTableBuilder(animation_start, animation_end)
+        empty = (animation_start, animation_start - 1)
+        show_nested_inputs = cls.get_work_schedule_props().show_nested_inputs
 
-        def add_product_frame_enhanced(product_id, task, start_date, finish_date, start_frame, finish_frame, relationship):
+        def compute_states(start_date, finish_date, start_frame, finish_frame):
             if finish_date < viz_start:
-                states = {
-                    "before_start": (animation_start, animation_start - 1),
-                    "active": (animation_start, animation_start - 1),
-                    "after_end": (animation_start, animation_end),
-                }
-            elif start_date > viz_finish:
-                return
-            else:
-                s_vis = max(animation_start, int(start_frame))
-                f_vis = min(animation_end, int(finish_frame))
-                if f_vis < s_vis:
-                    s_vis = max(animation_start, min(animation_end, s_vis))
-                    f_vis = s_vis
-                before_end = s_vis - 1
-                after_start = f_vis + 1
-                states = {
-                    "before_start": (animation_start, before_end) if before_end >= animation_start else (animation_start, animation_start - 1),
-                    "active": (s_vis, f_vis),
-                    "after_end": (after_start if after_start <= animation_end else animation_end + 1, animation_end),
-                }
+                return (empty, empty, (animation_start, animation_end))
+            s_vis = max(animation_start, int(start_frame))
+            f_vis = min(animation_end, int(finish_frame))
+            if f_vis < s_vis:
+                s_vis = max(animation_start, min(animation_end, s_vis))
+                f_vis = s_vis
+            before_end = s_vis - 1
+            after_start = f_vis + 1
+            return (
+                (animation_start, before_end) if before_end >= animation_start else empty,
+                (s_vis, f_vis),
+                (after_start if after_start <= animation_end else animation_end + 1, animation_end),
+            )
 
-            product_frames.setdefault(product_id, []).append({
-                "task": task, "task_id": task.id(),
-                "type": getattr(task, "PredefinedType", "NOTDEFINED"),
-                "relationship": relationship,
-                "start_date": start_date, "finish_date": finish_date,
-                "STARTED": int(start_frame), "COMPLETED": int(finish_frame),
-                "start_frame": max(animation_start, int(start_frame)),
-                "finish_frame": min(animation_end, int(finish_frame)),
-                "states": states,
-            })
-
-        def add_product_frame_full_range(product_id, task, relationship):
-            states = { "active": (animation_start, animation_end) }
-            product_frames.setdefault(product_id, []).append({
-                "task": task, "task_id": task.id(),
-                "type": getattr(task, "PredefinedType", "NOTDEFINED"),
-                "relationship": relationship,
-                "start_date": viz_start, "finish_date": viz_finish,
-                "STARTED": animation_start, "COMPLETED": animation_end,
-                "start_frame": animation_start, "finish_frame": animation_end,
-                "states": states,
-                "consider_start_active": True,
-            })
-            print(f"🔒 Product {product_id}: Frame de rango completo (ignora fechas) creado.")
-
-        def preprocess_task(task):
-            for subtask in ifcopenshell.util.sequence.get_nested_tasks(task):
-                preprocess_task(subtask)
+        def add_task_rows(task, start_frame, finish_frame, states, full_range=False):
+            task_id = task.id()
+            outputs = _seq_data.ScheduleGraphIndex.task_products("task_outputs", task_id)
+            inputs = _seq_data.ScheduleGraphIndex.task_products("task_inputs", task_id, show_nested_inputs)
+            builder.add_rows(task_id, outputs, "output", start_frame, finish_frame, states, full_range)
+            builder.add_rows(task_id, inputs, "input", start_frame, finish_frame, states, full_range)
 
-            task_start = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-            task_finish = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
-            if not task_start or not task_finish:
-                return
+        # Fechas derivadas de todas las tareas (en post-orden) y frames en un solo cálculo
+        ifc_file = tool.Ifc.get()
+        task_dates = [
+            (task_id, start, finish)
+            for task_id, (start, finish) in _seq_data.DerivedDateIndex.load(work_schedule).items()
+            if start and finish
+        ]
+        start_frames, finish_frames, _ = _seq_frames.frames_from_settings(
+            [start for _, start, _ in task_dates], [finish for _, _, finish in task_dates], settings
+        )
+
+        # Perfiles de todas las tareas resueltos con una sola pasada por el árbol de tareas
+        resolver = _seq_data.TaskProfileResolver.for_animation(cls.get_animation_props())
+        for (task_id, task_start, task_finish), sf, ff in zip(task_dates, start_frames.tolist(), finish_frames.tolist()):
+            task = ifc_file.by_id(task_id)
 
             # === CAMBIO CLAVE ===
             # Obtener el perfil completo para verificar la combinación de estados, no solo 'consider_start'.
-            profile = cls._get_best_profile_for_task(task, cls.get_animation_props())
+            profile = resolver.get(task)
             is_priority_mode = (
                 getattr(profile, 'consider_start', False) and
                 not getattr(profile, 'consider_active', True) and
@@ -2813,34 +3135,18 @@ class Sequence(bonsai.core.tool.Sequence):
             # Si es modo prioritario, IGNORAR FECHAS y usar el rango completo.
             if is_priority_mode:
                 print(f"🔒 Tarea '{task.Name}' en modo prioritario. Ignorando fechas.")
-                for output in ifcopenshell.util.sequence.get_task_outputs(task):
-                    add_product_frame_full_range(output.id(), task, "output")
-                for input_prod in cls.get_task_inputs(task):
-                    add_product_frame_full_range(input_prod.id(), task, "input")
-                return
+                builder.add_task(task, viz_start, viz_finish)
+                add_task_rows(task, animation_start, animation_end, (empty, (animation_start, animation_end), empty), True)
+                continue
 
             # Si NO es modo prioritario, usar las fechas de la tarea para calcular los fotogramas.
             if task_start > viz_finish:
-                return
-
-            if viz_duration.total_seconds() > 0:
-                start_progress = (task_start - viz_start).total_seconds() / viz_duration.total_seconds()
-                finish_progress = (task_finish - viz_start).total_seconds() / viz_duration.total_seconds()
-            else:
-                start_progress, finish_progress = 0.0, 1.0
-
-            sf = int(round(settings["start_frame"] + (start_progress * settings["total_frames"])))
-            ff = int(round(settings["start_frame"] + (finish_progress * settings["total_frames"])))
-
-            for output in ifcopenshell.util.sequence.get_task_outputs(task):
-                add_product_frame_enhanced(output.id(), task, task_start, task_finish, sf, ff, "output")
-            for input_prod in cls.get_task_inputs(task):
-                add_product_frame_enhanced(input_prod.id(), task, task_start, task_finish, sf, ff, "input")
+                continue
 
-        for root_task in ifcopenshell.util.sequence.get_root_tasks(work_schedule):
-            preprocess_task(root_task)
+            builder.add_task(task, task_start, task_finish)
+            add_task_rows(task, sf, ff, compute_states(task_start, task_finish, sf, ff))
 
-        return product_frames
+        return builder.build()
 
     @classmethod
     def get_assigned_profile_for_task(cls, task, animation_props, active_group_name=None):
@@ -2893,50 +3199,19 @@ class Sequence(bonsai.core.tool.Sequence):
 
     @classmethod
     def load_profile_from_group(cls, group_name, profile_name):
-        import bpy, json
-        scene = bpy.context.scene
-        raw = scene.get("BIM_AppearanceProfileSets", "{}")
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-        except Exception:
-            data = {}
-        group_data = data.get(group_name, {})
-        for prof_data in group_data.get("profiles", []):
-            if prof_data.get("name") == profile_name:
-                return type('AppearanceProfile', (object,), {
-                    'name': prof_data.get("name", ""),
-                    'consider_start': prof_data.get("consider_start", True),
-                    'consider_active': prof_data.get("consider_active", True),
-                    'consider_end': prof_data.get("consider_end", True),
-                    'start_color': prof_data.get("start_color", [1,1,1,1]),
-                    'in_progress_color': prof_data.get("in_progress_color", [1,1,0,1]),
-                    'end_color': prof_data.get("end_color", [0,1,0,1]),
-                    'use_start_original_color': prof_data.get("use_start_original_color", False),
-                    'use_active_original_color': prof_data.get("use_active_original_color", False),
-                    'use_end_original_color': prof_data.get("use_end_original_color", True),
-                    'start_transparency': prof_data.get("start_transparency", 0.0),
-                    'active_start_transparency': prof_data.get("active_start_transparency", 0.0),
-                    'active_finish_transparency': prof_data.get("active_finish_transparency", 0.0),
-                    'active_transparency_interpol': prof_data.get("active_transparency_interpol", 1.0),
-                    'end_transparency': prof_data.get("end_transparency", 0.0),
-                    'hide_at_end': bool(prof_data.get("hide_at_end", prof_data.get("name") in {"DEMOLITION","REMOVAL","DISPOSAL","DISMANTLE"})),
-                })()
-        return None
+        """Perfil ``profile_name`` del grupo (AppearanceProfileRecord internado) o None."""
+        return _seq_data.ProfileStore.get_profile(group_name, profile_name)
 
     @classmethod
     def sync_active_group_to_json(cls):
         """Sincroniza los perfiles del grupo activo de la UI al JSON de la escena"""
-        import bpy, json
+        import bpy
         scene = bpy.context.scene
         anim_props = cls.get_animation_props()
         active_group = getattr(anim_props, "profile_groups", None)
         if not active_group:
             return
-        raw = scene.get("BIM_AppearanceProfileSets", "{}")
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else (raw or {})
-        except Exception:
-            data = {}
+        data = _seq_data.ProfileStore.load(scene, copy=True)
         profiles_data = []
         for profile in getattr(anim_props, "profiles", []):
             try:
@@ -2961,49 +3236,409 @@ class Sequence(bonsai.core.tool.Sequence):
             except Exception:
                 pass
         data[active_group] = {"profiles": profiles_data}
-        scene["BIM_AppearanceProfileSets"] = json.dumps(data)
+        _seq_data.ProfileStore.write(data, scene)
     @classmethod
-    def animate_objects_with_profiles(cls, settings, product_frames):
-        animation_props = cls.get_animation_props()
-        # Lógica del grupo activo (stack → DEFAULT)
-        active_group_name = None
+    def get_animation_profile_layers(cls, animation_props=None) -> list:
+        """Capas habilitadas del Animation Stack (mayor prioridad primero) con sus canales."""
+        animation_props = animation_props or cls.get_animation_props()
+        layers = []
         for item in getattr(animation_props, "animation_group_stack", []):
             if getattr(item, "enabled", False) and getattr(item, "group", None):
-                active_group_name = item.group
-                break
-        if not active_group_name:
-            active_group_name = "DEFAULT"
-        print(f"🎬 INICIANDO ANIMACIÓN: Usando el grupo de perfiles '{active_group_name}'")
+                channels = frozenset(
+                    channel
+                    for channel in _seq_data.PROFILE_CHANNELS
+                    if getattr(item, f"use_{channel}", True)
+                )
+                layers.append(_seq_data.ProfileLayer(item.group, channels))
+        return layers
+
+    @classmethod
+    def get_profile_signature(cls, profile) -> tuple:
+        """Firma hashable de los valores de un perfil (para detectar cambios)."""
+        if isinstance(profile, _seq_data.AppearanceProfileRecord):
+            return profile  # ya es inmutable y hashable
+        signature = []
+        for field in (
+            "name", "consider_start", "consider_active", "consider_end",
+            "start_color", "in_progress_color", "end_color",
+            "use_start_original_color", "use_active_original_color", "use_end_original_color",
+            "start_transparency", "active_start_transparency", "active_finish_transparency",
+            "active_transparency_interpol", "end_transparency", "hide_at_end",
+        ):
+            value = getattr(profile, field, None)
+            if not isinstance(value, (str, int, float, bool, type(None))):
+                value = tuple(value)  # colores (bpy_prop_array / list)
+            signature.append(value)
+        return tuple(signature)
+
+    @classmethod
+    def get_animation_state_key(cls, settings) -> tuple:
+        # El stack de grupos no forma parte de la clave: sus cambios llegan como
+        # cambios de perfil por tarea y solo se reescriben los productos afectados
+        return (
+            settings["start"],
+            settings["finish"],
+            int(settings["start_frame"]),
+            int(settings["total_frames"]),
+        )
 
+    @classmethod
+    def can_animate_incrementally(cls, settings) -> bool:
+        """True si existe una animación previa compatible (mismo archivo y rango)."""
+        state = cls.last_animation_state
+        return bool(
+            state
+            and state["ifc_file"] is tool.Ifc.get()
+            and state["key"] == cls.get_animation_state_key(settings)
+        )
+
+    @classmethod
+    def resolve_task_profiles(cls, frame_table, animation_props, resolver=None) -> dict:
+        """Perfil compuesto (Animation Stack) de cada tarea de la tabla de frames: {task_id: perfil}."""
+        ifc_file = tool.Ifc.get()
+        resolver = resolver or _seq_data.TaskProfileResolver.for_animation(animation_props)
+        return {
+            task_id: resolver.get(task or ifc_file.by_id(task_id))
+            for task_id, (task, *_) in frame_table.tasks.items()
+        }
+
+    @classmethod
+    def animate_objects_with_profiles(cls, settings, product_frames, incremental=False, share_actions=False):
+        """Anima los objetos según sus frames y perfiles de apariencia.
+
+        Con ``incremental`` se compara la tabla de frames (y los perfiles) con la
+        animación anterior y solo se reescriben los productos que cambiaron.
+        Con ``share_actions`` los objetos con la misma línea de tiempo (perfil,
+        estados, relación y color original si se usa) comparten un único Action.
+        Devuelve el número de productos reescritos.
+        """
+        steps = cls.iter_animate_objects_with_profiles(settings, product_frames, incremental, share_actions)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    @classmethod
+    def iter_animate_objects_with_profiles(cls, settings, product_frames, incremental=False, share_actions=False):
+        """Versión por pasos de animate_objects_with_profiles.
+
+        Produce ``(procesados, total)`` tras cada objeto para poder repartir el
+        trabajo entre ticks de un operador modal; el valor de retorno del
+        generador es el número de productos reescritos.
+        """
+        animation_props = cls.get_animation_props()
+        # Capas del Animation Stack (→ DEFAULT) que componen los perfiles
+        stack_groups = [layer.group_name for layer in cls.get_animation_profile_layers(animation_props)] or ["DEFAULT"]
+        print(f"🎬 INICIANDO ANIMACIÓN: Usando el stack de perfiles {' > '.join(stack_groups)}")
+
+        # Acepta tanto ProductFrameTable como el dict legado
+        frame_table = _seq_frames.ProductFrameTable.from_mapping(
+            product_frames, int(settings["start_frame"]), int(settings["start_frame"] + settings["total_frames"])
+        )
+
+        # Perfil resuelto una sola vez por tarea
+        ifc_file = tool.Ifc.get()
+        task_profiles = cls.resolve_task_profiles(frame_table, animation_props)
+        task_signatures = {task_id: cls.get_profile_signature(profile) for task_id, profile in task_profiles.items()}
+        signatures = frame_table.product_signatures(task_signatures)
+        uses_original_color = {
+            task_id: any(
+                getattr(profile, attr, default)
+                for attr, default in (
+                    ("use_start_original_color", False),
+                    ("use_active_original_color", False),
+                    ("use_end_original_color", True),
+                )
+            )
+            for task_id, profile in task_profiles.items()
+        }
+        shared_actions = {}
+
+        changed = None
+        # Color original de cada producto animado; se reutiliza en la siguiente
+        # actualización incremental, cuando obj.color ya es el color animado
         original_colors = {}
-        for obj in bpy.data.objects:
+        if incremental and cls.can_animate_incrementally(settings):
+            changed = _seq_frames.changed_products(cls.last_animation_state["signatures"], signatures)
+            original_colors = dict(cls.last_animation_state.get("original_colors", {}))
+            print(f"♻️ Actualización incremental: {len(changed)} productos con cambios")
+
+        def animate_object(obj) -> bool:
+            element = tool.Ifc.get_entity(obj)
+            if not element:
+                return False
+
+            if changed is not None:
+                if element.id() not in changed:
+                    return False
+                # Guardar el color original antes de reiniciar el objeto
+                if obj.type == 'MESH':
+                    original_colors.setdefault(element.id(), list(obj.color))
+                # Reiniciar solo los objetos que cambiaron
+                if obj.animation_data:
+                    obj.animation_data_clear()
+                obj.hide_viewport = False
+                obj.hide_render = False
+                obj.color = (1.0, 1.0, 1.0, 1.0)
+
+            if element.is_a("IfcSpace"):
+                cls.hide_object(obj)
+                return False
+
             if obj.type == 'MESH':
-                original_colors[obj.name] = list(obj.color)
+                original_color = original_colors.setdefault(element.id(), list(obj.color))
+            else:
+                original_color = [1.0, 1.0, 1.0, 1.0]
+
+            rows = frame_table.rows(element.id())
+            if not rows:
+                # Ocultar objetos que están fuera del rango de visualización
+                obj.hide_viewport = True
+                obj.hide_render = True
+                return True
+
+            shared_key = None
+            if share_actions:
+                needs_color = any(uses_original_color[t] for t in frame_table.task_id[rows.start:rows.stop].tolist())
+                shared_key = (
+                    frame_table.timeline_key(rows, task_signatures),
+                    tuple(round(c, 4) for c in original_color) if needs_color else None,
+                )
+                action = shared_actions.get(shared_key)
+                if action is not None:
+                    if not obj.animation_data:
+                        obj.animation_data_create()
+                    cls.assign_action(obj, action)
+                    return True
+
+            # Todas las filas del objeto en un único lote de F-curves
+            batch = cls.new_keyframe_batch()
+            for row in rows:
+                frame_data = frame_table.frame_data(row)
+                profile = task_profiles[frame_data["task_id"]]
+                cls.apply_profile_animation(obj, frame_data, profile, original_color, settings, batch)
+            batch.apply(obj)
+            if shared_key is not None and obj.animation_data and obj.animation_data.action:
+                action = obj.animation_data.action
+                action.name = f"4D_Shared_Action_{len(shared_actions)}"
+                shared_actions[shared_key] = action
+            return True
+
+        objects = list(bpy.data.objects)
+        rewritten = 0
+        for done, obj in enumerate(objects, 1):
+            rewritten += animate_object(obj)
+            yield done, len(objects)
 
+        if share_actions:
+            print(f"🔗 {len(shared_actions)} Actions compartidos para {rewritten} productos")
+
+        cls.last_animation_state = {
+            "ifc_file": ifc_file,
+            "key": cls.get_animation_state_key(settings),
+            "signatures": signatures,
+            "original_colors": original_colors,
+        }
+
+        area = tool.Blender.get_view3d_area()
+        try:
+            area.spaces[0].shading.color_type = "OBJECT"
+        except Exception:
+            pass
+        bpy.context.scene.frame_start = settings["start_frame"]
+        bpy.context.scene.frame_end = int(settings["start_frame"] + settings["total_frames"] + 1)
+        return rewritten
+
+    @classmethod
+    def snapshot_animation_state(cls) -> dict:
+        """Guarda la animación actual de los productos para poder deshacer una creación cancelada."""
+        objects = {}
+        for obj in bpy.data.objects:
+            if not tool.Ifc.get_entity(obj):
+                continue
+            rows, color = obj.get("BIM4D_rows"), obj.get("BIM4D_color")
+            objects[obj.name] = (
+                obj.animation_data.action if obj.animation_data else None,
+                obj.hide_viewport,
+                obj.hide_render,
+                tuple(obj.color),
+                list(rows) if rows is not None else None,
+                list(color) if color is not None else None,
+            )
+        scene = bpy.context.scene
+        return {
+            "objects": objects,
+            "scene": {key: scene.get(key) for key in ("BIM4D_range", "BIM4D_profiles")},
+            "last_animation_state": cls.last_animation_state,
+            "attribute_animation_state": cls.attribute_animation_state,
+            "attribute_handler": cls._attribute_frame_handler is not None,
+        }
+
+    @classmethod
+    def assign_action(cls, obj, action) -> None:
+        """Asigna una Action compartida; en Blender 4.4+ también su slot de objeto."""
+        animation_data = obj.animation_data
+        animation_data.action = action
+        if hasattr(animation_data, "action_slot"):
+            slots = [slot for slot in action.slots if slot.target_id_type == "OBJECT"] or list(action.slots)
+            if slots and animation_data.action_slot != slots[0]:
+                animation_data.action_slot = slots[0]
+
+    @classmethod
+    def restore_animation_state(cls, snapshot: dict) -> None:
+        """Restaura el estado guardado por snapshot_animation_state."""
+        cls._unregister_attribute_animation_handler()
+        for name, (action, hide_viewport, hide_render, color, rows, attribute_color) in snapshot["objects"].items():
+            obj = bpy.data.objects.get(name)
+            if not obj:
+                continue
+            if obj.animation_data:
+                obj.animation_data_clear()
+            if action is not None:
+                obj.animation_data_create()
+                cls.assign_action(obj, action)
+            obj.hide_viewport = hide_viewport
+            obj.hide_render = hide_render
+            obj.color = color
+            for key, value in (("BIM4D_rows", rows), ("BIM4D_color", attribute_color)):
+                if value is not None:
+                    obj[key] = value
+                elif key in obj:
+                    del obj[key]
+        scene = bpy.context.scene
+        for key, value in snapshot["scene"].items():
+            if value is not None:
+                scene[key] = value
+            elif key in scene:
+                del scene[key]
+        cls.last_animation_state = snapshot["last_animation_state"]
+        cls.attribute_animation_state = snapshot["attribute_animation_state"]
+        cls._attribute_cache = None
+        if snapshot["attribute_handler"]:
+            cls.register_attribute_animation_handler()
+
+    # === Modo por atributos (sin keyframes) ===
+    # Cada producto guarda sus filas (fechas de tarea, relación, rango completo,
+    # perfil) en propiedades personalizadas; un único handler frame_change_pre
+    # resuelve visibilidad y color para el frame actual.
+    attribute_animation_state: Optional[dict] = None
+    _attribute_frame_handler = None
+    _attribute_cache = None
+
+    @classmethod
+    def can_update_attribute_animation(cls) -> bool:
+        state = cls.attribute_animation_state
+        return bool(state and state["ifc_file"] is tool.Ifc.get())
+
+    @classmethod
+    def set_attribute_animation_range(cls, settings) -> None:
+        """Correspondencia frame → fecha; es lo único que cambia al modificar el rango."""
+        viz_start, viz_finish = _seq_frames.to_epoch_seconds([settings["start"], settings["finish"]]).tolist()
+        bpy.context.scene["BIM4D_range"] = json.dumps(
+            {
+                "start": viz_start,
+                "finish": viz_finish,
+                "start_frame": int(settings["start_frame"]),
+                "total_frames": int(settings["total_frames"]),
+            }
+        )
+        cls._attribute_cache = None if cls._attribute_cache is None else cls._attribute_cache[:2] + (None,)
+
+    @classmethod
+    def animate_objects_with_attributes(cls, settings, product_frames) -> int:
+        """Anima sin keyframes escribiendo propiedades por objeto (coste O(n)).
+
+        Si productos, tareas y perfiles no cambiaron desde la última vez, solo se
+        reescribe el rango de fechas de la escena. Devuelve los productos escritos.
+        """
+        animation_props = cls.get_animation_props()
+        stack_groups = [layer.group_name for layer in cls.get_animation_profile_layers(animation_props)] or ["DEFAULT"]
+        print(f"🎬 INICIANDO ANIMACIÓN POR ATRIBUTOS: stack de perfiles {' > '.join(stack_groups)}")
+
+        frame_table = _seq_frames.ProductFrameTable.from_mapping(
+            product_frames, int(settings["start_frame"]), int(settings["start_frame"] + settings["total_frames"])
+        )
+        ifc_file = tool.Ifc.get()
+        task_profiles = cls.resolve_task_profiles(frame_table, animation_props)
+
+        # Tabla de perfiles únicos (se guarda una vez en la escena)
+        profiles, profile_lookup, task_profile_index = [], {}, {}
+        for task_id, profile in task_profiles.items():
+            signature = cls.get_profile_signature(profile)
+            if signature not in profile_lookup:
+                profile_lookup[signature] = len(profiles)
+                profiles.append(_seq_frames.profile_to_attributes(profile))
+            task_profile_index[task_id] = profile_lookup[signature]
+
+        task_ids = list(frame_table.tasks)
+        task_starts = _seq_frames.to_epoch_seconds([frame_table.tasks[t][1] for t in task_ids]).astype(np.float64)
+        task_finishes = _seq_frames.to_epoch_seconds([frame_table.tasks[t][2] for t in task_ids]).astype(np.float64)
+        task_position = {task_id: i for i, task_id in enumerate(task_ids)}
+
+        signature = hash(
+            (
+                frame_table.product_id.tobytes(),
+                frame_table.task_id.tobytes(),
+                frame_table.relationship.tobytes(),
+                frame_table.full_range.tobytes(),
+                task_starts.tobytes(),
+                task_finishes.tobytes(),
+                json.dumps(profiles, sort_keys=True),
+                tuple(task_profile_index[t] for t in task_ids),
+            )
+        )
+
+        cls.set_attribute_animation_range(settings)
+        state = cls.attribute_animation_state
+        if state and state["ifc_file"] is ifc_file and state["signature"] == signature:
+            print("♻️ Sin cambios en productos ni perfiles: solo se actualiza el rango de fechas")
+            cls.register_attribute_animation_handler()
+            return 0
+
+        bpy.context.scene["BIM4D_profiles"] = json.dumps(profiles)
+
+        # Columnas por fila: inicio, fin, relación, rango completo, perfil
+        positions = np.array([task_position[t] for t in frame_table.task_id.tolist()], dtype=np.int64)
+        row_values = np.column_stack(
+            [
+                task_starts[positions] if len(positions) else np.empty(0),
+                task_finishes[positions] if len(positions) else np.empty(0),
+                frame_table.relationship.astype(np.float64),
+                frame_table.full_range.astype(np.float64),
+                np.array([task_profile_index[t] for t in frame_table.task_id.tolist()], dtype=np.float64),
+            ]
+        )
+
+        written = 0
         for obj in bpy.data.objects:
             element = tool.Ifc.get_entity(obj)
             if not element:
                 continue
+            if obj.animation_data:
+                obj.animation_data_clear()
 
             if element.is_a("IfcSpace"):
                 cls.hide_object(obj)
                 continue
 
-            original_color = original_colors.get(obj.name, [1.0, 1.0, 1.0, 1.0])
-
-            if element.id() not in product_frames:
-                # Ocultar objetos que están fuera del rango de visualización
+            rows = frame_table.rows(element.id())
+            if not rows:
+                if "BIM4D_rows" in obj:
+                    del obj["BIM4D_rows"]
                 obj.hide_viewport = True
                 obj.hide_render = True
                 continue
 
-            for frame_data in product_frames[element.id()]:
-                task = frame_data.get("task") or tool.Ifc.get().by_id(frame_data.get("task_id"))
-                profile = cls.get_assigned_profile_for_task(task, animation_props, active_group_name)
-                if not profile:
-                    predefined_type = getattr(task, "PredefinedType", None) or "NOTDEFINED"
-                    profile = cls.load_profile_from_group(active_group_name, predefined_type) or cls.create_generic_profile(predefined_type)
-                cls.apply_profile_animation(obj, frame_data, profile, original_color, settings)
+            if "BIM4D_color" not in obj:
+                obj["BIM4D_color"] = list(obj.color) if obj.type == 'MESH' else [1.0, 1.0, 1.0, 1.0]
+            obj["BIM4D_rows"] = row_values[rows.start : rows.stop].ravel().tolist()
+            written += 1
+
+        cls.attribute_animation_state = {"ifc_file": ifc_file, "signature": signature}
+        cls.last_animation_state = None
+        cls._attribute_cache = None
+        cls.register_attribute_animation_handler()
 
         area = tool.Blender.get_view3d_area()
         try:
@@ -3012,27 +3647,122 @@ class Sequence(bonsai.core.tool.Sequence):
             pass
         bpy.context.scene.frame_start = settings["start_frame"]
         bpy.context.scene.frame_end = int(settings["start_frame"] + settings["total_frames"] + 1)
+        return written
+
+    @classmethod
+    def load_attribute_appearance(cls, scene):
+        """Lee las propiedades de los objetos y construye el evaluador vectorizado."""
+        profiles = json.loads(scene.get("BIM4D_profiles", "[]") or "[]")
+        objects, colors, owners, values = [], [], [], []
+        for obj in bpy.data.objects:
+            data = obj.get("BIM4D_rows")
+            if data is None:
+                continue
+            rows = np.asarray(data, dtype=np.float64).reshape(-1, 5)
+            owners.append(np.full(len(rows), len(objects), dtype=np.int64))
+            values.append(rows)
+            objects.append(obj)
+            colors.append(list(obj.get("BIM4D_color", (1.0, 1.0, 1.0, 1.0))))
+        values = np.concatenate(values) if values else np.empty((0, 5))
+        appearance = _seq_frames.AttributeAppearance(
+            np.concatenate(owners) if owners else np.empty(0, dtype=np.int64),
+            values[:, 0],
+            values[:, 1],
+            values[:, 2].astype(np.int8),
+            values[:, 3].astype(bool),
+            values[:, 4].astype(np.int64),
+            profiles,
+            colors or np.empty((0, 4)),
+        )
+        return objects, appearance, None
+
+    @classmethod
+    def update_attribute_animation(cls, scene, depsgraph=None) -> None:
+        """Aplica la apariencia del frame actual; solo toca los objetos que cambian."""
+        try:
+            range_data = json.loads(scene.get("BIM4D_range", "null") or "null")
+            if not range_data:
+                return
+            if cls._attribute_cache is None:
+                cls._attribute_cache = cls.load_attribute_appearance(scene)
+            objects, appearance, last = cls._attribute_cache
+
+            total_frames = range_data["total_frames"] or 1
+            progress = (scene.frame_current - range_data["start_frame"]) / total_frames
+            t = range_data["start"] + (range_data["finish"] - range_data["start"]) * progress
+            hidden, colors = appearance.evaluate(t)
+
+            if last is None:
+                changed = np.arange(len(objects))
+            else:
+                changed = np.flatnonzero((hidden != last[0]) | np.any(colors != last[1], axis=1))
+            for i in changed.tolist():
+                obj = objects[i]
+                obj.hide_viewport = obj.hide_render = bool(hidden[i])
+                obj.color = colors[i].tolist()
+            cls._attribute_cache = (objects, appearance, (hidden, colors))
+        except ReferenceError:
+            # Objetos eliminados (undo, recarga): reconstruir en el próximo frame
+            cls._attribute_cache = None
+        except Exception as e:
+            print(f"⚠️ Error en la animación por atributos: {e}")
+
+    @classmethod
+    def register_attribute_animation_handler(cls) -> None:
+        cls._unregister_attribute_animation_handler()
+        bpy.app.handlers.frame_change_pre.append(bim4d_attribute_animation)
+        cls._attribute_frame_handler = bim4d_attribute_animation
+        cls.update_attribute_animation(bpy.context.scene)
+
+    @classmethod
+    def _unregister_attribute_animation_handler(cls) -> None:
+        try:
+            while bim4d_attribute_animation in bpy.app.handlers.frame_change_pre:
+                bpy.app.handlers.frame_change_pre.remove(bim4d_attribute_animation)
+        except Exception:
+            pass
+        cls._attribute_frame_handler = None
+
+    @classmethod
+    def register_attribute_animation_load_handler(cls) -> None:
+        if bim4d_attribute_animation_load_post not in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.append(bim4d_attribute_animation_load_post)
+
+    @classmethod
+    def unregister_attribute_animation_handlers(cls) -> None:
+        """Quita el handler de load_post y el de frame_change_pre (al desregistrar el add-on)."""
+        while bim4d_attribute_animation_load_post in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.remove(bim4d_attribute_animation_load_post)
+        cls._unregister_attribute_animation_handler()
+
+    @classmethod
+    def reload_attribute_animation_handler(cls, scene) -> None:
+        """Tras abrir un .blend: el caché apunta a objetos del archivo anterior."""
+        cls.attribute_animation_state = None
+        cls._attribute_cache = None
+        if scene is not None and scene.get("BIM4D_range"):
+            cls.register_attribute_animation_handler()
+        else:
+            cls._unregister_attribute_animation_handler()
+
+    @classmethod
+    def clear_attribute_animation(cls) -> None:
+        """Elimina el handler y las propiedades del modo por atributos."""
+        cls._unregister_attribute_animation_handler()
+        cls.attribute_animation_state = None
+        cls._attribute_cache = None
+        scene = bpy.context.scene
+        for key in ("BIM4D_range", "BIM4D_profiles"):
+            if key in scene:
+                del scene[key]
+        for obj in bpy.data.objects:
+            for key in ("BIM4D_rows", "BIM4D_color"):
+                if key in obj:
+                    del obj[key]
 
     @classmethod
     def create_generic_profile(cls, predefined_type):
-        return type('AppearanceProfile', (object,), {
-            'name': predefined_type,
-            'consider_start': True,
-            'consider_active': True,
-            'consider_end': True,
-            'start_color': [1, 1, 1, 0],
-            'in_progress_color': [1, 0.5, 0, 1],
-            'end_color': [0.8, 0.8, 0.8, 1],
-            'use_start_original_color': False,
-            'use_active_original_color': False,
-            'use_end_original_color': True,
-            'start_transparency': 0.0,
-            'active_start_transparency': 0.0,
-            'active_finish_transparency': 0.0,
-            'active_transparency_interpol': 1.0,
-            'end_transparency': 0.0,
-            'hide_at_end': (predefined_type in {"DEMOLITION","REMOVAL","DISPOSAL","DISMANTLE"}),
-        })()
+        return _seq_data.ProfileStore.get_generic_profile(predefined_type)
     @classmethod
     def debug_profile_application(cls, obj, profile, frame_data):
         """Debug helper para verificar aplicación de perfiles"""
@@ -3049,15 +3779,33 @@ class Sequence(bonsai.core.tool.Sequence):
     # === 2. FUNCIÓN CORREGIDA (APLICACIÓN DE PERFIL) ==================
     # ==================================================================
     @classmethod
-    def apply_profile_animation(cls, obj, frame_data, profile, original_color, settings):
+    def new_keyframe_batch(cls) -> _seq_frames.KeyframeBatch:
+        """Lote de keyframes con la interpolación por defecto de las preferencias de Blender."""
+        try:
+            interpolation = bpy.context.preferences.edit.keyframe_new_interpolation_type
+        except Exception:
+            interpolation = "BEZIER"
+        return _seq_frames.KeyframeBatch(interpolation)
+
+    @classmethod
+    def apply_profile_animation(cls, obj, frame_data, profile, original_color, settings, batch=None):
         """
         Aplica la animación a un objeto basándose en su perfil de apariencia,
         con la lógica corregida para todos los casos de uso.
+
+        Si se pasa ``batch`` (KeyframeBatch) las claves solo se acumulan y el
+        llamador las escribe; si no, se escriben al terminar.
         """
+        own_batch = batch is None
+        if own_batch:
+            batch = cls.new_keyframe_batch()
+
         if frame_data.get("consider_start_active", False):
             print(f"🔒 {obj.name}: Aplicando perfil de rango completo (Start prioritario).")
             start_f, end_f = frame_data["states"]["active"]
-            cls.apply_state_appearance(obj, profile, "start", start_f, end_f, original_color, frame_data)
+            cls.apply_state_appearance(obj, profile, "start", start_f, end_f, original_color, frame_data, batch)
+            if own_batch:
+                batch.apply(obj)
             return
 
         # Lógica secuencial normal
@@ -3082,87 +3830,76 @@ class Sequence(bonsai.core.tool.Sequence):
                     # Si 'Start' NO se considera y es un objeto de construcción ('output'),
                     # debe estar OCULTO hasta que empiece su fase 'Active'.
                     if frame_data.get("relationship") == "output":
-                        obj.hide_viewport = True
-                        obj.hide_render = True
-                        obj.keyframe_insert(data_path="hide_viewport", frame=start_f)
-                        obj.keyframe_insert(data_path="hide_render", frame=start_f)
+                        batch.add_visibility(start_f, True)
                         if end_f > start_f:
-                            obj.keyframe_insert(data_path="hide_viewport", frame=end_f)
-                            obj.keyframe_insert(data_path="hide_render", frame=end_f)
+                            batch.add_visibility(end_f, True)
                     # Para inputs (demolición), no hacer nada los mantiene visibles, que es lo correcto.
                     continue  # Pasar al siguiente estado.
                 # Si 'Start' SÍ se considera, aplicar su apariencia.
-                cls.apply_state_appearance(obj, profile, "start", start_f, end_f, original_color, frame_data)
+                cls.apply_state_appearance(obj, profile, "start", start_f, end_f, original_color, frame_data, batch)
 
             elif state == "in_progress":
                 if not is_active_considered:
                     continue
-                cls.apply_state_appearance(obj, profile, "in_progress", start_f, end_f, original_color, frame_data)
+                cls.apply_state_appearance(obj, profile, "in_progress", start_f, end_f, original_color, frame_data, batch)
 
             elif state == "end":
                 if not is_end_considered:
                     continue
-                cls.apply_state_appearance(obj, profile, "end", start_f, end_f, original_color, frame_data)
+                cls.apply_state_appearance(obj, profile, "end", start_f, end_f, original_color, frame_data, batch)
+
+        if own_batch:
+            batch.apply(obj)
+
     @classmethod
-    def apply_state_appearance(cls, obj, profile, state, start_frame, end_frame, original_color, frame_data=None):
+    def apply_state_appearance(cls, obj, profile, state, start_frame, end_frame, original_color, frame_data=None, batch=None):
         """CORRECCIÓN: Mejorar manejo del estado start para elementos persistentes"""
+        own_batch = batch is None
+        if own_batch:
+            batch = cls.new_keyframe_batch()
+
         if state == "start":
             # CORRECCIÓN: Cuando consider_start=True, el objeto debe ser siempre visible
-            obj.hide_viewport = False
-            obj.hide_render = False
-            obj.keyframe_insert(data_path="hide_viewport", frame=start_frame)
-            obj.keyframe_insert(data_path="hide_render", frame=start_frame)
+            batch.add_visibility(start_frame, False)
 
             # Si hay end_frame diferente, asegurar visibilidad durante todo el rango
             if end_frame > start_frame:
-                obj.keyframe_insert(data_path="hide_viewport", frame=end_frame)
-                obj.keyframe_insert(data_path="hide_render", frame=end_frame)
+                batch.add_visibility(end_frame, False)
 
             use_original = getattr(profile, 'use_start_original_color', False)
             color = original_color if use_original else list(profile.start_color[:])
-            transparency = getattr(profile, 'start_transparency', 0.0)
-
-            alpha = 1.0 - transparency
-            obj.color = (color[0], color[1], color[2], alpha)
-            obj.keyframe_insert(data_path="color", frame=start_frame)
+            alpha = getattr(profile, 'start_alpha', None)
+            if alpha is None:
+                alpha = 1.0 - getattr(profile, 'start_transparency', 0.0)
+            batch.add_vector("color", start_frame, (color[0], color[1], color[2], alpha))
 
             # Mantener color durante todo el rango si es necesario
             if end_frame > start_frame:
-                obj.keyframe_insert(data_path="color", frame=end_frame)
+                batch.add_vector("color", end_frame, (color[0], color[1], color[2], alpha))
 
             print(f"✅ Aplicado estado start a {obj.name} desde frame {start_frame} hasta {end_frame}")
 
         elif state == "in_progress":
-            obj.hide_viewport = False
-            obj.hide_render = False
-            obj.keyframe_insert(data_path="hide_viewport", frame=start_frame)
-            obj.keyframe_insert(data_path="hide_render", frame=start_frame)
+            batch.add_visibility(start_frame, False)
 
             use_original = getattr(profile, 'use_active_original_color', False)
             color = original_color if use_original else list(profile.in_progress_color[:])
 
-            start_transparency = getattr(profile, 'active_start_transparency', 0.0)
-            end_transparency = getattr(profile, 'active_finish_transparency', 0.0)
             interpol_mode = getattr(profile, 'active_transparency_interpol', 1.0)
-
-            alpha_start = 1.0 - start_transparency
-            obj.color = (color[0], color[1], color[2], alpha_start)
-            obj.keyframe_insert(data_path="color", frame=start_frame)
+            alpha_start = getattr(profile, 'active_start_alpha', None)
+            if alpha_start is None:
+                alpha_start = 1.0 - getattr(profile, 'active_start_transparency', 0.0)
+            batch.add_vector("color", start_frame, (color[0], color[1], color[2], alpha_start))
 
             if end_frame > start_frame:
-                alpha_end = 1.0 - end_transparency
-                obj.color = (color[0], color[1], color[2], alpha_end)
-                obj.keyframe_insert(data_path="color", frame=end_frame)
-
-                if obj.animation_data and obj.animation_data.action:
-                    for fcurve in obj.animation_data.action.fcurves:
-                        if fcurve.data_path == "color" and fcurve.array_index == 3:
-                            for kf in fcurve.keyframe_points:
-                                if int(kf.co[0]) in [start_frame, end_frame]:
-                                    if interpol_mode < 0.5:
-                                        kf.interpolation = 'CONSTANT'
-                                    else:
-                                        kf.interpolation = 'LINEAR'
+                alpha_end = getattr(profile, 'active_finish_alpha', None)
+                if alpha_end is None:
+                    alpha_end = 1.0 - getattr(profile, 'active_finish_transparency', 0.0)
+                batch.add_vector("color", end_frame, (color[0], color[1], color[2], alpha_end))
+                # Interpolación del canal alfa según el perfil
+                batch.set_interpolation(
+                    "color", 3, (start_frame, end_frame), "CONSTANT" if interpol_mode < 0.5 else "LINEAR"
+                )
 
         elif state == "end":
             # <-- INICIO DE LA MODIFICACIÓN -->
@@ -3172,30 +3909,24 @@ class Sequence(bonsai.core.tool.Sequence):
             if should_hide:
                 # Si el perfil lo indica, ocultar el objeto.
                 # Ideal para demoliciones donde el elemento debe desaparecer.
-                obj.hide_viewport = True
-                obj.hide_render = True
-                obj.keyframe_insert(data_path="hide_viewport", frame=start_frame)
-                obj.keyframe_insert(data_path="hide_render", frame=start_frame)
+                batch.add_visibility(start_frame, True)
                 print(f"✅ Objeto {obj.name} ocultado en el frame {start_frame} según el perfil.")
             else:
                 # Lógica anterior: mostrar el objeto con su apariencia de fin.
                 # Útil para construcción o elementos que permanecen visibles.
-                obj.hide_viewport = False
-                obj.hide_render = False
-                obj.keyframe_insert(data_path="hide_viewport", frame=start_frame)
-                obj.keyframe_insert(data_path="hide_render", frame=start_frame)
+                batch.add_visibility(start_frame, False)
 
                 use_original = getattr(profile, 'use_end_original_color', True)
                 color = original_color if use_original else list(profile.end_color[:])
-                transparency = getattr(profile, 'end_transparency', 0.0)
-
-                alpha = 1.0 - transparency
-                final_color = (color[0], color[1], color[2], alpha)
-
-                obj.color = final_color
-                obj.keyframe_insert(data_path="color", frame=start_frame)
+                alpha = getattr(profile, 'end_alpha', None)
+                if alpha is None:
+                    alpha = 1.0 - getattr(profile, 'end_transparency', 0.0)
+                batch.add_vector("color", start_frame, (color[0], color[1], color[2], alpha))
             # <-- FIN DE LA MODIFICACIÓN -->
 
+        if own_batch:
+            batch.apply(obj)
+
     @classmethod
     def get_product_frames_with_profiles(cls, work_schedule, settings):
             """Versión mejorada con soporte de perfiles y 'states' compatibles.
@@ -3212,7 +3943,7 @@ class Sequence(bonsai.core.tool.Sequence):
             # Preferimos la ruta 'enhanced' existente para mantener compatibilidad
             try:
                 frames = cls.get_animation_product_frames_enhanced(work_schedule, settings)
-                if isinstance(frames, dict):
+                if isinstance(frames, (dict, _seq_frames.ProductFrameTable)):
                     return frames
             except Exception:
                 pass
@@ -3247,15 +3978,17 @@ class Sequence(bonsai.core.tool.Sequence):
             return product_frames
 
     @classmethod
-    def _process_task_with_profiles(cls, task, settings, product_frames, anim_props, profile_cache):
+    def _process_task_with_profiles(cls, task, settings, product_frames, anim_props, profile_cache, resolver=None):
             """Procesa recursivamente una tarea, agregando frames con estados.
             Mantiene compatibilidad con la estructura 'enhanced'."""
+            # Un único resolver para toda la recursión
+            if resolver is None:
+                resolver = _seq_data.TaskProfileResolver.for_animation(anim_props)
             for subtask in ifcopenshell.util.sequence.get_nested_tasks(task):
-                cls._process_task_with_profiles(subtask, settings, product_frames, anim_props, profile_cache)
+                cls._process_task_with_profiles(subtask, settings, product_frames, anim_props, profile_cache, resolver)
 
             # Fechas
-            start = ifcopenshell.util.sequence.derive_date(task, "ScheduleStart", is_earliest=True)
-            finish = ifcopenshell.util.sequence.derive_date(task, "ScheduleFinish", is_latest=True)
+            start, finish = _seq_data.DerivedDateIndex.get(task)
             if not start or not finish:
                 return
 
@@ -3266,7 +3999,7 @@ class Sequence(bonsai.core.tool.Sequence):
             # Cache de perfil (aunque el perfil puede resolverse en apply)
             task_id = task.id()
             if task_id not in profile_cache:
-                profile_cache[task_id] = cls._get_best_profile_for_task(task, anim_props)
+                profile_cache[task_id] = cls._get_best_profile_for_task(task, anim_props, resolver)
 
             def _add(pid, relationship):
                 product_frames.setdefault(pid, []).append({
@@ -3287,25 +4020,23 @@ class Sequence(bonsai.core.tool.Sequence):
                     },
                 })
 
-            for output in ifcopenshell.util.sequence.get_task_outputs(task):
-                _add(output.id(), "output")
+            for output_id in _seq_data.ScheduleGraphIndex.task_products("task_outputs", task.id()):
+                _add(output_id, "output")
             for input_prod in cls.get_task_inputs(task):
                 _add(input_prod.id(), "input")
 
 
     @classmethod
-    def _get_best_profile_for_task(cls, task, anim_props):
-            """Determina el perfil más apropiado para una tarea considerando la pila de grupos y elección por tarea."""
+    def _get_best_profile_for_task(cls, task, anim_props, resolver=None):
+            """Determina el perfil más apropiado para una tarea considerando la pila de grupos y elección por tarea.
+
+            ``resolver`` permite reutilizar el ``TaskProfileResolver`` de la ejecución en curso.
+            """
             try:
-                # Determinar el grupo activo (primer grupo habilitado en el stack) o DEFAULT
-                agn = None
-                for it in getattr(anim_props, 'animation_group_stack', []):
-                    if getattr(it, 'enabled', False) and getattr(it, 'group', None):
-                        agn = it.group
-                        break
-                if not agn:
-                    agn = 'DEFAULT'
-                profile = cls.get_assigned_profile_for_task(task, anim_props, agn)
+                # Perfil compuesto por las capas habilitadas del stack (o DEFAULT)
+                if resolver is None:
+                    resolver = _seq_data.TaskProfileResolver.for_animation(anim_props)
+                profile = resolver.get(task)
                 if profile:
                     return profile
             except Exception:
@@ -3686,6 +4417,11 @@ class Sequence(bonsai.core.tool.Sequence):
         # 1. Desregistrar handlers de actualización por frame para evitar errores
         cls._unregister_frame_change_handler()
 
+        # Sin animación previa: la siguiente actualización no puede ser incremental
+        if include_blender_objects:
+            cls.last_animation_state = None
+            cls.clear_attribute_animation()
+
         # 2. Limpiar textos del cronograma
         if clear_texts:
             coll = bpy.data.collections.get("Schedule_Display_Texts")
@@ -4078,6 +4814,16 @@ class Sequence(bonsai.core.tool.Sequence):
 
 
 
+@persistent
+def bim4d_attribute_animation(scene, depsgraph=None):
+    tool.Sequence.update_attribute_animation(scene, depsgraph)
+
+
+@persistent
+def bim4d_attribute_animation_load_post(*args):
+    tool.Sequence.reload_attribute_animation_handler(bpy.context.scene)
+
+
 class SearchCustomProfileGroup(bpy.types.Operator):
     bl_idname = "bim.search_custom_profile_group"
     bl_label = "Search Custom Profile Group"
@@ -35,6 +35,8 @@ from bonsai.bim.module.sequence.data import (
     SequenceData,
     TaskICOMData,
     AnimationColorSchemeData,
+    TaskTreeWindow,
+    TaskSearchIndex,
 )
 from bonsai.bim.module.sequence.prop import UnifiedProfileManager, monitor_predefined_type_change
 from typing import Any, Optional, TYPE_CHECKING
@@ -444,6 +446,7 @@ class BIM_PT_work_schedules(Panel):
         row.operator("bim.contract_all_tasks", text="Contract All")
         row = self.layout.row(align=True)
         self.draw_task_operators()
+        self.draw_task_search_ui()
         BIM_UL_tasks.draw_header(self.layout)
         self.layout.template_list(
             "BIM_UL_tasks",
@@ -453,6 +456,13 @@ class BIM_PT_work_schedules(Panel):
             self.props,
             "active_task_index",
         )
+        # Árbol virtualizado: solo una ventana de filas existe como elementos de la lista
+        window = TaskTreeWindow
+        if window.total() > window.size:
+            rows = window.window()
+            row = self.layout.row(align=True)
+            row.label(text=f"Rows {rows.start + 1}-{rows.stop} of {window.total()}")
+            row.prop(self.props, "task_window_start", text="")
 
         if self.props.active_task_id and self.props.editing_task_type == "ATTRIBUTES":
             self.draw_editable_task_attributes_ui()
@@ -463,6 +473,29 @@ class BIM_PT_work_schedules(Panel):
         elif self.props.active_task_time_id and self.props.editing_task_type == "TASKTIME":
             self.draw_editable_task_time_attributes_ui()
 
+    def draw_task_search_ui(self) -> None:
+        row = self.layout.row(align=True)
+        row.prop(self.props, "task_search", text="", icon="VIEWZOOM")
+        if not self.props.task_search:
+            return
+        # Búsqueda en vivo sobre el índice de trigramas; el árbol solo se recarga al saltar
+        results = TaskSearchIndex.search(
+            self.props.task_search, limit=10, work_schedule_id=self.props.active_work_schedule_id
+        )
+        if not results:
+            self.layout.label(text="No matching tasks in this schedule", icon="INFO")
+            return
+        tasks = SequenceData.data["tasks"]
+        box = self.layout.box()
+        for task_id, _ in results:
+            task = tasks.get(task_id)
+            if not task:
+                continue
+            row = box.row(align=True)
+            row.label(text=task["Identification"] or "XXX")
+            row.label(text=task["Name"] or "Unnamed")
+            row.operator("bim.go_to_task", text="", icon="RESTRICT_SELECT_OFF").task = task_id
+
     def draw_editable_task_sequence_ui(self):
         task = SequenceData.data["tasks"][self.props.highlighted_task_id]
         row = self.layout.row()
@@ -595,6 +628,7 @@ class BIM_PT_work_schedules(Panel):
 
                 # Mostrar información de tareas seleccionadas
                 selected_count = len([task for task in self.tprops.tasks if getattr(task, 'is_selected', False)])
+                selected_count += len(TaskTreeWindow.checked_task_ids())
 
                 # Siempre mostrar la sección si hay grupos disponibles
                 if all_groups:
@@ -739,6 +773,11 @@ class BIM_UL_animation_group_stack(UIList):
         row = layout.row(align=True)
         row.prop(item, "enabled", text="")
         row.label(text=item.group)
+        sub = row.row(align=True)
+        sub.active = item.enabled
+        sub.prop(item, "use_color", text="", icon="COLOR")
+        sub.prop(item, "use_alpha", text="", icon="IMAGE_ALPHA")
+        sub.prop(item, "use_visibility", text="", icon="HIDE_OFF")
 
     def invoke(self, context, event):
         pass
@@ -943,6 +982,8 @@ class BIM_PT_animation_tools(Panel):
         main_actions_box = self.layout.box()
         main_actions_box.label(text="Animation Actions:", icon="OUTLINER_OB_CAMERA")
 
+        main_actions_box.prop(self.animation_props, "appearance_mode", text="Mode")
+
         # Botón principal
         main_row = main_actions_box.row()
         op = main_row.operator(
@@ -1021,6 +1062,8 @@ class BIM_PT_animation_tools(Panel):
             op.work_schedule = self.props.active_work_schedule_id
         except Exception:
             pass
+        main_row.operator("bim.scrub_snapshot_date", text="Scrub Date", icon="TIME")
+        actions_box.row().operator("bim.export_snapshot_series", text="Export Series", icon="RENDER_ANIMATION")
 
         # Botón Reset (replicando la posición de Animation Settings)
         reset_row = actions_box.row()
@@ -1418,7 +1461,7 @@ class BIM_UL_task_columns(UIList):
         if item:
             row = layout.row(align=True)
             row.prop(item, "name", emboss=False, text="")
-            if props.sort_column == item.name:
+            if item.name in props.sort_column.split(","):
                 row.label(text="", icon="SORTALPHA")
             row.operator("bim.remove_task_column", text="", icon="X").name = item.name
 